@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+DOM候補収集のベンチマーク: 旧方式（html.parser + soup.select 19回）と
+単一走査コレクター（lxml）の結果一致と処理時間を比較する。
+
+    python benchmarks/bench_dom_collector.py [--repeat N]
+"""
+import argparse
+import gzip
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from main import clean_image_url, is_valid_product_image  # noqa: E402
+from src.page_parser import collect_page_candidates  # noqa: E402
+
+CORPUS_DIR = Path(__file__).parent / 'corpus'
+
+LEGACY_TITLE_SELECTORS = [
+    'h1.d-title', '.d-title', 'h1', '.product-title', '.offer-title', '[class*="title"]'
+]
+LEGACY_IMG_SELECTORS = [
+    'img[src*="cbu01.alicdn.com"]', 'img[src*="sc04.alicdn.com"]', 'img[src*="img.alicdn.com"]',
+    'img[data-src*="alicdn.com"]', 'img[data-original*="alicdn.com"]',
+    '.d-pic img', '.main-image img', '.product-image img', '.thumb-pic img', '.detail-gallery img',
+    'img[src*=".jpg"]', 'img[src*=".png"]', 'img[src*=".webp"]'
+]
+
+
+def legacy_collect(html):
+    """旧 extract_1688_images のDOM処理をそのまま再現"""
+    soup = BeautifulSoup(html, 'html.parser')
+    title = None
+    for selector in LEGACY_TITLE_SELECTORS:
+        elem = soup.select_one(selector)
+        if elem and elem.get_text(strip=True):
+            title = elem.get_text(strip=True)
+            break
+    image_urls = []
+    for selector in LEGACY_IMG_SELECTORS:
+        for img in soup.select(selector):
+            src = img.get('src') or img.get('data-src') or img.get('data-original')
+            if src and is_valid_product_image(src):
+                image_urls.append(clean_image_url(src))
+    scripts = [script.string for script in soup.find_all('script') if script.string]
+    return title, list(dict.fromkeys(image_urls)), scripts
+
+
+def collector_collect(html):
+    candidates = collect_page_candidates(html)
+    image_urls = [clean_image_url(src) for src in candidates.image_sources if is_valid_product_image(src)]
+    return candidates.title, list(dict.fromkeys(image_urls)), candidates.scripts
+
+
+def timed(func, html, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(html)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    mismatches = 0
+    print(f"{'page':<22}{'bytes':>11}{'legacy ms':>12}{'single ms':>12}{'speedup':>9}  result")
+    for path in sorted(CORPUS_DIR.glob('*.html.gz')):
+        html = gzip.decompress(path.read_bytes())
+        legacy = legacy_collect(html.decode('utf-8'))
+        current = collector_collect(html)
+        same = legacy == current
+        mismatches += 0 if same else 1
+        legacy_time = timed(lambda h: legacy_collect(h.decode('utf-8')), html, args.repeat)
+        current_time = timed(collector_collect, html, args.repeat)
+        print(f"{path.name:<22}{len(html):>11,}{legacy_time * 1000:>12.1f}{current_time * 1000:>12.1f}"
+              f"{legacy_time / current_time:>8.1f}x  {'same' if same else 'DIFFERENT'}")
+        if not same:
+            for label, a, b in zip(('title', 'images', 'scripts'), legacy, current):
+                if a != b:
+                    print(f"    {label}: legacy={str(a)[:200]}\n    {' ' * len(label)}  single={str(b)[:200]}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
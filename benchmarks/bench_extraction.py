@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+抽出パイプラインのベンチマークスイート
+
+保存済みコーパス（benchmarks/corpus/*.html.gz）に対して、extract_1688_images の
+解析側（src.offer_result.extract_from_content）とURL正規化をオフラインで実行し、
+ページごとの処理速度・段階別時間・ピークメモリを測る。結果は baseline.json と
+比較し、抽出結果の変化または許容倍率を超える劣化があれば終了コード 1 を返す。
+
+    python benchmarks/bench_extraction.py [--repeat N] [--tolerance X]
+    python benchmarks/bench_extraction.py --save-baseline
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src.metrics import EXTRACT_STAGES, extract_stage_seconds  # noqa: E402
+from src.offer_result import extract_from_content  # noqa: E402
+from src.page_parser import collect_page_candidates  # noqa: E402
+from src.script_scanner import script_scanner  # noqa: E402
+from src.url_rules import clear_memo, normalize_image_url  # noqa: E402
+
+CORPUS_DIR = Path(__file__).parent / 'corpus'
+BASELINE_PATH = Path(__file__).parent / 'baseline.json'
+BENCH_URL = 'https://detail.1688.com/offer/000000000.html'
+
+DEFAULT_TOLERANCE = 1.5         # 時間がこの倍率を超えたら劣化
+DEFAULT_MEMORY_TOLERANCE = 1.5  # ピークメモリがこの倍率を超えたら劣化
+
+
+def load_corpus():
+    """(ページ名, 本文バイト列) のリスト"""
+    return [(path.name[:-len('.html.gz')], gzip.decompress(path.read_bytes()))
+            for path in sorted(CORPUS_DIR.glob('*.html.gz'))]
+
+
+def fingerprint(result):
+    """抽出結果の要約（速度に関係なく一致しなければならない部分）"""
+    urls = '\n'.join(image['url'] for image in result['images'])
+    return {
+        'title': result['title'],
+        'total_found': result['total_found'],
+        'extraction_method': result['extraction_method'],
+        'images_sha1': hashlib.sha1(urls.encode('utf-8')).hexdigest()
+    }
+
+
+def stage_totals():
+    totals = extract_stage_seconds.totals()
+    return {stage: totals.get((stage,), (0.0, 0))[0] for stage in EXTRACT_STAGES}
+
+
+def bench_page(content, repeat):
+    """1ページの最良時間・段階別の平均時間・ピークメモリ・抽出結果"""
+    result = extract_from_content(BENCH_URL, content)  # ウォームアップ
+
+    best = float('inf')
+    before = stage_totals()
+    for _ in range(repeat):
+        clear_memo()  # 初見ページと同じ条件にする
+        started = time.perf_counter()
+        extract_from_content(BENCH_URL, content)
+        best = min(best, time.perf_counter() - started)
+    after = stage_totals()
+
+    clear_memo()
+    tracemalloc.start()
+    extract_from_content(BENCH_URL, content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'bytes': len(content),
+        'seconds': best,
+        'pages_per_sec': 1 / best,
+        'stages': {stage: (after[stage] - before[stage]) / repeat for stage in EXTRACT_STAGES},
+        'peak_memory': peak,
+        'result': fingerprint(result)
+    }
+
+
+def bench_url_rules(corpus, repeat):
+    """コーパス全体の候補URLに対する正規化コスト（メモなし・メモあり、1URLあたりマイクロ秒）"""
+    urls = []
+    for _, content in corpus:
+        urls.extend(collect_page_candidates(content, collect_scripts=False).image_sources)
+        urls.extend(script_scanner.scan_html(content))
+
+    def per_url(clear):
+        best = float('inf')
+        for _ in range(repeat):
+            if clear:
+                clear_memo()
+            started = time.perf_counter()
+            for url in urls:
+                normalize_image_url(url)
+            best = min(best, time.perf_counter() - started)
+        return best / len(urls) * 1e6
+
+    return {'urls': len(urls), 'cold_us': per_url(True), 'memo_us': per_url(False)}
+
+
+def run_suite(repeat=5):
+    corpus = load_corpus()
+    pages = {name: bench_page(content, repeat) for name, content in corpus}
+    total_seconds = sum(page['seconds'] for page in pages.values())
+    return {
+        'pages': pages,
+        'pages_per_sec': len(pages) / total_seconds,
+        'url_rules': bench_url_rules(corpus, repeat)
+    }
+
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE, memory_tolerance=DEFAULT_MEMORY_TOLERANCE):
+    """ベースラインに対する劣化の一覧（空なら合格）"""
+    regressions = []
+    for name, base in baseline['pages'].items():
+        page = current['pages'].get(name)
+        if page is None:
+            regressions.append(f"{name}: missing from corpus")
+            continue
+        if page['result'] != base['result']:
+            regressions.append(f"{name}: extraction result changed {base['result']} -> {page['result']}")
+        if page['seconds'] > base['seconds'] * tolerance:
+            regressions.append(f"{name}: {page['seconds'] * 1e3:.2f} ms > "
+                               f"{base['seconds'] * 1e3:.2f} ms x {tolerance}")
+        if page['peak_memory'] > base['peak_memory'] * memory_tolerance:
+            regressions.append(f"{name}: peak memory {page['peak_memory']:,} B > "
+                               f"{base['peak_memory']:,} B x {memory_tolerance}")
+    for key in ('cold_us', 'memo_us'):
+        if current['url_rules'][key] > baseline['url_rules'][key] * tolerance:
+            regressions.append(f"url_rules {key}: {current['url_rules'][key]:.2f} us > "
+                               f"{baseline['url_rules'][key]:.2f} us x {tolerance}")
+    return regressions
+
+
+def load_baseline(path=BASELINE_PATH):
+    return json.loads(Path(path).read_text(encoding='utf-8'))
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    Path(path).write_text(json.dumps(results, ensure_ascii=False, indent=2, sort_keys=True) + '\n',
+                          encoding='utf-8')
+
+
+def print_report(results):
+    print(f"{'page':<16}{'KB':>8}{'ms':>9}{'pages/s':>9}{'peak KB':>10}  stages (ms)")
+    for name, page in results['pages'].items():
+        stages = ' '.join(f"{stage}={seconds * 1e3:.2f}" for stage, seconds in page['stages'].items() if seconds)
+        print(f"{name:<16}{page['bytes'] / 1024:>8.1f}{page['seconds'] * 1e3:>9.2f}"
+              f"{page['pages_per_sec']:>9.1f}{page['peak_memory'] / 1024:>10.1f}  {stages}")
+    url_rules = results['url_rules']
+    print(f"overall: {results['pages_per_sec']:.1f} pages/s")
+    print(f"url rules: {url_rules['urls']:,} urls, cold {url_rules['cold_us']:.2f} us/url, "
+          f"memo {url_rules['memo_us']:.2f} us/url")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--memory-tolerance', type=float, default=DEFAULT_MEMORY_TOLERANCE)
+    parser.add_argument('--save-baseline', action='store_true', help='現在の結果をベースラインとして保存')
+    args = parser.parse_args()
+
+    results = run_suite(args.repeat)
+    print_report(results)
+
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        print(f"baseline saved: {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(f"no baseline at {args.baseline} (run with --save-baseline)")
+        return 0
+
+    regressions = compare(results, load_baseline(args.baseline), args.tolerance, args.memory_tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
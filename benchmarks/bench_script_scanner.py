@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+<script>スキャンのベンチマーク: 旧方式（スクリプトごとに5本の re.findall）と
+スキャナー（生バイト列の<script>範囲をルールごとに走査）の結果一致・処理時間・ルール別採用数を比較する。
+
+    python benchmarks/bench_script_scanner.py [--repeat N]
+"""
+import argparse
+import gzip
+import re
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from main import clean_image_url, is_valid_product_image  # noqa: E402
+from src.page_parser import collect_page_candidates  # noqa: E402
+from src.script_scanner import script_scanner  # noqa: E402
+
+CORPUS_DIR = Path(__file__).parent / 'corpus'
+
+LEGACY_PATTERNS = [
+    r'imgUrl["\']?\s*:\s*["\']([^"\']+)["\']',
+    r'imageUrl["\']?\s*:\s*["\']([^"\']+)["\']',
+    r'src["\']?\s*:\s*["\']([^"\']+)["\']',
+    r'url["\']?\s*:\s*["\']([^"\']*alicdn\.com[^"\']*)["\']'
+]
+
+
+def accept(candidate):
+    if is_valid_product_image(candidate):
+        return clean_image_url(candidate)
+    return None
+
+
+def legacy_scan(scripts):
+    """旧 extract_1688_images のスクリプト処理をそのまま再現"""
+    image_urls = set()
+    for script in scripts:
+        for match in re.findall(r'"(https?://[^"]*alicdn\.com[^"]*\.(?:jpg|png|webp)[^"]*)"', script):
+            clean_url = accept(match)
+            if clean_url:
+                image_urls.add(clean_url)
+        for pattern in LEGACY_PATTERNS:
+            for match in re.findall(pattern, script, re.IGNORECASE):
+                clean_url = accept(match)
+                if clean_url:
+                    image_urls.add(clean_url)
+    return image_urls
+
+
+def scanner_scan(content, rule_counts=None):
+    image_urls = set()
+    for candidate, rule in script_scanner.scan_html(content).items():
+        clean_url = accept(candidate)
+        if clean_url:
+            image_urls.add(clean_url)
+            if rule_counts is not None:
+                rule_counts[rule] += 1
+    return image_urls
+
+
+def timed(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    mismatches = 0
+    rule_counts = Counter()
+    print(f"{'page':<22}{'scripts':>8}{'legacy ms':>12}{'scanner ms':>12}{'speedup':>9}  result")
+    for path in sorted(CORPUS_DIR.glob('*.html.gz')):
+        content = gzip.decompress(path.read_bytes())
+        scripts = collect_page_candidates(content).scripts
+        legacy = legacy_scan(scripts)
+        current = scanner_scan(content, rule_counts)
+        same = legacy == current
+        mismatches += 0 if same else 1
+        legacy_time = timed(lambda: legacy_scan(scripts), args.repeat)
+        current_time = timed(lambda: scanner_scan(content), args.repeat)
+        print(f"{path.name:<22}{len(scripts):>8}{legacy_time * 1000:>12.1f}{current_time * 1000:>12.1f}"
+              f"{legacy_time / current_time:>8.1f}x  {'same' if same else 'DIFFERENT'}")
+        if not same:
+            print(f"    legacy only: {sorted(legacy - current)[:5]}")
+            print(f"    scanner only: {sorted(current - legacy)[:5]}")
+    print('accepted per rule:', dict(rule_counts))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+URL正規化のマイクロベンチマーク: 旧ヘルパー4関数（都度 re.search/re.sub）と
+ルールエンジン（事前コンパイル・1パス・LRUメモ）の1URLあたりコストを比較し、
+全候補URLで結果が一致することを確認する。
+
+    python benchmarks/bench_url_rules.py [--repeat N]
+"""
+import argparse
+import gzip
+import re
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src.page_parser import collect_page_candidates  # noqa: E402
+from src.script_scanner import script_scanner  # noqa: E402
+from src.url_rules import clear_memo, normalize_image_url  # noqa: E402
+
+CORPUS_DIR = Path(__file__).parent / 'corpus'
+
+
+# --- 旧実装（main.py から移す前のまま）---
+def legacy_is_valid_product_image(url):
+    if not url or not isinstance(url, str):
+        return False
+    if not url.startswith(('http://', 'https://', '//')):
+        return False
+    valid_domains = ['alicdn.com', '1688.com']
+    if not any(domain in url for domain in valid_domains):
+        return False
+    if not re.search(r'\.(jpg|jpeg|png|webp)', url, re.IGNORECASE):
+        return False
+    exclude_patterns = [
+        'favicon', 'logo', 'icon', 'placeholder', 'loading',
+        '1x1', 'pixel', 'transparent', 'blank', 'empty',
+        'avatar', 'head', 'profile', 'watermark'
+    ]
+    url_lower = url.lower()
+    if any(pattern in url_lower for pattern in exclude_patterns):
+        return False
+    size_patterns = re.findall(r'(\d+)x(\d+)', url)
+    for width, height in size_patterns:
+        if int(width) < 50 or int(height) < 50:
+            return False
+    return True
+
+
+def legacy_clean_image_url(url):
+    if not url:
+        return None
+    if url.startswith('//'):
+        url = 'https:' + url
+    url = url.replace('\\', '')
+    if '?' in url:
+        base_url, params = url.split('?', 1)
+        important_params = []
+        for param in params.split('&'):
+            if any(keep in param.lower() for keep in ['width', 'height', 'quality', 'format']):
+                important_params.append(param)
+        if important_params:
+            url = base_url + '?' + '&'.join(important_params)
+        else:
+            url = base_url
+    return url
+
+
+def legacy_enhance_image_quality(url):
+    if not url:
+        return url
+    quality_transformations = [
+        (r'_50x50\.', '_400x400.'),
+        (r'_100x100\.', '_400x400.'),
+        (r'_200x200\.', '_400x400.'),
+        (r'_220x220\.', '_400x400.'),
+        (r'summ\.jpg', '400x400.jpg'),
+        (r'\.jpg_\d+x\d+\.jpg', '.jpg'),
+        (r'\.jpg_.*', '.jpg'),
+        (r'\.png_.*', '.png'),
+        (r'\.webp_.*', '.webp'),
+    ]
+    enhanced_url = url
+    for pattern, replacement in quality_transformations:
+        enhanced_url = re.sub(pattern, replacement, enhanced_url)
+    if 'alicdn.com' in enhanced_url and not re.search(r'\d+x\d+', enhanced_url):
+        if enhanced_url.endswith(('.jpg', '.jpeg')):
+            enhanced_url = enhanced_url.replace('.jpg', '_800x800.jpg')
+        elif enhanced_url.endswith('.png'):
+            enhanced_url = enhanced_url.replace('.png', '_800x800.png')
+    return enhanced_url
+
+
+def legacy_extract_size_from_url(url):
+    size_match = re.search(r'(\d+)x(\d+)', url)
+    if size_match:
+        return f"{size_match.group(1)}x{size_match.group(2)}"
+    return "不明"
+
+
+def legacy_normalize(url):
+    """旧 extract_1688_images の呼び出し順（検証→クリーン→高解像度化→サイズ）"""
+    if not legacy_is_valid_product_image(url):
+        return (False, None, None, "不明")
+    clean_url = legacy_clean_image_url(url)
+    if not clean_url:
+        return (False, None, None, "不明")
+    high_res_url = legacy_enhance_image_quality(clean_url)
+    return (True, clean_url, high_res_url, legacy_extract_size_from_url(high_res_url))
+
+
+def corpus_urls():
+    """コーパス全ページの候補URL（ページ内の重複も含む処理順）"""
+    urls = []
+    for path in sorted(CORPUS_DIR.glob('*.html.gz')):
+        content = gzip.decompress(path.read_bytes())
+        urls.extend(collect_page_candidates(content, collect_scripts=False).image_sources)
+        urls.extend(script_scanner.scan_html(content))
+    return urls
+
+
+def per_url_cost(func, urls, repeat, before=None):
+    best = float('inf')
+    for _ in range(repeat):
+        if before:
+            before()
+        started = time.perf_counter()
+        for url in urls:
+            func(url)
+        best = min(best, time.perf_counter() - started)
+    return best / len(urls) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    urls = corpus_urls()
+    mismatches = [url for url in set(urls) if tuple(normalize_image_url(url))[:4] != legacy_normalize(url)]
+
+    legacy = per_url_cost(legacy_normalize, urls, args.repeat)
+    cold = per_url_cost(normalize_image_url, urls, args.repeat, before=clear_memo)
+    warm = per_url_cost(normalize_image_url, urls, args.repeat)
+
+    print(f"candidate URLs: {len(urls):,} ({len(set(urls)):,} unique)")
+    print(f"legacy helpers     : {legacy:6.2f} us/url")
+    print(f"rule engine (cold) : {cold:6.2f} us/url  ({legacy / cold:.1f}x)")
+    print(f"rule engine (memo) : {warm:6.2f} us/url  ({legacy / warm:.1f}x)")
+    print(f"mismatches         : {len(mismatches)}")
+    for url in mismatches[:5]:
+        print(f"    {url}\n      legacy={legacy_normalize(url)}\n      engine={tuple(normalize_image_url(url))[:4]}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
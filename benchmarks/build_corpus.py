@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+ベンチマーク用の1688商品ページコーパスを生成
+
+実ページの構造（旧レイアウト・新レイアウト・モバイル寄り・巨大ページ・
+エッジケース）を再現した保存ページを benchmarks/corpus/*.html.gz に書き出す。
+乱数シード固定なので何度実行しても同じファイルになる。
+
+    python benchmarks/build_corpus.py
+"""
+import gzip
+import json
+import random
+from pathlib import Path
+
+CORPUS_DIR = Path(__file__).parent / 'corpus'
+
+CDN_HOSTS = ['cbu01.alicdn.com', 'cbu01.alicdn.com', 'img.alicdn.com', 'sc04.alicdn.com']
+# サイズ違いの表記: '' は原寸、'_NxN' は拡張子前、'+...' は拡張子の後ろに付ける
+SIZES = ['_50x50', '_60x60', '_100x100', '_220x220', '_400x400', '.220x220',
+         '+_220x220.jpg', '+_b.jpg', '+_.webp', '']
+
+
+def cdn_path(rng, ext='jpg'):
+    """alicdn の ibank 画像パスを1つ作る"""
+    token = ''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789') for _ in range(22))
+    seller = rng.randint(10 ** 9, 10 ** 10)
+    return f"/img/ibank/O1CN01{token}_!!{seller}-0-cib.{ext}"
+
+
+def image_url(rng, path=None, ext='jpg', size=None, scheme='https:'):
+    host = rng.choice(CDN_HOSTS)
+    path = path or cdn_path(rng, ext)
+    size = rng.choice(SIZES) if size is None else size
+    if size.startswith('+'):
+        url = f"{scheme}//{host}{path}{size[1:]}"
+    elif size:
+        url = f"{scheme}//{host}{path[:-len(ext) - 1]}{size}.{ext}"
+    else:
+        url = f"{scheme}//{host}{path}"
+    return url
+
+
+def filler(rng, paragraphs):
+    """ナビ・推薦枠・フッターなどのノイズ"""
+    parts = []
+    for i in range(paragraphs):
+        parts.append(f'<div class="rec-item" data-spm="rec{i}">')
+        parts.append(f'<a href="https://detail.1688.com/offer/{rng.randint(10 ** 11, 10 ** 12)}.html">')
+        parts.append(f'<img class="rec-img" src="{image_url(rng, size="_220x220")}" alt="推荐商品{i}">')
+        parts.append(f'<span class="rec-price">¥{rng.randint(1, 500)}.{rng.randint(0, 99):02d}</span></a>')
+        parts.append('<p>' + '优质货源 厂家直销 一件代发 ' * rng.randint(2, 8) + '</p></div>')
+        if i % 7 == 0:
+            parts.append('<img src="https://img.alicdn.com/tfs/TB1logo-200-40.png" class="logo">')
+            parts.append('<img src="https://gw.alicdn.com/tfs/1x1.gif">')
+            parts.append('<!-- tracking --><img src="https://cbu01.alicdn.com/cms/upload/loading.gif">')
+    return '\n'.join(parts)
+
+
+def offer_json(rng, subject, gallery, sku_images, detail_url):
+    return {
+        'globalData': {
+            'offerBaseInfo': {'offerId': rng.randint(10 ** 11, 10 ** 12), 'sellerLoginId': 'seller', 'subject': subject},
+            'images': [{'fullPathImageURI': url, 'size310x310ImageURI': url + '_310x310.jpg'} for url in gallery],
+            'skuModel': {
+                'skuProps': [{
+                    'prop': '颜色',
+                    'value': [{'name': f'颜色{i}', 'imageUrl': url} for i, url in enumerate(sku_images)]
+                }]
+            }
+        },
+        'data': {
+            'offerImgList': gallery,
+            'detailUrl': detail_url,
+            'tracker': {'src': 'https://g.alicdn.com/track.js', 'url': 'https://stat.1688.com/x.gif'}
+        }
+    }
+
+
+def page_classic(rng, name):
+    """旧レイアウト: h1.d-title + .d-pic/.thumb-pic + iDetailConfig"""
+    gallery = [image_url(rng, size='') for _ in range(8)]
+    thumbs = ''.join(f'<li class="tab-trigger"><div class="thumb-pic"><img src="{u[:-4]}_60x60.jpg"></div></li>' for u in gallery)
+    script = 'var iDetailConfig = ' + json.dumps({'imgUrl': gallery[0], 'images': gallery}) + ';'
+    script += '\nvar iDetailData = {"sku": ' + json.dumps([{'imageUrl': image_url(rng)} for _ in range(6)]) + '};'
+    return f'''<!DOCTYPE html><html><head><meta charset="utf-8"><title>{name} - 阿里巴巴</title>
+<script src="https://g.alicdn.com/??kissy/k/1.4.2/seed-min.js"></script>
+<script>{script}</script></head><body>
+<div class="header"><img src="https://img.alicdn.com/tfs/TB1head-logo.png"></div>
+<div class="mod-detail-title"><h1 class="d-title">{name}</h1></div>
+<div class="mod-detail-gallery"><div class="d-pic"><img src="{gallery[0][:-4]}_400x400.jpg"></div>
+<ul class="nav-tabs">{thumbs}</ul></div>
+{filler(rng, 400)}
+</body></html>'''
+
+
+def page_modern(rng, name):
+    """新レイアウト: class*=title + .detail-gallery(data-src) + window.__INIT_DATA"""
+    gallery = [image_url(rng, size='') for _ in range(10)]
+    sku = [image_url(rng, size='') for _ in range(12)]
+    detail_url = f"https://itemcdn.tmall.com/1688offer/icoss{rng.randint(10 ** 8, 10 ** 9)}"
+    blob = json.dumps(offer_json(rng, name, gallery, sku, detail_url), ensure_ascii=False)
+    items = ''.join(f'<div class="detail-gallery-turn-wrapper"><img class="detail-gallery-img" data-src="{u}" src="//img.alicdn.com/tfs/placeholder.png"></div>' for u in gallery)
+    return f'''<!DOCTYPE html><html><head><meta charset="utf-8"><title>{name}</title></head><body>
+<div id="header"><div class="header-title">1688 采购批发</div></div>
+<div class="title-content"><div class="title-text">{name}</div></div>
+<div class="detail-gallery">{items}</div>
+<script>window.__INIT_DATA={blob}</script>
+<script>window.__GLOBAL_DATA = {{"src": "{image_url(rng, size='_400x400')}", "imageUrl": "{image_url(rng)}"}}</script>
+{filler(rng, 600)}
+<script>var rec = {json.dumps([{'url': image_url(rng, size='_220x220')} for _ in range(200)])};</script>
+</body></html>'''
+
+
+def page_mobile(rng, name):
+    """小さいページ: 空のh1 + .offer-title + .main-image/.product-image"""
+    gallery = [image_url(rng, size='_400x400') for _ in range(5)]
+    return f'''<html><head><meta charset="utf-8"></head><body>
+<h1>   </h1><div class="offer-title"><span>{name}</span> <em>热卖</em></div>
+<div class="main-image"><img src="{gallery[0]}"></div>
+<div class="product-image">{''.join(f'<img data-original="{u}">' for u in gallery[1:])}</div>
+<script>var cfg = {{imageUrl: '{gallery[0]}', src: 'https://cbu01.alicdn.com/avatar/head.jpg'}};</script>
+{filler(rng, 20)}
+</body></html>'''
+
+
+def page_huge(rng, name):
+    """巨大ページ: 多数のスクリプトブロブ + 大量の推薦画像"""
+    gallery = [image_url(rng, size='') for _ in range(30)]
+    blobs = []
+    for i in range(40):
+        data = [{'imgUrl': image_url(rng), 'title': '商品' * 20, 'price': rng.random()} for _ in range(60)]
+        blobs.append(f'<script>window.__REC_{i} = {json.dumps(data, ensure_ascii=False)};</script>')
+    return f'''<!DOCTYPE html><html><head><meta charset="utf-8"></head><body>
+<div class="d-title"><h1 class="d-title">{name}</h1></div>
+<div class="detail-gallery">{''.join(f'<img src="{u}_.webp">' for u in gallery)}</div>
+{''.join(blobs)}
+{filler(rng, 1500)}
+</body></html>'''
+
+
+def page_edge(rng, name):
+    """エッジケース: タイトルなし・png/webp・エスケープURL・プロトコル相対URL"""
+    png = [image_url(rng, ext='png', size='') for _ in range(4)]
+    webp = [image_url(rng, size='').replace('.jpg', '.webp') for _ in range(3)]
+    escaped = image_url(rng, size='').replace('/', '\\/')
+    return f'''<html><body>
+<div class="nav"><span class="subtitle"></span></div>
+{''.join(f'<img src="{u}">' for u in png)}
+{''.join(f'<img src="{u}">' for u in webp)}
+<img src="{image_url(rng, size='', scheme='')}">
+<img src="{image_url(rng, size='_30x30')}">
+<img data-src="{image_url(rng)}?width=800&spm=a26352&height=800">
+<script>var d = {{"imageUrl": "{escaped}", "URL": "{image_url(rng)}", "list": ["{image_url(rng)}"]}};</script>
+<script></script>
+</body></html>'''
+
+
+PAGES = [
+    ('classic_offer', page_classic, '2024新款女装连衣裙 夏季雪纺碎花长裙'),
+    ('modern_offer', page_modern, '跨境爆款 蓝牙耳机 无线降噪 TWS 运动耳机'),
+    ('mobile_offer', page_mobile, '儿童玩具 益智积木'),
+    ('huge_offer', page_huge, '大码男装 T恤 纯棉 短袖 批发'),
+    ('edge_offer', page_edge, ''),
+]
+
+
+def main():
+    CORPUS_DIR.mkdir(parents=True, exist_ok=True)
+    for i, (name, build, title) in enumerate(PAGES):
+        rng = random.Random(1688 + i)
+        html = build(rng, title)
+        path = CORPUS_DIR / f'{name}.html.gz'
+        # mtime=0 で出力を決定的にする
+        with open(path, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+            f.write(html.encode('utf-8'))
+        print(f'{path.name}: {len(html.encode("utf-8")):,} bytes')
+
+
+if __name__ == '__main__':
+    main()
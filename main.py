@@ -1,14 +1,25 @@
 #!/usr/bin/env python3
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify, render_template_string
 import os
-import sys
 import json
 import time
 import requests
-import re
-from urllib.parse import urlparse, urljoin
-from bs4 import BeautifulSoup
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from src.http_client import fetch_page, read_page_body
+from src.page_cache import OfferPageCache, canonical_offer_id
+from src.offer_result import build_offer_result, limit_result, parse_offer_page
+from src.url_rules import clean_url, high_res_url, is_valid_url, parse_size
+from src.url_rules import memo_stats as url_memo_stats
+from src.script_scanner import script_rule_stats
+from src.single_flight import SingleFlight
+from src.metrics import error_class, extract_errors, extract_page_bytes, extract_requests, extract_stage_seconds
+from src.metrics import registry as metrics_registry
+from src.rate_limit import get_rate_limiter
+from src.resilience import circuit_breakers, get_retry_policy
+from src.vision_cache import vision_cache_stats
+from src.jobs import JobQueue, JobStore, QueueFullError, run_product_job
 
 app = Flask(__name__)
 
@@ -16,286 +27,111 @@ app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 商品ID単位の抽出結果キャッシュ
+page_cache = OfferPageCache()
+
+# バッチ抽出用の共有ワーカープール（全バッチ合計の同時実行数を制限）
+BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', 8))
+BATCH_MAX_URLS = int(os.environ.get('BATCH_MAX_URLS', 500))
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS, thread_name_prefix='batch-extract')
+
+# 同じ商品・件数の同時抽出を1回の取得にまとめる
+extract_flight = SingleFlight()
+
+# 商品処理（ダウンロード → 分析 → 整理）のバックグラウンドジョブ
+# import しただけでは作らず、起動時に start_background_jobs() で作成して未完了分を再開する
+job_queue = None
+
+def start_background_jobs(queue=None):
+    """ジョブキューを用意し、前回終わらなかったジョブを再開する（サーバー起動時に1回だけ呼ぶ）"""
+    global job_queue
+    job_queue = queue or JobQueue(JobStore(), run_product_job)
+    job_queue.resume()
+    return job_queue
+
+def jobs_unavailable():
+    return jsonify({'success': False, 'error': 'ジョブキューが起動していません'}), 503
+
 def extract_1688_images(url, max_images=20):
     """1688商品ページから実際に画像を抽出"""
+    offer_id = canonical_offer_id(url)
+    entry = page_cache.lookup(offer_id) if offer_id else None
+    if entry and entry.is_fresh():
+        logger.info(f"💾 Cache hit: offer {offer_id}")
+        extract_requests.inc(outcome='cache_hit')
+        return limit_result(entry.result, url, max_images)
+    
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'none',
-            'Cache-Control': 'max-age=0'
-        }
-        
         logger.info(f"🔍 Fetching page: {url}")
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
-        response.encoding = 'utf-8'
-        
-        logger.info(f"✅ Page loaded successfully, size: {len(response.text)} chars")
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # 商品タイトル抽出
-        title_selectors = [
-            'h1.d-title',
-            '.d-title',
-            'h1',
-            '.product-title',
-            '.offer-title',
-            '[class*="title"]'
-        ]
-        
-        product_title = "1688商品"
-        for selector in title_selectors:
-            title_elem = soup.select_one(selector)
-            if title_elem and title_elem.get_text(strip=True):
-                product_title = title_elem.get_text(strip=True)[:100]
-                break
-        
-        logger.info(f"📋 Product title: {product_title}")
-        
-        # 画像URL抽出 - 複数の方法を試行
-        image_urls = set()
-        
-        # 方法1: img タグから直接抽出
-        img_selectors = [
-            'img[src*="cbu01.alicdn.com"]',
-            'img[src*="sc04.alicdn.com"]', 
-            'img[src*="img.alicdn.com"]',
-            'img[data-src*="alicdn.com"]',
-            'img[data-original*="alicdn.com"]',
-            '.d-pic img',
-            '.main-image img',
-            '.product-image img',
-            '.thumb-pic img',
-            '.detail-gallery img',
-            'img[src*=".jpg"]',
-            'img[src*=".png"]',
-            'img[src*=".webp"]'
-        ]
-        
-        for selector in img_selectors:
-            imgs = soup.select(selector)
-            for img in imgs:
-                src = img.get('src') or img.get('data-src') or img.get('data-original')
-                if src and is_valid_product_image(src):
-                    clean_url = clean_image_url(src)
-                    if clean_url:
-                        image_urls.add(clean_url)
-        
-        # 方法2: JavaScript data から抽出
-        scripts = soup.find_all('script')
-        for script in scripts:
-            if script.string:
-                # JSON data extraction
-                json_matches = re.findall(r'"(https?://[^"]*alicdn\.com[^"]*\.(?:jpg|png|webp)[^"]*)"', script.string)
-                for match in json_matches:
-                    if is_valid_product_image(match):
-                        clean_url = clean_image_url(match)
-                        if clean_url:
-                            image_urls.add(clean_url)
-                
-                # 特定のパターンを抽出
-                patterns = [
-                    r'imgUrl["\']?\s*:\s*["\']([^"\']+)["\']',
-                    r'imageUrl["\']?\s*:\s*["\']([^"\']+)["\']',
-                    r'src["\']?\s*:\s*["\']([^"\']+)["\']',
-                    r'url["\']?\s*:\s*["\']([^"\']*alicdn\.com[^"\']*)["\']'
-                ]
-                
-                for pattern in patterns:
-                    matches = re.findall(pattern, script.string, re.IGNORECASE)
-                    for match in matches:
-                        if is_valid_product_image(match):
-                            clean_url = clean_image_url(match)
-                            if clean_url:
-                                image_urls.add(clean_url)
-        
-        # 結果を処理
-        image_list = list(image_urls)[:max_images]
-        
-        # 高解像度版に変換
-        enhanced_images = []
-        for i, img_url in enumerate(image_list):
-            high_res_url = enhance_image_quality(img_url)
+        started = time.perf_counter()
+        response = fetch_page(url, headers=entry.conditional_headers() if entry else None, stream=True)
+        try:
+            if response.status_code == 304 and entry and not entry.negative:
+                logger.info(f"♻️ Not modified, reusing cached result: offer {offer_id}")
+                page_cache.mark_revalidated(offer_id)
+                extract_requests.inc(outcome='not_modified')
+                return limit_result(entry.result, url, max_images)
+            response.raise_for_status()
             
-            enhanced_images.append({
-                'url': high_res_url,
-                'original_url': img_url,
-                'index': i + 1,
-                'type': classify_image_type(img_url, i),
-                'size': extract_size_from_url(high_res_url)
-            })
-        
-        logger.info(f"🖼️ Found {len(enhanced_images)} images")
-        
-        return {
-            'success': True,
-            'title': product_title,
-            'url': url,
-            'images': enhanced_images,
-            'total_found': len(image_urls),
-            'extracted_count': len(enhanced_images)
-        }
+            content = read_page_body(response)
+            extract_stage_seconds.observe(time.perf_counter() - started, stage='fetch')
+            page_size = len(content)
+            offer_data, candidates = parse_offer_page(content)
+        finally:
+            response.close()
+        
+        logger.info(f"✅ Page loaded successfully, size: {page_size} bytes")
+        extract_page_bytes.observe(page_size)
+        
+        # キャッシュ用に全件を変換し、返却時に max_images 件へ切り詰める
+        result = build_offer_result(url, offer_data, candidates, content)
+        if offer_id:
+            page_cache.put(offer_id, result,
+                           etag=response.headers.get('ETag'),
+                           last_modified=response.headers.get('Last-Modified'))
+        extract_requests.inc(outcome='success')
+        return limit_result(result, url, max_images)
         
     except requests.exceptions.RequestException as e:
         logger.error(f"❌ Request error: {e}")
-        return {'success': False, 'error': f'ページの取得に失敗しました: {str(e)}'}
+        result = {'success': False, 'error': f'ページの取得に失敗しました: {str(e)}'}
+        extract_errors.inc(error_class=error_class(e))
     except Exception as e:
-        logger.error(f"❌ API Error: {e}")
-        return jsonify({
-            'success': False, 
-            'error': f'サーバーエラー: {str(e)}'
-        })
-
-@app.route('/health')
-def health():
-    return jsonify({
-        'status': 'healthy',
-        'app': '1688 Photos Organizer - Debug Version',
-        'version': '4.1.0',
-        'features': ['real_scraping', 'image_enhancement', 'debug_mode']
-    })
-
-if __name__ == '__main__':
-    # Railway用のポート設定
-    port = int(os.environ.get('PORT', 5000))
+        logger.error(f"❌ Extraction error: {e}")
+        result = {'success': False, 'error': f'画像抽出エラー: {str(e)}'}
+        extract_errors.inc(error_class=error_class(e))
     
-    logger.info(f"🚀 Starting 1688 Real Image Extractor - Debug Version")
-    logger.info(f"🌐 Port: {port}")
-    logger.info(f"🔧 Debug mode enabled for troubleshooting")
-    
-    app.run(host='0.0.0.0', port=port, debug=False)error(f"❌ Extraction error: {e}")
-        return {'success': False, 'error': f'画像抽出エラー: {str(e)}'}
+    extract_requests.inc(outcome='error')
+    # 失敗も短時間キャッシュして上流への連続アクセスを防ぐ
+    if offer_id:
+        page_cache.put_failure(offer_id, result)
+    return result
+
+def extract_coalesced(url, max_images=20):
+    """同じ商品ID・件数の抽出が実行中なら、その完了を待って結果を共有する"""
+    key = (canonical_offer_id(url) or url, max_images)
+    result, shared = extract_flight.do(key, extract_1688_images, url, max_images)
+    if shared:
+        logger.info(f"🤝 Coalesced with in-flight extraction: {key[0]}")
+        if result.get('success'):
+            result = dict(result, url=url)
+    return result
 
 def is_valid_product_image(url):
     """商品画像として有効かチェック"""
-    if not url or not isinstance(url, str):
-        return False
-    
-    # 基本的なURL形式チェック
-    if not url.startswith(('http://', 'https://', '//')):
-        return False
-    
-    # アリババCDNドメインチェック
-    valid_domains = ['alicdn.com', '1688.com']
-    if not any(domain in url for domain in valid_domains):
-        return False
-    
-    # 画像形式チェック
-    if not re.search(r'\.(jpg|jpeg|png|webp)', url, re.IGNORECASE):
-        return False
-    
-    # 除外パターン
-    exclude_patterns = [
-        'favicon', 'logo', 'icon', 'placeholder', 'loading',
-        '1x1', 'pixel', 'transparent', 'blank', 'empty',
-        'avatar', 'head', 'profile', 'watermark'
-    ]
-    
-    url_lower = url.lower()
-    if any(pattern in url_lower for pattern in exclude_patterns):
-        return False
-    
-    # サイズフィルター（非常に小さい画像を除外）
-    size_patterns = re.findall(r'(\d+)x(\d+)', url)
-    for width, height in size_patterns:
-        if int(width) < 50 or int(height) < 50:
-            return False
-    
-    return True
+    return is_valid_url(url)
 
 def clean_image_url(url):
     """画像URLをクリーンアップ"""
-    if not url:
-        return None
-    
-    # プロトコル修正
-    if url.startswith('//'):
-        url = 'https:' + url
-    
-    # URLデコード
-    url = url.replace('\\', '')
-    
-    # 余分なパラメータ削除
-    if '?' in url:
-        base_url, params = url.split('?', 1)
-        # 重要なパラメータのみ保持
-        important_params = []
-        for param in params.split('&'):
-            if any(keep in param.lower() for keep in ['width', 'height', 'quality', 'format']):
-                important_params.append(param)
-        
-        if important_params:
-            url = base_url + '?' + '&'.join(important_params)
-        else:
-            url = base_url
-    
-    return url
+    return clean_url(url)
 
 def enhance_image_quality(url):
     """画像URLを高品質版に変換"""
-    if not url:
-        return url
-    
-    # アリババCDNの画像品質向上パターン
-    quality_transformations = [
-        # 低解像度を高解像度に変換
-        (r'_50x50\.', '_400x400.'),
-        (r'_100x100\.', '_400x400.'),
-        (r'_200x200\.', '_400x400.'),
-        (r'_220x220\.', '_400x400.'),
-        (r'summ\.jpg', '400x400.jpg'),
-        (r'\.jpg_\d+x\d+\.jpg', '.jpg'),
-        
-        # 品質パラメータ改善
-        (r'\.jpg_.*', '.jpg'),
-        (r'\.png_.*', '.png'),
-        (r'\.webp_.*', '.webp'),
-    ]
-    
-    enhanced_url = url
-    for pattern, replacement in quality_transformations:
-        enhanced_url = re.sub(pattern, replacement, enhanced_url)
-    
-    # 最大解像度を指定（可能な場合）
-    if 'alicdn.com' in enhanced_url and not re.search(r'\d+x\d+', enhanced_url):
-        if enhanced_url.endswith(('.jpg', '.jpeg')):
-            enhanced_url = enhanced_url.replace('.jpg', '_800x800.jpg')
-        elif enhanced_url.endswith('.png'):
-            enhanced_url = enhanced_url.replace('.png', '_800x800.png')
-    
-    return enhanced_url
-
-def classify_image_type(url, index):
-    """画像の種類を分類"""
-    url_lower = url.lower()
-    
-    if any(keyword in url_lower for keyword in ['main', 'primary', 'hero']):
-        return 'メイン画像'
-    elif any(keyword in url_lower for keyword in ['detail', 'zoom', 'large']):
-        return '詳細画像'
-    elif any(keyword in url_lower for keyword in ['thumb', 'small', 'mini']):
-        return 'サムネイル'
-    elif index < 3:
-        return 'メイン画像'
-    elif index < 8:
-        return '詳細画像'
-    else:
-        return 'その他'
+    return high_res_url(url)
 
 def extract_size_from_url(url):
     """URLからサイズ情報を抽出"""
-    size_match = re.search(r'(\d+)x(\d+)', url)
-    if size_match:
-        return f"{size_match.group(1)}x{size_match.group(2)}"
-    return "不明"
+    return parse_size(url)
 
 HTML_TEMPLATE = '''
 <!DOCTYPE html>
@@ -735,7 +571,7 @@ def extract():
         logger.info(f"🚀 画像抽出開始: {url}")
         
         # 実際の画像抽出実行
-        result = extract_1688_images(url, max_images)
+        result = extract_coalesced(url, max_images)
         
         logger.info(f"🔚 抽出結果: success={result['success']}, images={result.get('extracted_count', 0)}")
         
@@ -747,10 +583,150 @@ def extract():
                 'images': result['images'],
                 'total_found': result['total_found'],
                 'extracted_count': result['extracted_count'],
+                'extraction_method': result['extraction_method'],
+                'description_url': result.get('description_url'),
                 'quality': quality
             })
         else:
             return jsonify(result)
         
     except Exception as e:
-        logger.
\ No newline at end of file
+        logger.error(f"❌ API Error: {e}")
+        return jsonify({
+            'success': False, 
+            'error': f'サーバーエラー: {str(e)}'
+        })
+
+@app.route('/extract/batch', methods=['POST'])
+def extract_batch():
+    """複数URLの一括抽出API - 完了した順にNDJSONでストリーミング返却"""
+    data = request.get_json(silent=True) or {}
+    urls = data.get('urls')
+    
+    if not isinstance(urls, list) or not urls:
+        return jsonify({'success': False, 'error': 'URLのリストが必要です'}), 400
+    
+    if len(urls) > BATCH_MAX_URLS:
+        return jsonify({'success': False, 'error': f'URLは最大{BATCH_MAX_URLS}件までです'}), 400
+    
+    try:
+        max_images = int(data.get('max_images', 15))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'max_imagesが不正です'}), 400
+    quality = data.get('quality', 'high')
+    
+    logger.info(f"📦 バッチ抽出開始: {len(urls)}件, max_images={max_images}, quality={quality}")
+    
+    def extract_one(index, url):
+        # URLごとのエラーはその行だけに閉じ込める
+        if not isinstance(url, str) or not url.strip():
+            return {'index': index, 'url': url, 'success': False, 'error': 'URLが必要です'}
+        url = url.strip()
+        if '1688.com' not in url:
+            return {'index': index, 'url': url, 'success': False, 'error': '1688.comのURLを入力してください'}
+        try:
+            result = extract_coalesced(url, max_images)
+        except Exception as e:
+            logger.error(f"❌ Batch item error {url}: {e}")
+            result = {'success': False, 'error': f'サーバーエラー: {str(e)}'}
+        result = dict(result, index=index, url=url)
+        if result['success']:
+            result['quality'] = quality
+        return result
+    
+    def generate():
+        futures = [batch_executor.submit(extract_one, i, url) for i, url in enumerate(urls)]
+        succeeded = 0
+        try:
+            for future in as_completed(futures):
+                result = future.result()
+                succeeded += 1 if result['success'] else 0
+                yield json.dumps(result, ensure_ascii=False) + '\n'
+            logger.info(f"📦 バッチ抽出完了: {succeeded}/{len(urls)}件成功")
+        finally:
+            # クライアント切断時は未着手の抽出を取り消す
+            for future in futures:
+                future.cancel()
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """商品処理ジョブを登録してジョブIDを返す"""
+    data = request.get_json(silent=True) or {}
+    url = str(data.get('url') or '').strip()
+    custom_instructions = str(data.get('custom_instructions') or '')
+    
+    if not url:
+        return jsonify({'success': False, 'error': 'URLが必要です'}), 400
+    if '1688.com' not in url:
+        return jsonify({'success': False, 'error': '1688.comのURLを入力してください'}), 400
+    if job_queue is None:
+        return jobs_unavailable()
+    
+    try:
+        job_id = job_queue.submit(url, custom_instructions)
+    except QueueFullError as e:
+        return jsonify({'success': False, 'error': str(e)}), 429
+    
+    return jsonify({'success': True, 'job_id': job_id, 'status': 'queued'}), 202
+
+@app.route('/jobs')
+def list_jobs():
+    """最近のジョブ一覧（?status= で絞り込み）"""
+    if job_queue is None:
+        return jobs_unavailable()
+    jobs = job_queue.store.recent(status=request.args.get('status'))
+    return jsonify({'success': True, 'jobs': jobs, 'counts': job_queue.store.counts()})
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """ジョブの状態・進捗・最終結果"""
+    if job_queue is None:
+        return jobs_unavailable()
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'ジョブが見つかりません'}), 404
+    return jsonify(dict(job, success=True))
+
+@app.route('/stats')
+def stats():
+    return jsonify({
+        'page_cache': page_cache.stats(),
+        'script_rules': script_rule_stats.snapshot(),
+        'url_memo': url_memo_stats(),
+        'single_flight': extract_flight.stats(),
+        'rate_limits': get_rate_limiter().stats(),
+        'retry': get_retry_policy().stats(),
+        'circuit_breakers': circuit_breakers.snapshot(),
+        'vision_cache': vision_cache_stats(),
+        'jobs': job_queue.store.counts() if job_queue else None
+    })
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus テキスト形式のメトリクス"""
+    return Response(metrics_registry.render(), content_type=metrics_registry.CONTENT_TYPE)
+
+@app.route('/health')
+def health():
+    return jsonify({
+        'status': 'healthy',
+        'app': '1688 Photos Organizer - Debug Version',
+        'version': '4.1.0',
+        'features': ['real_scraping', 'image_enhancement', 'debug_mode']
+    })
+
+if __name__ == '__main__':
+    # Railway用のポート設定
+    port = int(os.environ.get('PORT', 5000))
+    
+    logger.info(f"🚀 Starting 1688 Real Image Extractor - Debug Version")
+    logger.info(f"🌐 Port: {port}")
+    logger.info(f"🔧 Debug mode enabled for troubleshooting")
+    
+    # 設定ファイルの site_config でページ取得・画像ダウンロード共有のレート制限と再試行を設定
+    from src.extractor import apply_site_config
+    apply_site_config()
+    start_background_jobs()
+    app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,221 @@
+"""
+非同期版の商品画像抽出API（aiohttp）
+
+Flask版の /extract は上流の応答を最大 READ_TIMEOUT 秒ワーカーごと待つ。
+こちらは取得をイベントループ上で待ち、本文の解析（lxml・JSON・正規表現）
+だけをスレッドプールで実行するので、1プロセスで数百件の取得を同時に
+保持できる。
+
+起動: python -m src.async_app
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import aiohttp
+from aiohttp import web
+
+from .async_client import create_async_session, read_page_body_async
+from .offer_result import extract_from_content, limit_result
+from .metrics import error_class, extract_errors, extract_page_bytes, extract_requests, extract_stage_seconds
+from .metrics import registry as metrics_registry
+from .page_cache import OfferPageCache, canonical_offer_id
+from .rate_limit import get_rate_limiter
+from .replay import replay_url
+from .resilience import CircuitOpenError, circuit_breakers, get_retry_policy
+from .script_scanner import script_rule_stats
+from .single_flight import AsyncSingleFlight
+from .url_rules import memo_stats as url_memo_stats
+
+logger = logging.getLogger(__name__)
+
+# 本文解析用のスレッド数
+ASYNC_PARSE_WORKERS = int(os.environ.get('ASYNC_PARSE_WORKERS', 4))
+# 再試行する例外（接続エラー・タイムアウト）
+RETRY_EXCEPTIONS = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
+
+class AsyncExtractor:
+    """main.extract_1688_images の非同期版（キャッシュ・条件付き再検証も同じ）"""
+
+    def __init__(self, session, page_cache=None, parse_executor=None):
+        self.session = session
+        self.page_cache = page_cache if page_cache is not None else OfferPageCache()
+        self.parse_executor = parse_executor
+        self.flight = AsyncSingleFlight()
+        self.in_flight = 0
+
+    async def extract(self, url, max_images=20):
+        """1688商品ページから画像を抽出（同じ商品ID・件数の同時リクエストは1回の取得にまとめる）"""
+        key = (canonical_offer_id(url) or url, max_images)
+        result, shared = await self.flight.do(key, self._extract, url, max_images)
+        if shared:
+            logger.info(f"🤝 Coalesced with in-flight extraction: {key[0]}")
+            if result.get('success'):
+                result = dict(result, url=url)
+        return result
+
+    async def _extract(self, url, max_images):
+        offer_id = canonical_offer_id(url)
+        entry = self.page_cache.lookup(offer_id) if offer_id else None
+        if entry and entry.is_fresh():
+            logger.info(f"💾 Cache hit: offer {offer_id}")
+            extract_requests.inc(outcome='cache_hit')
+            return limit_result(entry.result, url, max_images)
+
+        self.in_flight += 1
+        try:
+            logger.info(f"🔍 Fetching page (async): {url}")
+            headers = entry.conditional_headers() if entry else None
+            rate_limiter = get_rate_limiter()
+
+            async def send():
+                await rate_limiter.acquire_async(url)
+                response = await self.session.get(replay_url(url), headers=headers)
+                rate_limiter.observe(url, response.status, response.headers)
+                return response
+
+            started = time.perf_counter()
+            response = await get_retry_policy().call_async(url, send, circuit_breakers, RETRY_EXCEPTIONS)
+            async with response:
+                if response.status == 304 and entry and not entry.negative:
+                    logger.info(f"♻️ Not modified, reusing cached result: offer {offer_id}")
+                    self.page_cache.mark_revalidated(offer_id)
+                    extract_requests.inc(outcome='not_modified')
+                    return limit_result(entry.result, url, max_images)
+                response.raise_for_status()
+                content = await read_page_body_async(response)
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+
+            extract_stage_seconds.observe(time.perf_counter() - started, stage='fetch')
+            extract_page_bytes.observe(len(content))
+            logger.info(f"✅ Page loaded successfully, size: {len(content)} bytes")
+
+            # CPUバウンドな解析はイベントループを塞がないようにプールで実行
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.parse_executor, partial(extract_from_content, url, content))
+            if offer_id:
+                self.page_cache.put(offer_id, result, etag=etag, last_modified=last_modified)
+            extract_requests.inc(outcome='success')
+            return limit_result(result, url, max_images)
+
+        except (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError) as e:
+            message = str(e) or type(e).__name__
+            logger.error(f"❌ Request error: {message}")
+            result = {'success': False, 'error': f'ページの取得に失敗しました: {message}'}
+            extract_errors.inc(error_class=error_class(e))
+        except Exception as e:
+            logger.error(f"❌ Extraction error: {e}")
+            result = {'success': False, 'error': f'画像抽出エラー: {str(e)}'}
+            extract_errors.inc(error_class=error_class(e))
+        finally:
+            self.in_flight -= 1
+
+        extract_requests.inc(outcome='error')
+
+        # 失敗も短時間キャッシュして上流への連続アクセスを防ぐ
+        if offer_id:
+            self.page_cache.put_failure(offer_id, result)
+        return result
+
+
+EXTRACTOR_KEY = web.AppKey('extractor', AsyncExtractor)
+
+
+def json_response(data, status=200):
+    return web.json_response(data, status=status, dumps=partial(json.dumps, ensure_ascii=False))
+
+
+async def extract(request):
+    """非同期版の画像抽出API（リクエスト・レスポンス形式は Flask 版 /extract と同じ）"""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return json_response({'success': False, 'error': 'JSONボディが必要です'}, status=400)
+
+    url = str(data.get('url') or '').strip()
+    try:
+        max_images = int(data.get('max_images', 15))
+    except (TypeError, ValueError):
+        return json_response({'success': False, 'error': 'max_imagesが不正です'}, status=400)
+    quality = data.get('quality', 'high')
+
+    if not url:
+        return json_response({'success': False, 'error': 'URLが必要です'})
+    if '1688.com' not in url:
+        return json_response({'success': False, 'error': '1688.comのURLを入力してください'})
+
+    result = await request.app[EXTRACTOR_KEY].extract(url, max_images)
+    logger.info(f"🔚 抽出結果: success={result['success']}, images={result.get('extracted_count', 0)}")
+    if result['success']:
+        result = dict(result, quality=quality)
+    return json_response(result)
+
+
+async def stats(request):
+    extractor = request.app[EXTRACTOR_KEY]
+    return json_response({
+        'page_cache': extractor.page_cache.stats(),
+        'script_rules': script_rule_stats.snapshot(),
+        'url_memo': url_memo_stats(),
+        'single_flight': extractor.flight.stats(),
+        'rate_limits': get_rate_limiter().stats(),
+        'circuit_breakers': circuit_breakers.snapshot(),
+        'in_flight': extractor.in_flight
+    })
+
+
+async def metrics(request):
+    """Prometheus テキスト形式のメトリクス"""
+    return web.Response(body=metrics_registry.render().encode('utf-8'),
+                        headers={'Content-Type': metrics_registry.CONTENT_TYPE})
+
+
+async def health(request):
+    return json_response({
+        'status': 'healthy',
+        'app': '1688 Photos Organizer - Async',
+        'version': '4.1.0',
+        'features': ['real_scraping', 'image_enhancement', 'async_fetch']
+    })
+
+
+def create_app(session_factory=create_async_session, parse_workers=ASYNC_PARSE_WORKERS, page_cache=None):
+    """aiohttp アプリを作成（セッションと解析プールはアプリの起動・終了に合わせて管理）"""
+    app = web.Application()
+
+    async def extractor_context(app):
+        session = session_factory()
+        executor = ThreadPoolExecutor(max_workers=parse_workers, thread_name_prefix='async-parse')
+        app[EXTRACTOR_KEY] = AsyncExtractor(session, page_cache, executor)
+        yield
+        await session.close()
+        executor.shutdown(wait=False)
+
+    app.cleanup_ctx.append(extractor_context)
+    app.router.add_post('/extract', extract)
+    app.router.add_get('/stats', stats)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_get('/health', health)
+    return app
+
+
+def main():
+    from .extractor import apply_site_config
+
+    logging.basicConfig(level=logging.INFO)
+    apply_site_config()
+    port = int(os.environ.get('PORT', 5000))
+    logger.info(f"🚀 Starting 1688 Image Extractor (async) on port {port}")
+    web.run_app(create_app(), host='0.0.0.0', port=port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+1688ページ取得用の非同期HTTPクライアント
+
+イベントループごとに1つの aiohttp.ClientSession を共有し、1プロセスで
+多数の上流リクエストを同時に待てるようにする。ヘッダー・タイムアウト・
+本文サイズ上限は同期版（src.http_client）と同じ設定を使う。
+"""
+import os
+import logging
+
+import aiohttp
+
+from .http_client import (
+    CONNECT_TIMEOUT, MAX_DECODED_PAGE_BYTES, MAX_PAGE_BYTES, PAGE_CHUNK_SIZE, PAGE_HEADERS, READ_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+# 同時接続数（全ホスト合計・ホストごと）と1リクエスト全体の期限
+ASYNC_MAX_CONNECTIONS = int(os.environ.get('ASYNC_MAX_CONNECTIONS', 200))
+ASYNC_MAX_CONNECTIONS_PER_HOST = int(os.environ.get('ASYNC_MAX_CONNECTIONS_PER_HOST', 0))  # 0 = 無制限
+ASYNC_TOTAL_TIMEOUT = float(os.environ.get('ASYNC_TOTAL_TIMEOUT', 30))
+
+
+class PageTooLargeError(aiohttp.ClientError):
+    """Content-Length が上限を超えている"""
+
+
+def create_timeout(connect=CONNECT_TIMEOUT, read=READ_TIMEOUT, total=ASYNC_TOTAL_TIMEOUT):
+    """(接続, 読み込み, 全体) タイムアウト"""
+    return aiohttp.ClientTimeout(total=total, sock_connect=connect, sock_read=read)
+
+
+def create_async_session(limit=ASYNC_MAX_CONNECTIONS, limit_per_host=ASYNC_MAX_CONNECTIONS_PER_HOST,
+                         timeout=None):
+    """接続プール付きの ClientSession を作成（実行中のイベントループ内で呼ぶ）"""
+    connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host)
+    session = aiohttp.ClientSession(
+        connector=connector,
+        headers=PAGE_HEADERS,
+        timeout=timeout or create_timeout()
+    )
+    logger.info(f"🔌 Async HTTP session created: limit={limit}, limit_per_host={limit_per_host}")
+    return session
+
+
+async def read_page_body_async(response, chunk_size=PAGE_CHUNK_SIZE, max_bytes=MAX_PAGE_BYTES,
+                               max_decoded_bytes=MAX_DECODED_PAGE_BYTES):
+    """上限付きで本文全体を読み込む
+
+    Content-Length が転送上限を超える場合は読まずに失敗し、展開後の
+    バイト数が上限を超えた時点で打ち切る。
+    """
+    if response.content_length is not None and response.content_length > max_bytes:
+        raise PageTooLargeError(f"Content-Length {response.content_length} exceeds {max_bytes} bytes")
+    chunks = []
+    decoded = 0
+    async for chunk in response.content.iter_chunked(chunk_size):
+        decoded += len(chunk)
+        if decoded > max_decoded_bytes:
+            logger.warning(f"⚠️ Decoded page size exceeded {max_decoded_bytes} bytes, truncating: {response.url}")
+            break
+        chunks.append(chunk)
+    return b''.join(chunks)
@@ -0,0 +1,207 @@
+"""
+ダウンロード画像のコンテンツアドレス型ストア
+
+同じ写真が多くの商品で使い回されるため、画像の本文は SHA-256 ごとに
+1回だけ保存し、商品・分類フォルダにはハードリンクを置く。
+URL → ハッシュの索引（SQLite）を持ち、索引にあるURLはダウンロードしない。
+索引には ETag / Last-Modified も残し、一定時間（IMAGE_REVALIDATE_AFTER）を
+過ぎたURLは条件付きリクエストで確認する。
+
+配置: <root>/objects/<先頭2桁>/<ハッシュ>、<root>/index.db、
+ダウンロード途中のファイルは <root>/partial/<URLのSHA-1>（再開用に残す。同じURLを
+同時に取得するジョブが同じファイルに書かないよう、URLごとに排他する）
+ハードリンクは同じファイルシステム内でしか作れないので、既定では出力
+ディレクトリの下に置く。作れない場合はコピーする。
+"""
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+BLOB_STORE_DIR = os.environ.get('BLOB_STORE_DIR', '')
+# この秒数を過ぎた画像は条件付きリクエストで変更を確認する（それまではネットワークに出ない）
+IMAGE_REVALIDATE_AFTER = float(os.environ.get('IMAGE_REVALIDATE_AFTER', 7 * 24 * 3600))
+HASH_CHUNK_SIZE = 1024 * 1024
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    checked_at REAL
+);
+'''
+# 既存の索引に後から足した列
+ADDED_COLUMNS = (('etag', 'TEXT'), ('last_modified', 'TEXT'), ('checked_at', 'REAL'))
+
+
+def file_digest(path):
+    """ファイルの SHA-256（16進）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _index_url(url):
+    return 'https:' + url if url.startswith('//') else url
+
+
+class BlobStore:
+    """SHA-256 で重複を除く画像ストア（スレッドセーフ）"""
+
+    def __init__(self, root, revalidate_after=IMAGE_REVALIDATE_AFTER):
+        self.root = Path(root)
+        self.objects = self.root / 'objects'
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.partial = self.root / 'partial'
+        self.partial.mkdir(exist_ok=True)
+        self.revalidate_after = revalidate_after
+        self._lock = threading.Lock()
+        # URL → [ロック, 待っているスレッド数]
+        self._partial_locks = {}
+        self._conn = sqlite3.connect(str(self.root / 'index.db'), check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(urls)')}
+        for name, column_type in ADDED_COLUMNS:
+            if name not in columns:
+                self._conn.execute(f'ALTER TABLE urls ADD COLUMN {name} {column_type}')
+        self._stats = {'url_hits': 0, 'revalidated': 0, 'stored': 0, 'deduplicated': 0, 'bytes_saved': 0,
+                       'links': 0, 'copies': 0}
+
+    def path_for(self, digest):
+        return self.objects / digest[:2] / digest
+
+    def partial_path(self, url):
+        """URLごとのダウンロード先（途中で切れても次回同じパスから再開できる）"""
+        return self.partial / hashlib.sha1(_index_url(url).encode('utf-8')).hexdigest()
+
+    @contextmanager
+    def partial_download(self, url):
+        """URLのダウンロード先を排他して使う（同じURLの取得は1件ずつ、後のジョブは待ってから索引を見直す）"""
+        key = _index_url(url)
+        with self._lock:
+            entry = self._partial_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield self.partial_path(url)
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._partial_locks[key]
+
+    def lookup(self, url):
+        """記録済みのURLの情報を返す（未記録・ブロブ消失・サイズ不一致なら None）
+
+        fresh が True なら再確認せずにそのまま使ってよい。
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT digest, size, stored_at, etag, last_modified, checked_at FROM urls WHERE url = ?',
+                (_index_url(url),)
+            ).fetchone()
+        if row is None:
+            return None
+        digest, size, stored_at, etag, last_modified, checked_at = row
+        path = self.path_for(digest)
+        try:
+            if path.stat().st_size != size:
+                return None
+        except FileNotFoundError:
+            return None
+        fresh = time.time() - (checked_at or stored_at) < self.revalidate_after
+        if fresh:
+            with self._lock:
+                self._stats['url_hits'] += 1
+                self._stats['bytes_saved'] += size
+        return {'path': path, 'size': size, 'fresh': fresh, 'etag': etag, 'last_modified': last_modified}
+
+    def touch(self, url):
+        """条件付きリクエストで変更なし（304）と確認できた"""
+        with self._lock:
+            row = self._conn.execute('SELECT size FROM urls WHERE url = ?', (_index_url(url),)).fetchone()
+            self._conn.execute('UPDATE urls SET checked_at = ? WHERE url = ?', (time.time(), _index_url(url)))
+            self._stats['revalidated'] += 1
+            if row:
+                self._stats['bytes_saved'] += row[0]
+
+    def add_file(self, url, path, etag=None, last_modified=None):
+        """ダウンロード済みファイルをストアへ移し、ブロブのパスを返す（元のファイルは無くなる）"""
+        path = Path(path)
+        digest = file_digest(path)
+        size = path.stat().st_size
+        blob = self.path_for(digest)
+        with self._lock:
+            if blob.exists():
+                path.unlink()
+                self._stats['deduplicated'] += 1
+                self._stats['bytes_saved'] += size
+            else:
+                blob.parent.mkdir(exist_ok=True)
+                try:
+                    os.replace(path, blob)
+                except OSError:
+                    # 別ファイルシステムの一時ファイル
+                    shutil.move(str(path), str(blob))
+                self._stats['stored'] += 1
+            now = time.time()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO urls (url, digest, size, stored_at, etag, last_modified, checked_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (_index_url(url), digest, size, now, etag, last_modified, now)
+            )
+        return blob
+
+    def link(self, blob, dest):
+        """ブロブを dest にハードリンクする（作れなければコピー）"""
+        dest = Path(dest)
+        if dest.exists():
+            dest.unlink()
+        try:
+            os.link(blob, dest)
+            kind = 'links'
+        except OSError as e:
+            logger.debug(f"Hard link failed ({e}), copying {blob} -> {dest}")
+            shutil.copyfile(blob, dest)
+            kind = 'copies'
+        with self._lock:
+            self._stats[kind] += 1
+        return dest
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            row = self._conn.execute('SELECT COUNT(*), COUNT(DISTINCT digest) FROM urls').fetchone()
+        stats['urls'], stats['blobs'] = row
+        return stats
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_blob_store(default_root):
+    """ルートごとに共有するストア（BLOB_STORE_DIR が設定されていればそちらを使う）"""
+    root = Path(BLOB_STORE_DIR or default_root).resolve()
+    store = _stores.get(root)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(root)
+            if store is None:
+                store = _stores[root] = BlobStore(root)
+                logger.info(f"🗃️ Blob store: {root}")
+    return store
@@ -6,10 +6,25 @@ from urllib.parse import urljoin, urlparse
 from pathlib import Path
 import re
 import logging
+import threading
 from typing import Optional, Dict, List, Any
 import yaml
 from dotenv import load_dotenv
 
+from .blob_store import file_digest, get_blob_store
+from .http_client import POOL_MAXSIZE, get_session, iter_page_chunks
+from .image_prep import (VISION_IMAGE_FORMAT, VISION_IMAGE_QUALITY, VISION_MAX_EDGE, normalize_image_format,
+                         prepare_images)
+from .metrics import error_class, process_errors, process_stage_seconds, vision_upload_bytes
+from .near_dup import (NEAR_DUP_AVAILABLE, NEAR_DUP_HASH_SIZE, NEAR_DUP_MAX_COLOR_DISTANCE, NEAR_DUP_MAX_DISTANCE,
+                       NearDuplicateIndex)
+from .pipeline import PIPELINE_QUEUE_SIZE, Stage, StagedPipeline
+from .rate_limit import VISION, get_rate_limiter
+from .replay import record_response, replay_url
+from .resilience import circuit_breakers, get_retry_policy
+from .url_rules import dedupe_image_urls
+from .vision_cache import CacheRun, cache_key, get_vision_cache
+
 # Cloud環境対応の追加インポート
 try:
     from selenium import webdriver
@@ -38,8 +53,144 @@ except ImportError:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 1商品あたりの画像ダウンロードの同時実行数（output.download_concurrency で上書き可能）
+DOWNLOAD_CONCURRENCY = int(os.environ.get('DOWNLOAD_CONCURRENCY', 8))
+# 画像分析の同時実行数（実際の送信間隔は vision のレート制限で決まる）
+ANALYSIS_CONCURRENCY = int(os.environ.get('ANALYSIS_CONCURRENCY', 2))
+# 1枚の画像の上限サイズ
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
+DEFAULT_CONFIG_PATH = "config/config.yaml"
+
+# 1リクエストで分析する画像の枚数（1 なら従来どおり1枚ずつ）と、まとめるために待つ最大秒数
+VISION_BATCH_SIZE = int(os.environ.get('VISION_BATCH_SIZE', 1))
+VISION_BATCH_WAIT = float(os.environ.get('VISION_BATCH_WAIT', 0.5))
+
+# 画像分析の既定プロンプト（キャッシュのキーに含まれるので、変えると既存のキャッシュは使われなくなる）
+DEFAULT_ANALYSIS_PROMPT = """
+            この商品画像を分析して、以下の情報をJSON形式で返してください：
+            {
+                "category": "商品カテゴリー",
+                "colors": ["色1", "色2"],
+                "size_info": "サイズ情報があれば",
+                "style": "スタイル・デザインの特徴",
+                "material": "素材情報があれば",
+                "features": ["特徴1", "特徴2"],
+                "suggested_folder": "推奨フォルダ名",
+                "confidence": "分析の信頼度(0-100)"
+            }
+            """
+
+# 複数画像をまとめて送るときのプロンプト（{prompt} に1枚分の指示が入る）
+BATCH_ANALYSIS_PROMPT = """
+{count}枚の商品画像を送ります。1枚ずつ次の指示に従って分析し、
+画像と同じ順番で{count}個の要素を持つJSON配列だけを返してください。
+{prompt}
+"""
+
+def _parse_analysis_array(text, count):
+    """まとめて分析した応答から count 件の結果を取り出す（読めなければ ValueError）"""
+    match = re.search(r'\[.*\]', text, re.DOTALL)
+    if not match:
+        raise ValueError("no JSON array in response")
+    analyses = json.loads(match.group())
+    if not isinstance(analyses, list) or len(analyses) != count:
+        raise ValueError(f"expected {count} results, got {len(analyses) if isinstance(analyses, list) else 'non-list'}")
+    if not all(isinstance(analysis, dict) for analysis in analyses):
+        raise ValueError("non-object result in array")
+    return analyses
+
+def default_config():
+    """デフォルト設定を返す"""
+    return {
+        'openai': {
+            'model': 'gpt-4-vision-preview',
+            'max_tokens': 500,
+            'temperature': 0.1,
+            'batch_size': VISION_BATCH_SIZE,
+            # 送る前に長辺をこの大きさに縮小し、この形式・品質で再エンコードする
+            'max_edge': VISION_MAX_EDGE,
+            'image_format': VISION_IMAGE_FORMAT,
+            'image_quality': VISION_IMAGE_QUALITY
+        },
+        'selenium': {
+            'headless': True,
+            'timeout': 30,
+            'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+        },
+        'output': {
+            'base_dir': 'extracted_images',
+            'create_metadata': True,
+            'image_format': 'jpg',
+            'max_images_per_product': 50,
+            'download_concurrency': DOWNLOAD_CONCURRENCY,
+            'analysis_concurrency': ANALYSIS_CONCURRENCY,
+            'pipeline_queue_size': PIPELINE_QUEUE_SIZE,
+            # 知覚ハッシュのハミング距離と色ヒストグラムの距離がこの値以下の画像は代表だけを分析する（負の値で無効）
+            'near_duplicate_max_distance': NEAR_DUP_MAX_DISTANCE,
+            'near_duplicate_hash_size': NEAR_DUP_HASH_SIZE,
+            'near_duplicate_max_color_distance': NEAR_DUP_MAX_COLOR_DISTANCE
+        },
+        'site_config': {
+            'base_url': 'https://www.1688.com',
+            'delay_between_requests': 1,
+            'max_retries': 3,
+            # ホストごとのレート制限（毎秒のリクエスト数・連続で使える数）
+            'rate_limits': {
+                'detail': {'rate': 2, 'burst': 5},
+                'alicdn': {'rate': 20, 'burst': 20},
+                'vision': {'rate': 1, 'burst': 1}
+            }
+        }
+    }
+
+
+def load_config(config_path=DEFAULT_CONFIG_PATH):
+    """設定ファイルを読み込む（無い・読めない場合はデフォルト設定）"""
+    try:
+        if os.path.exists(config_path):
+            with open(config_path, 'r', encoding='utf-8') as f:
+                return yaml.safe_load(f) or default_config()
+    except Exception as e:
+        logger.warning(f"Config file error: {e}, using defaults")
+    return default_config()
+
+
+def apply_site_config(config_path=DEFAULT_CONFIG_PATH):
+    """設定ファイルの site_config でプロセス共有のレート制限と再試行ポリシーを設定する（サーバー起動時に呼ぶ）
+
+    ページ取得（fetch_page）は Extractor を作らずに共有のリミッター・ポリシーを使うため、
+    起動時に設定しておかないと site_config.rate_limits / max_retries が反映されない。
+    """
+    site_config = load_config(config_path).get('site_config')
+    get_rate_limiter(site_config)
+    get_retry_policy(site_config)
+    return site_config
+
+
+def _read_image_body(response):
+    """記録用に画像の本文を上限付きで読み込む"""
+    return b''.join(iter_page_chunks(response, max_bytes=MAX_IMAGE_BYTES, max_decoded_bytes=MAX_IMAGE_BYTES))
+
+
+def _read_json(path):
+    """JSONファイルを読む（無い・壊れている場合は None）"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class DownloadInterrupted(requests.exceptions.ConnectionError):
+    """画像の本文の途中で接続が切れた（.part に書けた分は残り、次の試行で続きから再開する）"""
+
+    def __init__(self, url, written):
+        super().__init__(f"download interrupted at {written} bytes: {url}")
+        self.written = written
+
 class Alibaba1688ImageExtractor:
-    def __init__(self, config_path="config/config.yaml", demo_mode=None):
+    def __init__(self, config_path=DEFAULT_CONFIG_PATH, demo_mode=None):
         """
         1688商品画像抽出・分類ツール
         
@@ -60,15 +211,7 @@ class Alibaba1688ImageExtractor:
         self.demo_mode = demo_mode
         
         # 設定ファイル読み込み
-        try:
-            if os.path.exists(config_path):
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    self.config = yaml.safe_load(f) or {}
-            else:
-                self.config = self.get_default_config()
-        except Exception as e:
-            logger.warning(f"Config file error: {e}, using defaults")
-            self.config = self.get_default_config()
+        self.config = load_config(config_path)
         
         # OpenAI client初期化
         self.openai_client = None
@@ -83,10 +226,29 @@ class Alibaba1688ImageExtractor:
             else:
                 logger.warning("⚠️ OpenAI API key not properly configured")
         
+        # ホストごとのレート制限（プロセス内の全Extractorで共有）
+        self.rate_limiter = get_rate_limiter(self.config.get('site_config'))
+        # 一時的なエラーの再試行（site_config.max_retries）。ページ取得と同じ共有のポリシーとブレーカーを使う
+        self.retry_policy = get_retry_policy(self.config.get('site_config'))
+        
+        # 画像分析結果の永続キャッシュ（プロセスで共有）
+        self.vision_cache = get_vision_cache()
+        
+        # 直近の organize_images の段ごとの統計と分析キャッシュのヒット状況
+        self.pipeline_stats = {}
+        self.vision_cache_stats = {}
+        self.near_duplicate_stats = {}
+        # 画像分析に送った画像の縮小前後のバイト数
+        self.upload_stats = {"images": 0, "original_bytes": 0, "sent_bytes": 0}
+        self._upload_lock = threading.Lock()
+        
         # 出力ディレクトリ設定
         self.output_dir = Path(self.config.get('output', {}).get('base_dir', 'extracted_images'))
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
+        # 画像本文はハッシュごとに1回だけ保存し、商品フォルダからはハードリンクする
+        self.blob_store = get_blob_store(self.output_dir / '.blobs')
+        
         # Selenium driver初期化
         self.driver = None
         if not self.demo_mode and SELENIUM_AVAILABLE:
@@ -96,29 +258,7 @@ class Alibaba1688ImageExtractor:
         
     def get_default_config(self):
         """デフォルト設定を返す"""
-        return {
-            'openai': {
-                'model': 'gpt-4-vision-preview',
-                'max_tokens': 500,
-                'temperature': 0.1
-            },
-            'selenium': {
-                'headless': True,
-                'timeout': 30,
-                'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-            },
-            'output': {
-                'base_dir': 'extracted_images',
-                'create_metadata': True,
-                'image_format': 'jpg',
-                'max_images_per_product': 50
-            },
-            'site_config': {
-                'base_url': 'https://www.1688.com',
-                'delay_between_requests': 1,
-                'max_retries': 3
-            }
-        }
+        return default_config()
         
     def setup_driver(self):
         """Seleniumドライバーの設定"""
@@ -162,6 +302,7 @@ class Alibaba1688ImageExtractor:
             
         try:
             logger.info(f"Extracting info from: {product_url}")
+            self.rate_limiter.acquire(product_url)
             self.driver.get(product_url)
             
             # ページロード待機
@@ -244,8 +385,8 @@ class Alibaba1688ImageExtractor:
                 logger.debug(f"Selector {selector} failed: {e}")
                 continue
         
-        # 重複削除
-        return list(dict.fromkeys(image_urls))  # 順序を保持して重複削除
+        # 重複削除（サイズ違いの同一画像もまとめ、順序を保持）
+        return dedupe_image_urls(image_urls)
     
     def _is_valid_image_url(self, url):
         """有効な画像URLかチェック"""
@@ -305,109 +446,317 @@ class Alibaba1688ImageExtractor:
         
         return url
     
-    def download_image(self, url, filepath):
-        """画像をダウンロード"""
+    def download_image(self, url, filepath, validators=None):
+        """画像をダウンロード（filepath.part に書き、完了後に置き換える）
+        
+        validators に前回の etag / last_modified を渡すと条件付きリクエストにし、変わっていなければ
+        filepath には書かずに {"status": "not_modified"} を返す。途中で切れた転送は .part の続きから
+        Range で再開する（再開も再試行の1回として数え、合計 max_retries + 1 回まで）。
+        成功時は {"status": "downloaded", "etag": ..., "last_modified": ...}、失敗時は False。
+        """
+        filepath = Path(filepath)
+        part_path = filepath.with_name(filepath.name + '.part')
         try:
-            headers = {
-                'User-Agent': self.config['selenium']['user_agent'],
-                'Referer': 'https://www.1688.com/',
-                'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
-                'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            }
-            
-            response = requests.get(url, headers=headers, timeout=30, stream=True)
-            response.raise_for_status()
-            
-            # ファイルサイズチェック
-            content_length = response.headers.get('content-length')
-            if content_length and int(content_length) > 10 * 1024 * 1024:  # 10MB制限
-                logger.warning(f"Image too large: {url}")
-                return False
-            
             # ディレクトリ作成
             filepath.parent.mkdir(parents=True, exist_ok=True)
             
-            # ファイル書き込み
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-            
-            logger.debug(f"✅ Downloaded: {filepath}")
-            return True
+            result = self.retry_policy.call(
+                url, lambda: self._download_once(url, filepath, part_path, validators), circuit_breakers
+            )
+            if isinstance(result, requests.Response):
+                # 再試行しても成功しなかった・再試行しないエラー応答
+                result.close()
+                result.raise_for_status()
+                return False
+            return result
             
         except Exception as e:
             logger.error(f"画像ダウンロードエラー {url}: {e}")
+            process_errors.inc(stage='download', error_class=error_class(e))
             return False
     
-    def analyze_image_with_openai(self, image_path, custom_instructions=""):
-        """OpenAI Vision APIで画像を分析"""
-        if not self.openai_client:
-            return self._demo_analysis(image_path)
-            
-        try:
-            with open(image_path, "rb") as image_file:
-                image_data = base64.b64encode(image_file.read()).decode('utf-8')
+    def _download_once(self, url, filepath, part_path, validators):
+        """1回分の転送（retry_policy.call の send として呼ぶ）
+        
+        本文の途中で切れたら .part はそのまま残して DownloadInterrupted を送出し、次の試行で続きから
+        再開する。エラー応答はそのまま返して再試行の判断を retry_policy に任せる。
+        """
+        headers = {
+            'User-Agent': self.config['selenium']['user_agent'],
+            'Referer': 'https://www.1688.com/',
+            'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
+            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+        }
+        
+        # 続きから再開できるのは、書き始めたときの検証子が残っている場合だけ
+        part_meta_path = part_path.with_name(part_path.name + '.json')
+        part_meta = _read_json(part_meta_path) if part_path.exists() else None
+        if_range = part_meta and (part_meta.get('etag') or part_meta.get('last_modified'))
+        offset = part_path.stat().st_size if if_range else 0
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+            headers['If-Range'] = if_range
+        elif validators:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+        
+        self.rate_limiter.acquire(url)
+        response = get_session().get(replay_url(url), headers=headers, timeout=30, stream=True)
+        self.rate_limiter.observe(url, response.status_code, response.headers)
+        if response.status_code == 416 and offset:
+            with response:
+                # Content-Range: bytes */200。.part が全体と同じ長さなら、前回は置き換える前に止まっただけ
+                total = response.headers.get('Content-Range', '').rpartition('/')[2]
+            if total.isdigit() and int(total) == offset:
+                logger.debug(f"📦 Partial download already complete: {url}")
+                return self._finish_download(part_path, filepath, part_meta.get('etag'), part_meta.get('last_modified'))
+            # 範囲が合わない .part は使えないので捨てて最初から
+            logger.warning(f"🗑️ Discarding unusable partial download ({offset} bytes): {url}")
+            part_path.unlink(missing_ok=True)
+            part_meta_path.unlink(missing_ok=True)
+            return self._download_once(url, filepath, part_path, validators)
+        if response.status_code not in (200, 206, 304):
+            return response
+        
+        with response:
+            if response.status_code == 304:
+                logger.debug(f"♻️ Not modified: {url}")
+                return {"status": "not_modified"}
             
-            default_prompt = """
-            この商品画像を分析して、以下の情報をJSON形式で返してください：
-            {
-                "category": "商品カテゴリー",
-                "colors": ["色1", "色2"],
-                "size_info": "サイズ情報があれば",
-                "style": "スタイル・デザインの特徴",
-                "material": "素材情報があれば",
-                "features": ["特徴1", "特徴2"],
-                "suggested_folder": "推奨フォルダ名",
-                "confidence": "分析の信頼度(0-100)"
-            }
-            """
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if response.status_code == 206 and offset:
+                mode = 'ab'
+                # Content-Range: bytes 100-199/200
+                total = response.headers.get('Content-Range', '').rpartition('/')[2]
+                expected = int(total) if total.isdigit() else None
+                etag, last_modified = part_meta.get('etag'), part_meta.get('last_modified')
+            else:
+                # 範囲指定が無視された・元の画像が変わった場合は最初から
+                mode = 'wb'
+                offset = 0
+                content_length = response.headers.get('content-length')
+                encoded = response.headers.get('content-encoding', 'identity') != 'identity'
+                expected = int(content_length) if content_length and not encoded else None
             
-            prompt = custom_instructions if custom_instructions else default_prompt
+            # ファイルサイズチェック
+            if expected and expected > MAX_IMAGE_BYTES:  # 10MB制限
+                logger.warning(f"Image too large: {url}")
+                return False
+            # 部分応答は記録しても再生に使えない（record_response は 200 だけ記録する）
+            record_response(url, response, read_body=_read_image_body)
+            if mode == 'wb':
+                with open(part_meta_path, 'w', encoding='utf-8') as f:
+                    json.dump({"url": url, "etag": etag, "last_modified": last_modified}, f)
             
-            response = self.openai_client.chat.completions.create(
-                model=self.config['openai']['model'],
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_data}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=self.config['openai']['max_tokens'],
-                temperature=self.config['openai']['temperature']
-            )
+            # ファイル書き込み（接続が切れたら書けた分だけ残して再開を待つ）
+            written = offset
+            try:
+                with open(part_path, mode) as f:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        if chunk:
+                            f.write(chunk)
+                            written += len(chunk)
+            except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as e:
+                raise DownloadInterrupted(url, written) from e
+            if expected is not None and written < expected:
+                raise DownloadInterrupted(url, written)
+        
+        return self._finish_download(part_path, filepath, etag, last_modified)
+    
+    def _finish_download(self, part_path, filepath, etag, last_modified):
+        os.replace(part_path, filepath)
+        part_path.with_name(part_path.name + '.json').unlink(missing_ok=True)
+        logger.debug(f"✅ Downloaded: {filepath}")
+        return {"status": "downloaded", "etag": etag, "last_modified": last_modified}
+    
+    def analyze_image_with_openai(self, image_path, custom_instructions="", content_hash=None, cache_run=None):
+        """OpenAI Vision APIで画像を分析
+        
+        結果は (画像のSHA-256, プロンプト, モデル, temperature) ごとにキャッシュする。content_hash を
+        渡せばヒット時に画像を読まない。cache_run（CacheRun）には今回の処理のヒット・ミスを数える。
+        """
+        if not self.openai_client:
+            return self._demo_analysis(image_path)
             
-            # JSONレスポンスをパース
-            analysis_text = response.choices[0].message.content
+        try:
+            prompt = custom_instructions if custom_instructions else DEFAULT_ANALYSIS_PROMPT
+            content_hash = content_hash or file_digest(image_path)
+            key = self._analysis_cache_key(content_hash, prompt)
+            cached = self.vision_cache.get(key, cache_run)
+            if cached is not None:
+                return cached
+        except Exception as e:
+            return self._analysis_error(image_path, e)
+        return self._analyze_uncached(image_path, prompt, content_hash, key)
+    
+    def analyze_images_with_openai(self, images, custom_instructions="", cache_run=None):
+        """複数の画像をまとめて分析（images は (パス, 内容のハッシュ) のリスト、結果は同じ順）
+        
+        キャッシュに無い画像を openai.batch_size 枚ずつ1リクエストで送り、JSON配列で受け取る。
+        配列として読めなければ半分に分けて送り直し、最後は1枚ずつの分析になる。
+        """
+        batch_size = self._vision_batch_size()
+        if not self.openai_client or batch_size <= 1:
+            return [self.analyze_image_with_openai(path, custom_instructions, content_hash, cache_run)
+                    for path, content_hash in images]
+        
+        prompt = custom_instructions if custom_instructions else DEFAULT_ANALYSIS_PROMPT
+        results = [None] * len(images)
+        pending = []
+        for index, (path, content_hash) in enumerate(images):
+            try:
+                content_hash = content_hash or file_digest(path)
+            except OSError as e:
+                results[index] = self._analysis_error(path, e)
+                continue
+            key = self._analysis_cache_key(content_hash, prompt)
+            cached = self.vision_cache.get(key, cache_run)
+            if cached is not None:
+                results[index] = cached
+            else:
+                pending.append((index, path, content_hash, key))
+        
+        for start in range(0, len(pending), batch_size):
+            self._analyze_batch(pending[start:start + batch_size], prompt, results)
+        return results
+    
+    def _analyze_batch(self, batch, prompt, results):
+        """batch の画像を1リクエストで分析して results に入れる（配列を読めなければ分割）"""
+        if len(batch) == 1:
+            index, path, content_hash, key = batch[0]
+            results[index] = self._analyze_uncached(path, prompt, content_hash, key)
+            return
+        
+        try:
+            text = self._vision_completion(BATCH_ANALYSIS_PROMPT.format(count=len(batch), prompt=prompt),
+                                           [path for _, path, _, _ in batch])
+        except Exception as e:
+            for index, path, _, _ in batch:
+                results[index] = self._analysis_error(path, e)
+            return
+        
+        try:
+            analyses = _parse_analysis_array(text, len(batch))
+        except ValueError as e:
+            half = len(batch) // 2
+            logger.warning(f"🪓 Batch analysis unreadable ({e}), splitting {len(batch)} images")
+            self._analyze_batch(batch[:half], prompt, results)
+            self._analyze_batch(batch[half:], prompt, results)
+            return
+        
+        model = self.config['openai']['model']
+        for (index, _, content_hash, key), analysis in zip(batch, analyses):
+            # 1枚ずつの分析と同じ形にする（応答全体ではなく、その画像の要素だけを残す）
+            analysis['raw_response'] = json.dumps(analysis, ensure_ascii=False)
+            self.vision_cache.put(key, content_hash, model, analysis)
+            results[index] = analysis
+    
+    def _analyze_uncached(self, image_path, prompt, content_hash, key):
+        """1枚を分析してキャッシュに保存（エラー時・JSONで返らなかった結果はキャッシュしない）"""
+        try:
+            analysis_text = self._vision_completion(prompt, [image_path])
             
             # JSON部分を抽出
             json_match = re.search(r'\{.*\}', analysis_text, re.DOTALL)
             if json_match:
                 analysis = json.loads(json_match.group())
                 analysis['raw_response'] = analysis_text
-                return analysis
+                self.vision_cache.put(key, content_hash, self.config['openai']['model'], analysis)
             else:
-                return {
+                # 一度読めない応答が返っても、次回は分析し直す
+                analysis = {
                     "suggested_folder": "uncategorized", 
                     "analysis": analysis_text,
                     "confidence": 50
                 }
+            return analysis
                 
         except Exception as e:
-            logger.error(f"画像分析エラー {image_path}: {e}")
-            return {
-                "suggested_folder": "error", 
-                "error": str(e),
-                "confidence": 0
-            }
+            return self._analysis_error(image_path, e)
+    
+    def _vision_completion(self, prompt, image_paths):
+        """プロンプトと画像を1リクエストで送り、応答本文を返す（画像は縮小・再エンコードしてから送る）"""
+        content = [{"type": "text", "text": prompt}]
+        for image_path, prepared in zip(image_paths, self._prepare_for_vision(image_paths)):
+            image_data = base64.b64encode(prepared.data).decode('utf-8')
+            content.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:{prepared.mime_type};base64,{image_data}"
+                }
+            })
+        
+        # OpenAI クライアントは自前で再試行するので、ここではブレーカーだけ使う
+        breaker = circuit_breakers.breaker_for(VISION)
+        breaker.before_call()
+        self.rate_limiter.acquire(VISION)
+        try:
+            response = self.openai_client.chat.completions.create(
+                model=self.config['openai']['model'],
+                messages=[{"role": "user", "content": content}],
+                # 画像ごとに同じ長さの結果が返る
+                max_tokens=self.config['openai']['max_tokens'] * len(image_paths),
+                temperature=self.config['openai']['temperature']
+            )
+        except Exception as e:
+            status = getattr(e, 'status_code', None)
+            if status is None or status == 429 or status >= 500:
+                breaker.record_failure()
+            else:
+                breaker.cancel()
+            raise
+        breaker.record_success()
+        self.rate_limiter.observe(VISION, 200)
+        return response.choices[0].message.content
+    
+    def _prepare_for_vision(self, image_paths):
+        """送信用に縮小した画像のリスト（プロセスプールで変換し、削減量を記録する）"""
+        started = time.perf_counter()
+        prepared_images = prepare_images(image_paths, **self._prep_settings())
+        elapsed = (time.perf_counter() - started) / max(1, len(image_paths))
+        for image_path, prepared in zip(image_paths, prepared_images):
+            process_stage_seconds.observe(elapsed, stage='prep')
+            vision_upload_bytes.inc(prepared.original_bytes, kind='original')
+            vision_upload_bytes.inc(len(prepared.data), kind='sent')
+            with self._upload_lock:
+                self.upload_stats["images"] += 1
+                self.upload_stats["original_bytes"] += prepared.original_bytes
+                self.upload_stats["sent_bytes"] += len(prepared.data)
+            logger.info(f"🗜️ {Path(image_path).name}: {prepared.original_bytes} → {len(prepared.data)} bytes "
+                        f"(saved {prepared.saved_bytes})")
+        return prepared_images
+    
+    def _analysis_cache_key(self, content_hash, prompt):
+        return cache_key(content_hash, prompt, self.config['openai']['model'], self.config['openai']['temperature'],
+                         self._prep_settings())
+    
+    def _prep_settings(self):
+        """送信前の縮小設定（長辺・形式・品質）"""
+        prep_config = self.config.get('openai', {})
+        return {
+            'max_edge': int(prep_config.get('max_edge', VISION_MAX_EDGE)),
+            'image_format': normalize_image_format(prep_config.get('image_format', VISION_IMAGE_FORMAT)),
+            'quality': int(prep_config.get('image_quality', VISION_IMAGE_QUALITY))
+        }
+    
+    def _analysis_error(self, image_path, e):
+        logger.error(f"画像分析エラー {image_path}: {e}")
+        # RateLimitError などは status_code と応答ヘッダーを持つ
+        self.rate_limiter.observe(VISION, getattr(e, 'status_code', None),
+                                  getattr(getattr(e, 'response', None), 'headers', None))
+        process_errors.inc(stage='vision', error_class=error_class(e))
+        return {
+            "suggested_folder": "error", 
+            "error": str(e),
+            "confidence": 0
+        }
+    
+    def _vision_batch_size(self):
+        return max(1, int(self.config.get('openai', {}).get('batch_size', VISION_BATCH_SIZE)))
     
     def _demo_analysis(self, image_path):
         """デモ用の分析結果"""
@@ -438,62 +787,231 @@ class Alibaba1688ImageExtractor:
             "analysis_method": "demo"
         }
     
-    def organize_images(self, product_info, custom_instructions=""):
-        """画像をダウンロードして分類"""
+    def organize_images(self, product_info, custom_instructions="", progress_callback=None):
+        """画像をダウンロードして分類（progress_callback にはダウンロード・分析済み件数を通知）
+
+        ダウンロード → 近似重複の判定 → 分析 → ファイル整理を上限付きキューでつないだ段階で
+        並行に処理する。見た目（形と色）がほぼ同じ画像は代表だけを分析し、残りは最後に代表の分類で
+        整理する。代表は番号の若い画像（ダウンロードの完了順によらない）。段ごとの統計は self.pipeline_stats に残す。
+        """
         product_title = re.sub(r'[^\w\s-]', '', product_info["title"])[:50]
         base_dir = self.output_dir / product_title
         base_dir.mkdir(parents=True, exist_ok=True)
         
-        results = []
+        # サイズ違いの同一画像を何度もダウンロードしない
+        image_urls = dedupe_image_urls(product_info["image_urls"])
+        if len(image_urls) < len(product_info["image_urls"]):
+            logger.info(f"🧹 Skipped {len(product_info['image_urls']) - len(image_urls)} duplicate size variants")
         
-        for i, image_url in enumerate(product_info["image_urls"]):
-            logger.info(f"処理中: 画像 {i+1}/{len(product_info['image_urls'])}")
-            
-            # 一時的にダウンロード
-            temp_filename = f"temp_image_{i}.jpg"
-            temp_path = base_dir / temp_filename
-            
-            if self.download_image(image_url, temp_path):
-                # OpenAIで分析
-                analysis = self.analyze_image_with_openai(temp_path, custom_instructions)
-                
-                # フォルダ作成
-                folder_name = analysis.get("suggested_folder", "uncategorized")
-                target_dir = base_dir / folder_name
-                target_dir.mkdir(exist_ok=True)
-                
-                # ファイル名生成
-                colors = analysis.get("colors", [])
-                color_suffix = "_" + "_".join(colors) if colors else ""
-                
-                final_filename = f"image_{i:03d}{color_suffix}.jpg"
-                final_path = target_dir / final_filename
-                
-                # ファイル移動
-                temp_path.rename(final_path)
-                
-                results.append({
-                    "image_url": image_url,
-                    "local_path": str(final_path),
-                    "analysis": analysis
-                })
-                
-                # メタデータ保存
-                if self.config['output']['create_metadata']:
-                    metadata_path = target_dir / f"{final_filename}.json"
-                    with open(metadata_path, 'w', encoding='utf-8') as f:
-                        json.dump({
-                            "url": image_url,
-                            "analysis": analysis,
-                            "timestamp": time.time()
-                        }, f, ensure_ascii=False, indent=2)
-                
-                time.sleep(self.config['site_config']['delay_between_requests'])  # API制限対策
+        progress = {"total_images": len(image_urls), "downloaded": 0, "analyzed": 0}
+        progress_lock = threading.Lock()
         
-        return results
+        def advance(field):
+            # 各段のワーカーから呼ばれるので、件数の更新と通知をまとめて直列化する
+            with progress_lock:
+                progress[field] += 1
+                if progress_callback:
+                    progress_callback(dict(progress))
+        
+        if progress_callback:
+            progress_callback(dict(progress))
+        
+        # 知覚ハッシュで近似重複をまとめる（代表のインデックス → 後回しにした画像）
+        near_duplicates = self._near_duplicate_index()
+        followers = []
+        
+        def download(item):
+            i, image_url = item
+            image_path = self._fetch_image(image_url)
+            if image_path is not None:
+                advance("downloaded")
+            elif near_duplicates is None:
+                return None
+            # 近似重複の判定は番号順に行うので、失敗した画像も番号を進めるために渡す
+            return i, image_url, image_path
+        
+        # 届いた画像を番号順に並べ直してから判定する（dedupe 段のワーカーは1つ）
+        waiting = {}
+        next_index = 0
+        
+        def dedupe(item):
+            nonlocal next_index
+            waiting[item[0]] = item
+            ready = []
+            while next_index in waiting:
+                i, image_url, image_path = waiting.pop(next_index)
+                next_index += 1
+                if image_path is None:
+                    continue
+                representative = near_duplicates.assign(i, image_path)
+                if representative is None:
+                    ready.append((i, image_url, image_path))
+                else:
+                    followers.append((i, image_url, image_path, representative))
+            return ready
+        
+        cache_run = CacheRun()
+        with self._upload_lock:
+            self.upload_stats = {"images": 0, "original_bytes": 0, "sent_bytes": 0}
+        
+        def analyze(batch):
+            # 届いた画像を openai.batch_size 枚までまとめて分析する（1枚ずつの設定なら常に1件）
+            for i, _, _ in batch:
+                logger.info(f"処理中: 画像 {i+1}/{len(image_urls)}")
+            # OpenAIで分析（ブロブのファイル名が内容のハッシュなので、キャッシュ確認に画像を読まない）
+            started = time.perf_counter()
+            analyses = self.analyze_images_with_openai(
+                [(image_path, image_path.name) for _, _, image_path in batch], custom_instructions, cache_run)
+            elapsed = (time.perf_counter() - started) / len(batch)
+            outputs = []
+            for (i, image_url, image_path), analysis in zip(batch, analyses):
+                process_stage_seconds.observe(elapsed, stage='vision')
+                advance("analyzed")
+                outputs.append((i, image_url, image_path, analysis))
+            return outputs
+        
+        def file_image(item):
+            i, image_url, image_path, analysis = item
+            with process_stage_seconds.time(stage='file_move'):
+                final_path = self._file_image(base_dir, i, image_url, image_path, analysis)
+            return i, {
+                "image_url": image_url,
+                "local_path": str(final_path),
+                "analysis": analysis
+            }
+        
+        output_config = self.config.get('output', {})
+        stages = [Stage('download', download, self._download_concurrency())]
+        if near_duplicates is not None:
+            stages.append(Stage('dedupe', dedupe, 1, fan_out=True))
+        pipeline = StagedPipeline(stages + [
+            Stage('vision', analyze, output_config.get('analysis_concurrency', ANALYSIS_CONCURRENCY),
+                  batch_size=self._vision_batch_size(), batch_wait=VISION_BATCH_WAIT),
+            Stage('file_move', file_image, 1)
+        ], queue_size=output_config.get('pipeline_queue_size', PIPELINE_QUEUE_SIZE), name='organize')
+        results = pipeline.run(enumerate(image_urls))
+        if waiting:
+            # ダウンロード段の例外で番号が欠けると、それより後の画像は判定されずに残る。自分で分析する
+            logger.warning(f"⚠️ {len(waiting)} images were not checked for near-duplicates")
+            followers.extend((i, image_url, image_path, None)
+                             for i, image_url, image_path in waiting.values() if image_path is not None)
+        
+        # 近似重複は代表の分析結果（分類フォルダ・色）を引き継ぐ。自分の分析がキャッシュにあればそれを使い、
+        # 代表の分析が失敗していれば自分で分析する
+        analyzed = {i: result for i, result in results}
+        skipped = 0
+        for i, image_url, image_path, representative in sorted(followers):
+            source = analyzed.get(representative)
+            analysis = self._cached_analysis(image_path.name, custom_instructions, cache_run)
+            if analysis is None and source is not None and "error" not in source["analysis"]:
+                analysis = dict(source["analysis"], near_duplicate_of=source["image_url"])
+                skipped += 1
+            elif analysis is None:
+                analysis = self.analyze_image_with_openai(image_path, custom_instructions,
+                                                          content_hash=image_path.name, cache_run=cache_run)
+            advance("analyzed")
+            try:
+                results.append(file_image((i, image_url, image_path, analysis)))
+            except Exception as e:
+                logger.error(f"❌ Failed to file near-duplicate {image_url}: {e}")
+                process_errors.inc(stage='file_move', error_class=error_class(e))
+        
+        self.near_duplicate_stats = near_duplicates.stats() if near_duplicates is not None else {}
+        if near_duplicates is not None:
+            self.near_duplicate_stats["analysis_calls_skipped"] = skipped
+            logger.info(f"🪞 Near-duplicates: {self.near_duplicate_stats['duplicates']} images in "
+                        f"{self.near_duplicate_stats['clusters']} clusters, "
+                        f"{self.near_duplicate_stats['analysis_calls_skipped']} analysis calls skipped")
+        self.pipeline_stats = pipeline.stats()
+        self.vision_cache_stats = cache_run.stats()
+        logger.info(f"📊 Pipeline finished in {pipeline.elapsed:.2f}s: " + ", ".join(
+            f"{name} util={stats['utilization']:.0%} max_queue={stats['max_queue_depth']}"
+            for name, stats in self.pipeline_stats.items()))
+        logger.info(f"🧠 Vision cache: {self.vision_cache_stats['hits']} hits, "
+                    f"{self.vision_cache_stats['misses']} misses")
+        
+        # ファイル名と同じく、結果も元の順番で返す
+        return [result for _, result in sorted(results, key=lambda item: item[0])]
+    
+    def _near_duplicate_index(self):
+        """この商品用の近似重複インデックス（NumPy / PIL が無い・閾値が負なら None）"""
+        output_config = self.config.get('output', {})
+        max_distance = output_config.get('near_duplicate_max_distance', NEAR_DUP_MAX_DISTANCE)
+        if not NEAR_DUP_AVAILABLE or max_distance is None or max_distance < 0:
+            return None
+        return NearDuplicateIndex(
+            max_distance,
+            output_config.get('near_duplicate_hash_size', NEAR_DUP_HASH_SIZE),
+            output_config.get('near_duplicate_max_color_distance', NEAR_DUP_MAX_COLOR_DISTANCE)
+        )
+    
+    def _cached_analysis(self, content_hash, custom_instructions, cache_run):
+        """キャッシュ済みの分析結果（無い・OpenAI を使わない設定なら None。ミスは数えない）"""
+        if not self.openai_client:
+            return None
+        prompt = custom_instructions if custom_instructions else DEFAULT_ANALYSIS_PROMPT
+        cached = self.vision_cache.get(self._analysis_cache_key(content_hash, prompt))
+        if cached is not None:
+            cache_run.record(True)
+        return cached
+    
+    def _file_image(self, base_dir, i, image_url, image_path, analysis):
+        """分析結果のフォルダにブロブをリンクし、メタデータを書く（リンク先のパスを返す）"""
+        # フォルダ作成
+        folder_name = analysis.get("suggested_folder", "uncategorized")
+        target_dir = base_dir / folder_name
+        target_dir.mkdir(exist_ok=True)
+        
+        # ファイル名生成
+        colors = analysis.get("colors", [])
+        color_suffix = "_" + "_".join(colors) if colors else ""
+        
+        final_filename = f"image_{i:03d}{color_suffix}.jpg"
+        final_path = target_dir / final_filename
+        
+        # ブロブへのハードリンク（同じ画像を商品ごとに複製しない）
+        self.blob_store.link(image_path, final_path)
+        
+        # メタデータ保存
+        if self.config['output']['create_metadata']:
+            metadata_path = target_dir / f"{final_filename}.json"
+            with open(metadata_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    "url": image_url,
+                    "analysis": analysis,
+                    "timestamp": time.time()
+                }, f, ensure_ascii=False, indent=2)
+        return final_path
+    
+    def _download_concurrency(self):
+        concurrency = self.config.get('output', {}).get('download_concurrency', DOWNLOAD_CONCURRENCY)
+        # 共有Sessionの接続プールを超えると接続が使い捨てになる
+        return max(1, min(int(concurrency), POOL_MAXSIZE))
+    
+    def _fetch_image(self, image_url):
+        """画像をブロブストアに用意してパスを返す（取得済みのURLはダウンロードしない、失敗時は None）"""
+        entry = self.blob_store.lookup(image_url)
+        if entry is not None and entry["fresh"]:
+            logger.debug(f"♻️ Blob store hit: {image_url}")
+            return entry["path"]
+        # 古くなった画像は前回の検証子で条件付きリクエスト。途中のダウンロードはURLごとのパスから再開する
+        with self.blob_store.partial_download(image_url) as temp_path:
+            # 待っている間に別のジョブが同じURLを取得し終えていればそれを使う
+            entry = self.blob_store.lookup(image_url)
+            if entry is not None and entry["fresh"]:
+                logger.debug(f"♻️ Blob store hit: {image_url}")
+                return entry["path"]
+            with process_stage_seconds.time(stage='download'):
+                downloaded = self.download_image(image_url, temp_path, validators=entry)
+            if not downloaded:
+                return None
+            if downloaded["status"] == "not_modified":
+                self.blob_store.touch(image_url)
+                return entry["path"]
+            return self.blob_store.add_file(image_url, temp_path, downloaded["etag"], downloaded["last_modified"])
     
-    def process_product(self, product_url, custom_instructions=""):
-        """商品の完全処理"""
+    def process_product(self, product_url, custom_instructions="", progress_callback=None):
+        """商品の完全処理（progress_callback は organize_images と同じ進捗通知）"""
         logger.info(f"🚀 Processing product: {product_url}")
         
         # 商品情報抽出
@@ -507,6 +1025,9 @@ class Alibaba1688ImageExtractor:
         
         # デモモードの場合は簡略化された結果を返す
         if self.demo_mode:
+            if progress_callback:
+                processed = min(10, len(product_info['image_urls']))
+                progress_callback({"total_images": processed, "downloaded": 0, "analyzed": processed})
             return {
                 "product_info": product_info,
                 "results": [
@@ -524,7 +1045,7 @@ class Alibaba1688ImageExtractor:
             }
         
         # 実際の画像処理
-        results = self.organize_images(product_info, custom_instructions)
+        results = self.organize_images(product_info, custom_instructions, progress_callback)
         
         # 全体サマリー保存
         summary_path = self.output_dir / f"{product_info['title'][:50]}" / "summary.json"
@@ -542,6 +1063,12 @@ class Alibaba1688ImageExtractor:
             "summary": {
                 "total_images": len(product_info['image_urls']),
                 "processed_images": len(results),
+                "pipeline": self.pipeline_stats,
+                "blob_store": self.blob_store.stats(),
+                "vision_cache": self.vision_cache_stats,
+                "near_duplicates": self.near_duplicate_stats,
+                "image_prep": {**self.upload_stats,
+                               "saved_bytes": self.upload_stats["original_bytes"] - self.upload_stats["sent_bytes"]},
                 "timestamp": time.time()
             }
         }
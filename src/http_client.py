@@ -0,0 +1,120 @@
+"""
+1688ページ取得用の共有HTTPクライアント
+
+プロセス全体で1つの requests.Session を共有し、keep-alive で
+detail.1688.com / alicdn への TCP+TLS 接続を再利用する。
+"""
+import os
+import threading
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .rate_limit import get_rate_limiter
+from .replay import record_response, replay_url
+from .resilience import resilient_get
+
+logger = logging.getLogger(__name__)
+
+# 商品ページ取得用ヘッダー（リクエストごとに組み立てない）
+PAGE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'none',
+    'Cache-Control': 'max-age=0'
+}
+
+# 接続プール設定（環境変数で上書き可能）
+POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', 10))  # プールを保持するホスト数
+POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 20))          # ホストごとの最大接続数
+POOL_BLOCK = os.environ.get('HTTP_POOL_BLOCK', 'false').lower() == 'true'
+CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 15))
+
+# ページ本文の上限（転送量・展開後サイズ）と読み込み単位
+MAX_PAGE_BYTES = int(os.environ.get('MAX_PAGE_BYTES', 8 * 1024 * 1024))
+MAX_DECODED_PAGE_BYTES = int(os.environ.get('MAX_DECODED_PAGE_BYTES', 16 * 1024 * 1024))
+PAGE_CHUNK_SIZE = int(os.environ.get('PAGE_CHUNK_SIZE', 64 * 1024))
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def create_session(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, pool_block=POOL_BLOCK):
+    """接続プール付きのSessionを作成"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """プロセス共有のSessionを返す（初回のみ作成）"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+                logger.info(f"🔌 HTTP session created: pool_connections={POOL_CONNECTIONS}, pool_maxsize={POOL_MAXSIZE}")
+    return _session
+
+
+def get_timeout():
+    """(接続, 読み込み) タイムアウトを返す"""
+    return (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+
+def fetch_page(url, headers=None, stream=False):
+    """共有Sessionで商品ページを取得（REPLAY_SERVER_URL 設定時は再生サーバーから）
+
+    一時的なエラーは再試行し、ホストのブレーカーが開いていれば CircuitOpenError になる。
+    """
+    request_headers = PAGE_HEADERS if not headers else {**PAGE_HEADERS, **headers}
+    rate_limiter = get_rate_limiter()
+
+    def send():
+        rate_limiter.acquire(url)
+        response = get_session().get(replay_url(url), headers=request_headers, timeout=get_timeout(), stream=stream)
+        rate_limiter.observe(url, response.status_code, response.headers)
+        return response
+
+    response = resilient_get(url, send)
+    record_response(url, response, read_body=read_page_body)
+    return response
+
+
+def iter_page_chunks(response, chunk_size=PAGE_CHUNK_SIZE, max_bytes=MAX_PAGE_BYTES,
+                     max_decoded_bytes=MAX_DECODED_PAGE_BYTES):
+    """stream=True のレスポンス本文を展開済みチャンクで返す
+
+    転送バイト数または展開後バイト数が上限を超えた時点で読み込みを打ち切る。
+    """
+    decoded = 0
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        if not chunk:
+            continue
+        decoded += len(chunk)
+        if decoded > max_decoded_bytes:
+            logger.warning(f"⚠️ Decoded page size exceeded {max_decoded_bytes} bytes, truncating: {response.url}")
+            return
+        yield chunk
+        if response.raw.tell() > max_bytes:
+            logger.warning(f"⚠️ Page transfer exceeded {max_bytes} bytes, truncating: {response.url}")
+            return
+
+
+def read_page_body(response):
+    """上限付きで本文全体を読み込む"""
+    return b''.join(iter_page_chunks(response))
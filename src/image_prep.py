@@ -0,0 +1,124 @@
+"""
+画像分析に送る前の縮小・再エンコード
+
+ダウンロードした画像（数MBの JPEG / PNG もある）をそのまま base64 にすると
+アップロードとトークンが無駄になるため、長辺を VISION_MAX_EDGE に収めて
+小さな JPEG / WebP に変換してから送る。JPEG は draft モードで縮小しながら
+デコードする。変換は CPU を使うのでプロセスプールで行い、GIL を塞がない。
+プールのプロセスは fork せずに forkserver（無ければ spawn）で起動する。
+スレッドが動いているサーバープロセスを fork すると、他のスレッドが持っていた
+ロックや SQLite の接続がそのまま子に写り、固まることがあるため。
+
+PIL が無い・画像として読めない・変換で大きくなる場合は元のバイト列を送る。
+"""
+import os
+import io
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+VISION_MAX_EDGE = int(os.environ.get('VISION_MAX_EDGE', 768))
+# PIL の形式名と違う書き方（JPG など）
+FORMAT_ALIASES = {'JPG': 'JPEG'}
+
+
+def normalize_image_format(name):
+    """設定の形式名を PIL の形式名にする（'jpg' → 'JPEG'、'webp' → 'WEBP'）"""
+    name = name.upper()
+    return FORMAT_ALIASES.get(name, name)
+
+
+VISION_IMAGE_FORMAT = normalize_image_format(os.environ.get('VISION_IMAGE_FORMAT', 'JPEG'))
+VISION_IMAGE_QUALITY = int(os.environ.get('VISION_IMAGE_QUALITY', 80))
+# 0 ならプロセスプールを使わずその場で変換する
+VISION_PREP_WORKERS = int(os.environ.get('VISION_PREP_WORKERS', min(4, os.cpu_count() or 1)))
+
+MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp', 'PNG': 'image/png', 'GIF': 'image/gif'}
+
+
+class PreparedImage:
+    """送信用に変換した画像"""
+
+    def __init__(self, data, mime_type, original_bytes):
+        self.data = data
+        self.mime_type = mime_type
+        self.original_bytes = original_bytes
+
+    @property
+    def saved_bytes(self):
+        return self.original_bytes - len(self.data)
+
+
+def prepare_image(path, max_edge=VISION_MAX_EDGE, image_format=VISION_IMAGE_FORMAT, quality=VISION_IMAGE_QUALITY):
+    """長辺を max_edge に収めて再エンコードし、(バイト列, MIMEタイプ, 元のバイト数) を返す
+
+    プロセスプールから呼ばれるので、引数と戻り値は pickle できる値だけにする。
+    """
+    with open(path, 'rb') as f:
+        original = f.read()
+    if not PIL_AVAILABLE:
+        return original, 'image/jpeg', len(original)
+    try:
+        with Image.open(io.BytesIO(original)) as image:
+            source_format = image.format
+            if source_format == 'JPEG':
+                # DCT の段階で 1/2・1/4・1/8 に縮小してデコードする（全画素を展開しない）
+                image.draft('RGB', (max_edge, max_edge))
+            image.thumbnail((max_edge, max_edge))
+            if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+                # 透過は白背景に合成（JPEG は透過を持てない）
+                rgba = image.convert('RGBA')
+                image = Image.new('RGB', rgba.size, (255, 255, 255))
+                image.paste(rgba, mask=rgba.getchannel('A'))
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+            buffer = io.BytesIO()
+            image.save(buffer, format=image_format, quality=quality, optimize=True)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not downscale {path}: {e}")
+        return original, 'image/jpeg', len(original)
+    data = buffer.getvalue()
+    if len(data) >= len(original) and source_format in MIME_TYPES:
+        return original, MIME_TYPES[source_format], len(original)
+    return data, MIME_TYPES.get(image_format, 'image/jpeg'), len(original)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_prep_pool():
+    """プロセス共有の変換用プール（初回のみ作成、VISION_PREP_WORKERS=0 なら None）"""
+    global _pool
+    if VISION_PREP_WORKERS <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                methods = multiprocessing.get_all_start_methods()
+                start_method = 'forkserver' if 'forkserver' in methods else 'spawn'
+                _pool = ProcessPoolExecutor(max_workers=VISION_PREP_WORKERS,
+                                            mp_context=multiprocessing.get_context(start_method))
+                logger.info(f"🗜️ Image prep pool: {VISION_PREP_WORKERS} processes ({start_method}), "
+                            f"max edge {VISION_MAX_EDGE}px")
+    return _pool
+
+
+def prepare_images(paths, max_edge=VISION_MAX_EDGE, image_format=VISION_IMAGE_FORMAT, quality=VISION_IMAGE_QUALITY):
+    """複数の画像を並行に変換して PreparedImage のリストを返す（順番は paths と同じ）"""
+    pool = get_prep_pool()
+    if pool is None or len(paths) == 0:
+        results = [prepare_image(path, max_edge, image_format, quality) for path in paths]
+    else:
+        futures = [pool.submit(prepare_image, str(path), max_edge, image_format, quality) for path in paths]
+        results = [future.result() for future in futures]
+    return [PreparedImage(*result) for result in results]
@@ -0,0 +1,229 @@
+"""
+商品処理（process_product）のバックグラウンドジョブ
+
+ダウンロード → 画像分析 → 整理は数分かかることがあるため、Webリクエストでは
+ジョブIDだけを返し、上限付きのワーカープールで実行する。ジョブの状態と
+進捗（ダウンロード済み・分析済み件数）は SQLite に保存し、再起動時には
+未完了のジョブをキューに戻す。
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+JOB_DB_PATH = os.environ.get('JOB_DB_PATH', 'jobs.db')
+JOB_MAX_WORKERS = int(os.environ.get('JOB_MAX_WORKERS', 2))
+JOB_MAX_QUEUED = int(os.environ.get('JOB_MAX_QUEUED', 100))
+JOB_LIST_LIMIT = 50
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    custom_instructions TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL,
+    total_images INTEGER NOT NULL DEFAULT 0,
+    downloaded INTEGER NOT NULL DEFAULT 0,
+    analyzed INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    summary TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+'''
+
+PROGRESS_FIELDS = ('total_images', 'downloaded', 'analyzed')
+
+
+class QueueFullError(Exception):
+    """未完了のジョブが上限に達している"""
+
+
+class JobStore:
+    """ジョブの永続ストア（SQLite、スレッドセーフ）"""
+
+    def __init__(self, path=JOB_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+
+    def create(self, url, custom_instructions='', max_active=None):
+        """ジョブを登録してIDを返す（max_active を超える場合は QueueFullError）"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            if max_active is not None and self._count_active() >= max_active:
+                raise QueueFullError(f'未完了のジョブが上限（{max_active}件）に達しています')
+            self._conn.execute(
+                'INSERT INTO jobs (id, url, custom_instructions, status, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, url, custom_instructions or '', QUEUED, now, now)
+            )
+        return job_id
+
+    def _count_active(self):
+        row = self._conn.execute(
+            'SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)', ACTIVE_STATUSES
+        ).fetchone()
+        return row[0]
+
+    def mark_running(self, job_id):
+        self._update(job_id, 'status = ?, attempts = attempts + 1', (RUNNING,))
+
+    def update_progress(self, job_id, progress):
+        fields = [(name, int(progress[name])) for name in PROGRESS_FIELDS if name in progress]
+        if fields:
+            assignments = ', '.join(f'{name} = ?' for name, _ in fields)
+            self._update(job_id, assignments, tuple(value for _, value in fields))
+
+    def mark_succeeded(self, job_id, summary):
+        self._update(job_id, 'status = ?, summary = ?, error = NULL',
+                     (SUCCEEDED, json.dumps(summary, ensure_ascii=False)))
+
+    def mark_failed(self, job_id, error):
+        self._update(job_id, 'status = ?, error = ?', (FAILED, error))
+
+    def _update(self, job_id, assignments, values):
+        with self._lock:
+            self._conn.execute(f'UPDATE jobs SET {assignments}, updated_at = ? WHERE id = ?',
+                               values + (time.time(), job_id))
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def recent(self, status=None, limit=JOB_LIST_LIMIT):
+        """新しい順にジョブを返す"""
+        query = 'SELECT * FROM jobs'
+        params = ()
+        if status:
+            query += ' WHERE status = ?'
+            params = (status,)
+        query += ' ORDER BY created_at DESC LIMIT ?'
+        with self._lock:
+            rows = self._conn.execute(query, params + (limit,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def unfinished(self):
+        """再起動時にキューへ戻すジョブ（登録順）"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at', ACTIVE_STATUSES
+            ).fetchall()
+        return [row['id'] for row in rows]
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    @staticmethod
+    def _to_dict(row):
+        job = dict(row)
+        job['summary'] = json.loads(job['summary']) if job['summary'] else None
+        job['progress'] = {name: job.pop(name) for name in PROGRESS_FIELDS}
+        return job
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JobQueue:
+    """上限付きワーカープールでジョブを実行する
+
+    runner(url, custom_instructions, progress_callback) は要約の dict を返すか、
+    失敗時に例外を投げる。
+    """
+
+    def __init__(self, store, runner, max_workers=JOB_MAX_WORKERS, max_queued=JOB_MAX_QUEUED):
+        self.store = store
+        self.runner = runner
+        self.max_queued = max_queued
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-worker')
+
+    def resume(self):
+        """前回の実行で終わらなかったジョブを再投入"""
+        job_ids = self.store.unfinished()
+        for job_id in job_ids:
+            self._executor.submit(self._run, job_id)
+        if job_ids:
+            logger.info(f"🔁 Resumed {len(job_ids)} unfinished jobs")
+        return len(job_ids)
+
+    def submit(self, url, custom_instructions=''):
+        """ジョブを登録して実行キューに入れ、ジョブIDを返す"""
+        job_id = self.store.create(url, custom_instructions, max_active=self.max_queued)
+        self._executor.submit(self._run, job_id)
+        logger.info(f"📝 Job queued: {job_id} {url}")
+        return job_id
+
+    def _run(self, job_id):
+        job = self.store.get(job_id)
+        if job is None or job['status'] not in ACTIVE_STATUSES:
+            return
+        self.store.mark_running(job_id)
+        logger.info(f"🏃 Job started: {job_id}")
+
+        def progress_callback(progress):
+            self.store.update_progress(job_id, progress)
+
+        try:
+            summary = self.runner(job['url'], job['custom_instructions'], progress_callback)
+        except Exception as e:
+            logger.error(f"❌ Job failed: {job_id}: {e}")
+            self.store.mark_failed(job_id, str(e))
+            return
+        self.store.mark_succeeded(job_id, summary)
+        logger.info(f"✅ Job finished: {job_id}")
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+def summarize_result(result):
+    """process_product の結果からジョブに保存する要約を作る"""
+    summary = dict(result.get('summary', {}))
+    summary['title'] = result['product_info'].get('title')
+    summary['images'] = [
+        {
+            'image_url': item.get('image_url'),
+            'local_path': item.get('local_path'),
+            'folder': item.get('analysis', {}).get('suggested_folder')
+        }
+        for item in result.get('results', [])
+    ]
+    return summary
+
+
+def run_product_job(url, custom_instructions, progress_callback):
+    """既定のジョブ実行関数: ジョブごとに Extractor を作成して process_product を実行"""
+    from .extractor import create_extractor
+
+    extractor = create_extractor()
+    try:
+        result = extractor.process_product(url, custom_instructions, progress_callback=progress_callback)
+    finally:
+        extractor.close()
+    if not result:
+        raise RuntimeError('商品情報の取得に失敗しました')
+    return summarize_result(result)
@@ -0,0 +1,229 @@
+"""
+Prometheus テキスト形式のメトリクス
+
+抽出パイプライン（取得・解析・セレクタ走査・スクリプト走査・URL正規化）と
+商品処理（ダウンロード・近似重複判定・縮小・画像分析・ファイル移動）の段階別の所要時間、
+ページサイズ、候補数、エラー種別を集計し、/metrics で公開する。
+
+ラベル値は定義時に列挙した値だけを受け付け、それ以外は 'other' に
+まとめるので、系列数が入力に応じて増えることはない。
+"""
+import time
+import threading
+from contextlib import contextmanager
+
+import requests
+
+OTHER = 'other'
+
+# 所要時間（秒）・ページサイズ（バイト）・候補数のバケット
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PAGE_SIZE_BUCKETS = (16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024)
+COUNT_BUCKETS = (0, 1, 5, 10, 20, 50, 100, 250, 500, 1000, 5000)
+
+EXTRACT_STAGES = ('fetch', 'parse', 'selector_scan', 'script_scan', 'url_normalize')
+EXTRACT_OUTCOMES = ('success', 'cache_hit', 'not_modified', 'error')
+CANDIDATE_SOURCES = ('offer_data', 'dom', 'script')
+PROCESS_STAGES = ('download', 'dedupe', 'prep', 'vision', 'file_move')
+UPLOAD_KINDS = ('original', 'sent')
+ERROR_CLASSES = ('timeout', 'connection', 'circuit_open', 'http_4xx', 'http_5xx', 'too_large', 'decode', OTHER)
+SERVICES = ('detail', 'alicdn', 'vision')
+CIRCUIT_STATES = ('closed', 'open', 'half_open')
+
+
+def error_class(error):
+    """例外を有限個のエラー種別に分類"""
+    if type(error).__name__ == 'CircuitOpenError':
+        return 'circuit_open'
+    if isinstance(error, requests.exceptions.Timeout) or isinstance(error, TimeoutError):
+        return 'timeout'
+    if isinstance(error, requests.exceptions.HTTPError):
+        status = getattr(error.response, 'status_code', None) or 0
+        return 'http_5xx' if status >= 500 else 'http_4xx'
+    if isinstance(error, (requests.exceptions.ConnectionError, ConnectionError)):
+        return 'connection'
+    if isinstance(error, ValueError):
+        return 'decode'
+    name = type(error).__name__
+    if 'Timeout' in name:
+        return 'timeout'
+    if 'TooLarge' in name:
+        return 'too_large'
+    if 'Connect' in name:
+        return 'connection'
+    status = getattr(error, 'status', None)
+    if isinstance(status, int) and status >= 400:
+        return 'http_5xx' if status >= 500 else 'http_4xx'
+    return OTHER
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """ラベル値を列挙済みの値に制限するメトリクスの基底クラス"""
+
+    metric_type = None
+
+    def __init__(self, name, documentation, labels=None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels or {}
+        self.label_names = tuple(self.labels)
+        self._allowed = {name: frozenset(values) for name, values in self.labels.items()}
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _key(self, label_values):
+        if set(label_values) != set(self.label_names):
+            raise ValueError(f'{self.name}: labels must be {self.label_names}')
+        return tuple(
+            value if value in self._allowed[name] else OTHER
+            for name, value in ((name, str(label_values[name])) for name in self.label_names)
+        )
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+        with self._lock:
+            series = sorted(self._series.items())
+            for key, value in series:
+                lines.extend(self._render_series(list(zip(self.label_names, key)), value))
+        return lines
+
+
+class Counter(_Metric):
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **label_values):
+        key = self._key(label_values)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def _render_series(self, pairs, value):
+        return [f'{self.name}_total{_format_labels(pairs)} {_format_value(value)}']
+
+
+class Histogram(_Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labels=None, buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **label_values):
+        key = self._key(label_values)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def totals(self):
+        """ラベル値ごとの (合計, 件数)"""
+        with self._lock:
+            return {key: (series[1], series[2]) for key, series in self._series.items()}
+
+    @contextmanager
+    def time(self, **label_values):
+        """with ブロックの所要時間（秒）を記録"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **label_values)
+
+    def _render_series(self, pairs, series):
+        counts, total, count = series
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            labels = _format_labels(pairs + [('le', _format_value(float(bound)))])
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        lines.append(f'{self.name}_sum{_format_labels(pairs)} {_format_value(total)}')
+        lines.append(f'{self.name}_count{_format_labels(pairs)} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    """メトリクスの登録と一括出力"""
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labels=None):
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=None, buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+# --- 画像抽出（extract_1688_images）---
+extract_stage_seconds = registry.histogram(
+    'extract_stage_seconds', 'Time spent in each extraction stage.',
+    labels={'stage': EXTRACT_STAGES})
+extract_page_bytes = registry.histogram(
+    'extract_page_bytes', 'Size of fetched offer pages in bytes.',
+    buckets=PAGE_SIZE_BUCKETS)
+extract_candidates = registry.histogram(
+    'extract_candidates', 'Image URL candidates found per page.',
+    labels={'source': CANDIDATE_SOURCES}, buckets=COUNT_BUCKETS)
+extract_requests = registry.counter(
+    'extract_requests', 'Extractions by outcome.',
+    labels={'outcome': EXTRACT_OUTCOMES})
+extract_errors = registry.counter(
+    'extract_errors', 'Failed extractions by error class.',
+    labels={'error_class': ERROR_CLASSES})
+
+# --- 商品処理（process_product）---
+process_stage_seconds = registry.histogram(
+    'process_stage_seconds', 'Time spent per image in each processing stage.',
+    labels={'stage': PROCESS_STAGES})
+process_errors = registry.counter(
+    'process_errors', 'Per-image processing failures by stage and error class.',
+    labels={'stage': PROCESS_STAGES, 'error_class': ERROR_CLASSES})
+vision_upload_bytes = registry.counter(
+    'vision_upload_bytes', 'Image bytes before (original) and after (sent) downscaling for vision analysis.',
+    labels={'kind': UPLOAD_KINDS})
+
+# --- 外向きリクエスト（再試行・サーキットブレーカー）---
+outbound_retries = registry.counter(
+    'outbound_retries', 'Retried outbound requests by service.',
+    labels={'service': SERVICES})
+circuit_transitions = registry.counter(
+    'circuit_breaker_transitions', 'Circuit breaker state changes by new state.',
+    labels={'state': CIRCUIT_STATES})
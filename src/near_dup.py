@@ -0,0 +1,107 @@
+"""
+知覚ハッシュによる近似重複画像のまとめ
+
+1688 のギャラリーと詳細欄には、トリミング・透かし・再圧縮だけが違う同じ写真が
+URLを変えて何度も載っている。小さなサムネイルから dHash（隣り合う画素の明暗）
+を NumPy で計算し、ハミング距離が閾値以下の画像を同じクラスタにまとめる。
+クラスタの代表だけを画像分析に送り、残りは代表の分類を引き継ぐ。
+
+dHash は明暗しか見ないので、同じ型の色違い（赤と青のシャツ）も近くなる。
+チャンネルごとの色ヒストグラムも比べ、色が違う画像はまとめない。
+既定では無効（NEAR_DUP_MAX_DISTANCE が負）。
+"""
+import os
+import logging
+import threading
+
+try:
+    import numpy as np
+    from PIL import Image
+    NEAR_DUP_AVAILABLE = True
+except ImportError:
+    NEAR_DUP_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# ハッシュの一辺（hash_size^2 ビット）と、同じ画像とみなすハミング距離の上限（負の値で無効）
+NEAR_DUP_HASH_SIZE = int(os.environ.get('NEAR_DUP_HASH_SIZE', 8))
+NEAR_DUP_MAX_DISTANCE = int(os.environ.get('NEAR_DUP_MAX_DISTANCE', -1))
+# 色ヒストグラムの距離の上限（チャンネルごとの分布の差 0〜1 の最大値）
+NEAR_DUP_MAX_COLOR_DISTANCE = float(os.environ.get('NEAR_DUP_MAX_COLOR_DISTANCE', 0.2))
+COLOR_BINS = 8
+COLOR_THUMBNAIL_SIZE = 32
+
+
+def fingerprint(path, hash_size=NEAR_DUP_HASH_SIZE):
+    """画像の dHash（hash_size^2 個の bool）と、R・G・B それぞれの色ヒストグラム（3 x COLOR_BINS）を返す"""
+    with Image.open(path) as image:
+        if image.format == 'JPEG':
+            # 縮小しながらデコード（サムネイルしか使わない）
+            image.draft('RGB', (hash_size * 8, hash_size * 8))
+        rgb = image.convert('RGB')
+    thumbnail = rgb.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+
+    colors = np.asarray(rgb.resize((COLOR_THUMBNAIL_SIZE, COLOR_THUMBNAIL_SIZE), Image.BILINEAR))
+    bins = colors.reshape(-1, 3) // (256 // COLOR_BINS)
+    histogram = np.stack([np.bincount(bins[:, channel], minlength=COLOR_BINS) for channel in range(3)])
+    return bits, histogram / len(bins)
+
+
+def dhash(path, hash_size=NEAR_DUP_HASH_SIZE):
+    """画像の dHash を hash_size^2 個の bool の配列で返す"""
+    return fingerprint(path, hash_size)[0]
+
+
+class NearDuplicateIndex:
+    """代表画像のハッシュを持ち、新しい画像を既存のクラスタに割り当てる（スレッドセーフ）"""
+
+    def __init__(self, max_distance=NEAR_DUP_MAX_DISTANCE, hash_size=NEAR_DUP_HASH_SIZE,
+                 max_color_distance=NEAR_DUP_MAX_COLOR_DISTANCE):
+        self.max_distance = max_distance
+        self.hash_size = hash_size
+        self.max_color_distance = max_color_distance
+        self._hashes = np.zeros((0, hash_size * hash_size), dtype=bool)
+        self._histograms = np.zeros((0, 3, COLOR_BINS))
+        self._keys = []
+        self._lock = threading.Lock()
+        self.duplicates = 0
+        self.unreadable = 0
+
+    def assign(self, key, path):
+        """path の画像が既存の代表に近ければその代表のキー、そうでなければ None（自分が代表になる）
+
+        形（dHash のハミング距離）と色（ヒストグラムの距離）の両方が閾値以下の代表のうち、最も形が近いもの。
+        """
+        try:
+            bits, histogram = fingerprint(path, self.hash_size)
+        except Exception as e:
+            logger.debug(f"Perceptual hash failed for {path}: {e}")
+            with self._lock:
+                self.unreadable += 1
+            return None
+        with self._lock:
+            if len(self._keys):
+                # 全代表との距離を一度に計算（色が違う代表は候補から外す）
+                distances = np.count_nonzero(self._hashes != bits, axis=1)
+                color_distances = np.abs(self._histograms - histogram).sum(axis=2).max(axis=1) / 2
+                distances[color_distances > self.max_color_distance] = self._hashes.shape[1] + 1
+                nearest = int(np.argmin(distances))
+                if distances[nearest] <= self.max_distance:
+                    self.duplicates += 1
+                    return self._keys[nearest]
+            self._hashes = np.vstack([self._hashes, bits])
+            self._histograms = np.concatenate([self._histograms, histogram[np.newaxis]])
+            self._keys.append(key)
+            return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'clusters': len(self._keys),
+                'duplicates': self.duplicates,
+                'unreadable': self.unreadable,
+                'max_distance': self.max_distance,
+                'max_color_distance': self.max_color_distance
+            }
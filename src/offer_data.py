@@ -0,0 +1,118 @@
+"""
+商品ページに埋め込まれたオファーデータ（JSON）の構造化抽出
+
+1688の詳細ページは window.__INIT_DATA / iDetailData などに商品モデル全体
+（ギャラリー・SKU画像・詳細説明URL）をJSONで持っている。汎用の正規表現で
+拾い直す代わりに、そのブロブを1回だけパースして画像リストを直接読む。
+imageURI などは CDN からの相対パス（img/ibank/...）のことがあるので、画像CDNのURLにする。
+"""
+import json
+import re
+from collections import deque
+
+# 代入式の直後から JSON オブジェクトが始まるブロブ
+BLOB_MARKERS = r'(?:window\.(?:__INIT_DATA|__GLOBAL_DATA|runParams)|iDetailData|iDetailConfig)\s*=\s*(?=\{)'
+BLOB_PATTERN = re.compile(BLOB_MARKERS)
+BLOB_PATTERN_BYTES = re.compile(BLOB_MARKERS.encode('ascii'))
+SCRIPT_END = '</script'
+
+# 画像リストを持つキー
+GALLERY_LIST_KEYS = frozenset(['offerImgList', 'mainImage', 'images', 'imageList'])
+GALLERY_ITEM_KEYS = ('fullPathImageURI', 'originalImageURI', 'imageURI')
+SKU_PROPS_KEY = 'skuProps'
+SKU_IMAGE_KEY = 'imageUrl'
+DESCRIPTION_KEYS = frozenset(['detailUrl', 'descUrl'])
+TITLE_KEYS = frozenset(['subject', 'offerTitle'])
+# 相対パスの画像（img/ibank/O1CN01....jpg）を置いているCDN
+IMAGE_CDN_BASE = 'https://cbu01.alicdn.com/'
+
+_decoder = json.JSONDecoder()
+
+
+class OfferData:
+    """埋め込みデータから読み取った商品情報"""
+
+    def __init__(self):
+        self.title = None
+        self.gallery = []
+        self.sku_images = []
+        self.description_url = None
+        self.blob_count = 0
+
+    @property
+    def image_urls(self):
+        """ギャラリー → SKU画像の順で重複なしの画像URL"""
+        return list(dict.fromkeys(self.gallery + self.sku_images))
+
+    def __bool__(self):
+        return bool(self.gallery or self.sku_images)
+
+
+def resolve_image_uri(uri):
+    """CDNからの相対パスを絶対URLにする（絶対URL・プロトコル相対URLはそのまま）"""
+    uri = uri.strip()
+    if not uri or uri.startswith(('http://', 'https://', '//')):
+        return uri
+    return IMAGE_CDN_BASE + uri.lstrip('/')
+
+
+def iter_blobs(data):
+    """文字列またはバイト列から埋め込みJSONブロブを順にパースして返す"""
+    is_bytes = isinstance(data, (bytes, bytearray))
+    pattern = BLOB_PATTERN_BYTES if is_bytes else BLOB_PATTERN
+    end_marker = SCRIPT_END.encode('ascii') if is_bytes else SCRIPT_END
+    for match in pattern.finditer(data):
+        start = match.end()
+        end = data.find(end_marker, start)
+        segment = data[start:end if end != -1 else len(data)]
+        if is_bytes:
+            segment = segment.decode('utf-8', 'replace')
+        try:
+            blob, _ = _decoder.raw_decode(segment)
+        except ValueError:
+            # JSONでないJSオブジェクトリテラルは正規表現スキャンに任せる
+            continue
+        yield blob
+
+
+def _collect(blob, offer):
+    """ブロブを走査して既知のキーから画像・タイトル・説明URLを集める"""
+    queue = deque([blob])
+    while queue:
+        node = queue.popleft()
+        if isinstance(node, list):
+            queue.extend(node)
+            continue
+        if not isinstance(node, dict):
+            continue
+        for key, value in node.items():
+            if key in GALLERY_LIST_KEYS and isinstance(value, list):
+                for item in value:
+                    if isinstance(item, dict):
+                        item = next((item[k] for k in GALLERY_ITEM_KEYS if isinstance(item.get(k), str)), None)
+                    if isinstance(item, str) and item.strip():
+                        offer.gallery.append(resolve_image_uri(item))
+            elif key == SKU_PROPS_KEY and isinstance(value, list):
+                for prop in value:
+                    values = prop.get('value') if isinstance(prop, dict) else None
+                    for sku in values if isinstance(values, list) else ():
+                        if isinstance(sku, dict) and isinstance(sku.get(SKU_IMAGE_KEY), str):
+                            offer.sku_images.append(resolve_image_uri(sku[SKU_IMAGE_KEY]))
+            elif key in DESCRIPTION_KEYS and isinstance(value, str):
+                offer.description_url = offer.description_url or value
+            elif key in TITLE_KEYS and isinstance(value, str) and value.strip():
+                offer.title = offer.title or value.strip()
+            elif isinstance(value, (dict, list)):
+                queue.append(value)
+
+
+def extract_offer_data(sources):
+    """HTML本文（バイト列）または<script>本文の列から OfferData を作る"""
+    if isinstance(sources, (str, bytes, bytearray)):
+        sources = [sources]
+    offer = OfferData()
+    for source in sources:
+        for blob in iter_blobs(source):
+            offer.blob_count += 1
+            _collect(blob, offer)
+    return offer
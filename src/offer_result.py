@@ -0,0 +1,149 @@
+"""
+取得済みの商品ページ本文から抽出結果を組み立てる
+
+同期版（main.extract_1688_images）と非同期版（src.async_app）で共有する
+CPUバウンドな処理。I/O は行わないので、非同期版ではこの関数群を
+実行プール上で呼び出す。
+"""
+import time
+import logging
+from collections import OrderedDict
+
+from .metrics import extract_candidates, extract_stage_seconds
+from .offer_data import extract_offer_data
+from .page_parser import collect_page_candidates
+from .script_scanner import script_rule_stats, script_scanner
+from .url_rules import CanonicalImageSet
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TITLE = "1688商品"
+MAX_TITLE_LENGTH = 100
+
+
+def parse_offer_page(content):
+    """本文から埋め込みオファーデータを読み、タイトルが取れなければDOMを解析する"""
+    with extract_stage_seconds.time(stage='parse'):
+        offer_data = extract_offer_data(content)
+    candidates = None
+    if not (offer_data and offer_data.title):
+        with extract_stage_seconds.time(stage='selector_scan'):
+            candidates = collect_page_candidates(content, collect_scripts=False)
+    return offer_data, candidates
+
+
+def scan_script_candidates(content, scripts):
+    """<script>内の候補URLを集める（本文があれば生バイト列のまま走査）"""
+    if content is not None:
+        return script_scanner.scan_html(content)
+    found = OrderedDict()
+    for script_text in scripts:
+        script_scanner.scan(script_text, found=found)
+    return found
+
+
+def build_offer_result(url, offer_data, candidates, content=None):
+    """オファーデータとDOM候補から全件の抽出結果を作る（件数の切り詰めは limit_result で行う）"""
+    # 商品タイトル抽出
+    title = offer_data.title or (candidates.title if candidates else None)
+    product_title = title[:MAX_TITLE_LENGTH] if title else DEFAULT_TITLE
+
+    logger.info(f"📋 Product title: {product_title}")
+
+    # 画像URL抽出 - 複数の方法を試行（サイズ違いは正規キーでまとめ、初出順を保つ）
+    image_urls = CanonicalImageSet()
+    normalize_seconds = 0.0
+
+    structured = False
+    if offer_data:
+        # 方法1: 埋め込みオファーデータ（ギャラリー・SKU画像）から直接読む
+        logger.info(f"🧩 Offer data found: gallery={len(offer_data.gallery)}, sku={len(offer_data.sku_images)}")
+        sources = offer_data.image_urls
+        extract_candidates.observe(len(sources), source='offer_data')
+        started = time.perf_counter()
+        for src in sources:
+            image_urls.add(src)
+        normalize_seconds += time.perf_counter() - started
+        structured = len(image_urls) > 0
+        if not structured:
+            logger.info("🧩 Offer data had no valid image URLs, falling back to page scan")
+
+    if not structured:
+        # フォールバック1: img タグから直接抽出（セレクタ優先順）
+        if candidates is None:
+            with extract_stage_seconds.time(stage='selector_scan'):
+                candidates = collect_page_candidates(content, collect_scripts=False)
+        extract_candidates.observe(len(candidates.image_sources), source='dom')
+        started = time.perf_counter()
+        for src in candidates.image_sources:
+            image_urls.add(src)
+        normalize_seconds += time.perf_counter() - started
+
+        # フォールバック2: JavaScript data から抽出（<script>本文をルールごとに走査）
+        with extract_stage_seconds.time(stage='script_scan'):
+            script_candidates = scan_script_candidates(content, candidates.scripts)
+        extract_candidates.observe(len(script_candidates), source='script')
+        started = time.perf_counter()
+        for candidate, rule in script_candidates.items():
+            script_rule_stats.record(rule, image_urls.add(candidate))
+        normalize_seconds += time.perf_counter() - started
+
+    extract_stage_seconds.observe(normalize_seconds, stage='url_normalize')
+
+    # 高解像度版URLとサイズは正規化レコードに計算済み
+    enhanced_images = []
+    for i, record in enumerate(image_urls.records()):
+        enhanced_images.append({
+            'url': record.high_res_url,
+            'original_url': record.clean_url,
+            'index': i + 1,
+            'type': classify_image_type(record.clean_url, i),
+            'size': record.size
+        })
+
+    logger.info(f"🖼️ Found {len(enhanced_images)} images")
+
+    result = {
+        'success': True,
+        'title': product_title,
+        'url': url,
+        'images': enhanced_images,
+        'total_found': len(image_urls),
+        'extracted_count': len(enhanced_images),
+        'extraction_method': 'structured' if structured else 'scraped'
+    }
+    if offer_data.description_url:
+        result['description_url'] = offer_data.description_url
+    return result
+
+
+def extract_from_content(url, content):
+    """本文全体から抽出結果を作る（非同期版から実行プール経由で呼ぶ）"""
+    offer_data, candidates = parse_offer_page(content)
+    return build_offer_result(url, offer_data, candidates, content)
+
+
+def limit_result(result, url, max_images):
+    """全件の抽出結果を max_images 件に切り詰めたコピーを返す"""
+    if not result.get('success'):
+        return result
+    images = result['images'][:max_images]
+    return dict(result, url=url, images=images, extracted_count=len(images))
+
+
+def classify_image_type(url, index):
+    """画像の種類を分類"""
+    url_lower = url.lower()
+
+    if any(keyword in url_lower for keyword in ['main', 'primary', 'hero']):
+        return 'メイン画像'
+    elif any(keyword in url_lower for keyword in ['detail', 'zoom', 'large']):
+        return '詳細画像'
+    elif any(keyword in url_lower for keyword in ['thumb', 'small', 'mini']):
+        return 'サムネイル'
+    elif index < 3:
+        return 'メイン画像'
+    elif index < 8:
+        return '詳細画像'
+    else:
+        return 'その他'
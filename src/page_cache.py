@@ -0,0 +1,123 @@
+"""
+商品ページ単位の抽出結果キャッシュ
+
+detail.1688.com/offer/<id>.html の商品IDをキーに、extract_1688_images の
+結果をTTL付き・件数上限付き（LRU）で保持する。期限切れのエントリは
+ETag / Last-Modified による条件付きリクエストで再検証し、失敗結果は
+短時間だけネガティブキャッシュして上流への連続アクセスを防ぐ。
+"""
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+
+OFFER_ID_PATTERN = re.compile(r'detail\.1688\.com/offer/(\d+)\.html', re.IGNORECASE)
+
+PAGE_CACHE_TTL = float(os.environ.get('PAGE_CACHE_TTL', 600))
+PAGE_CACHE_MAX_ENTRIES = int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 512))
+PAGE_CACHE_NEGATIVE_TTL = float(os.environ.get('PAGE_CACHE_NEGATIVE_TTL', 30))
+
+
+def canonical_offer_id(url):
+    """URLから商品IDを取り出す（クエリ違いは同一IDになる）"""
+    if not url:
+        return None
+    match = OFFER_ID_PATTERN.search(url)
+    return match.group(1) if match else None
+
+
+class CacheEntry:
+    """キャッシュ1件分（成功結果または失敗結果）"""
+
+    __slots__ = ('result', 'etag', 'last_modified', 'expires_at', 'negative')
+
+    def __init__(self, result, etag=None, last_modified=None, expires_at=0.0, negative=False):
+        self.result = result
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+        self.negative = negative
+
+    def is_fresh(self, now=None):
+        return (now if now is not None else time.monotonic()) < self.expires_at
+
+    def conditional_headers(self):
+        """再検証用の条件付きリクエストヘッダー"""
+        headers = {}
+        if self.negative:
+            return headers
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class OfferPageCache:
+    """TTL + LRU の商品ページキャッシュ（スレッドセーフ）"""
+
+    def __init__(self, ttl=PAGE_CACHE_TTL, max_entries=PAGE_CACHE_MAX_ENTRIES,
+                 negative_ttl=PAGE_CACHE_NEGATIVE_TTL):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'stale': 0,
+            'revalidated': 0,
+            'negative_hits': 0,
+            'evictions': 0
+        }
+
+    def lookup(self, key):
+        """エントリを返す（期限切れでも再検証用に返す）。存在しなければNone"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            if entry.is_fresh():
+                self._stats['negative_hits' if entry.negative else 'hits'] += 1
+            else:
+                self._stats['stale'] += 1
+            return entry
+
+    def put(self, key, result, etag=None, last_modified=None):
+        """成功結果を保存"""
+        entry = CacheEntry(result, etag, last_modified, time.monotonic() + self.ttl)
+        self._store(key, entry)
+
+    def put_failure(self, key, result):
+        """失敗結果を短時間だけ保存"""
+        entry = CacheEntry(result, expires_at=time.monotonic() + self.negative_ttl, negative=True)
+        self._store(key, entry)
+
+    def mark_revalidated(self, key):
+        """304 Not Modified を受けたエントリの期限を延長"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.expires_at = time.monotonic() + self.ttl
+                self._entries.move_to_end(key)
+                self._stats['revalidated'] += 1
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), max_entries=self.max_entries)
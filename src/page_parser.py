@@ -0,0 +1,175 @@
+"""
+1688商品ページの単一走査パーサー
+
+lxml で1回だけ木を走査し、タイトル候補・画像候補・インライン<script>を
+同時に集める。従来の soup.select を19回実行する方式と同じ優先順位で
+結果を返す。
+"""
+from lxml import etree
+
+# タイトルセレクタ（優先順位順）
+# 'h1.d-title', '.d-title', 'h1', '.product-title', '.offer-title', '[class*="title"]'
+TITLE_SELECTORS = [
+    lambda tag, classes, class_attr: tag == 'h1' and 'd-title' in classes,
+    lambda tag, classes, class_attr: 'd-title' in classes,
+    lambda tag, classes, class_attr: tag == 'h1',
+    lambda tag, classes, class_attr: 'product-title' in classes,
+    lambda tag, classes, class_attr: 'offer-title' in classes,
+    lambda tag, classes, class_attr: 'title' in class_attr,
+]
+
+# 画像セレクタ: (優先順位, 属性, 部分一致文字列) と (優先順位, 祖先クラス)
+IMG_ATTR_SELECTORS = [
+    (0, 'src', 'cbu01.alicdn.com'),       # img[src*="cbu01.alicdn.com"]
+    (1, 'src', 'sc04.alicdn.com'),        # img[src*="sc04.alicdn.com"]
+    (2, 'src', 'img.alicdn.com'),         # img[src*="img.alicdn.com"]
+    (3, 'data-src', 'alicdn.com'),        # img[data-src*="alicdn.com"]
+    (4, 'data-original', 'alicdn.com'),   # img[data-original*="alicdn.com"]
+    (10, 'src', '.jpg'),                  # img[src*=".jpg"]
+    (11, 'src', '.png'),                  # img[src*=".png"]
+    (12, 'src', '.webp'),                 # img[src*=".webp"]
+]
+IMG_ANCESTOR_SELECTORS = [
+    (5, 'd-pic'),                         # .d-pic img
+    (6, 'main-image'),                    # .main-image img
+    (7, 'product-image'),                 # .product-image img
+    (8, 'thumb-pic'),                     # .thumb-pic img
+    (9, 'detail-gallery'),                # .detail-gallery img
+]
+IMG_SELECTOR_COUNT = 13
+GALLERY_CLASSES = frozenset(cls for _, cls in IMG_ANCESTOR_SELECTORS)
+
+# get_text() で無視する要素（BeautifulSoup と同じ扱い）
+NON_TEXT_TAGS = frozenset(['script', 'style', 'template'])
+
+
+def element_text(element):
+    """BeautifulSoup の get_text(strip=True) 相当の文字列を返す"""
+    parts = []
+
+    def walk(node):
+        if isinstance(node.tag, str) and node.tag not in NON_TEXT_TAGS and node.text:
+            parts.append(node.text.strip())
+        for child in node:
+            walk(child)
+            if child.tail:
+                parts.append(child.tail.strip())
+
+    walk(element)
+    return ''.join(parts)
+
+
+class PageCandidates:
+    """1回の走査で集めた候補"""
+
+    def __init__(self, title, image_sources, scripts):
+        self.title = title
+        self.image_sources = image_sources
+        self.scripts = scripts
+
+
+class CandidateCollector:
+    """start/end イベントを受け取って候補を集めるコレクター
+
+    木全体の走査（iterwalk）にもインクリメンタルパーサーにも使える。
+    """
+
+    def __init__(self, collect_scripts=True):
+        self.collect_scripts = collect_scripts
+        self.title_elements = [None] * len(TITLE_SELECTORS)
+        self.title_texts = [None] * len(TITLE_SELECTORS)
+        self.image_buckets = [[] for _ in range(IMG_SELECTOR_COUNT)]
+        self.scripts = []
+        self._gallery_depth = dict.fromkeys(GALLERY_CLASSES, 0)
+        self._pushed = []
+
+    def start(self, element):
+        tag = element.tag
+        if not isinstance(tag, str):
+            return
+        class_attr = element.get('class') or ''
+        classes = class_attr.split() if class_attr else ()
+
+        # タイトル: 各セレクタで文書順最初の要素だけ記録（select_one 相当）
+        for i, matches in enumerate(TITLE_SELECTORS):
+            if self.title_elements[i] is None and matches(tag, classes, class_attr):
+                self.title_elements[i] = element
+
+        if tag == 'img':
+            self._collect_image(element)
+
+        # ギャラリー系クラスの祖先深さを更新
+        pushed = [cls for cls in classes if cls in self._gallery_depth]
+        for cls in pushed:
+            self._gallery_depth[cls] += 1
+        self._pushed.append(pushed)
+
+    def end(self, element):
+        if not isinstance(element.tag, str):
+            return
+        for cls in self._pushed.pop():
+            self._gallery_depth[cls] -= 1
+
+        # 閉じタグ時点でテキストが確定する
+        for i, title_element in enumerate(self.title_elements):
+            if title_element is element:
+                self.title_texts[i] = element_text(element)
+
+        if self.collect_scripts and element.tag == 'script' and element.text:
+            self.scripts.append(element.text)
+
+    def _collect_image(self, element):
+        # 最も優先度の高い一致セレクタのバケットに入れる（select の重複走査と同じ初出順）
+        priority = IMG_SELECTOR_COUNT
+        for index, attr, needle in IMG_ATTR_SELECTORS:
+            if index >= priority:
+                break
+            value = element.get(attr)
+            if value and needle in value:
+                priority = index
+                break
+        for index, cls in IMG_ANCESTOR_SELECTORS:
+            if index >= priority:
+                break
+            if self._gallery_depth[cls]:
+                priority = index
+                break
+        if priority == IMG_SELECTOR_COUNT:
+            return
+        src = element.get('src') or element.get('data-src') or element.get('data-original')
+        if src:
+            self.image_buckets[priority].append(src)
+
+    def title(self):
+        for text in self.title_texts:
+            if text:
+                return text
+        return None
+
+    def image_sources(self):
+        return [src for bucket in self.image_buckets for src in bucket]
+
+    def result(self):
+        return PageCandidates(self.title(), self.image_sources(), self.scripts)
+
+
+def parse_document(content):
+    """HTMLバイト列（または文字列）をlxmlで解析してルート要素を返す"""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    parser = etree.HTMLParser(encoding='utf-8')
+    return etree.fromstring(content, parser) if content else None
+
+
+def collect_page_candidates(content, collect_scripts=True):
+    """HTMLから1回の走査でタイトル・画像候補・スクリプトを集める"""
+    collector = CandidateCollector(collect_scripts)
+    root = parse_document(content)
+    if root is not None:
+        for event, element in etree.iterwalk(root, events=('start', 'end')):
+            if event == 'start':
+                collector.start(element)
+            else:
+                collector.end(element)
+    return collector.result()
+
@@ -0,0 +1,173 @@
+"""
+上限付きキューでつないだ段階的パイプライン
+
+商品ごとの画像処理（ダウンロード → 画像分析 → ファイル整理）を段階に分け、
+段ごとにワーカー数を決めて並行に動かす。段の間のキューは上限付きなので、
+後段が詰まれば前段が待つ（一時ファイルやメモリが際限なく増えない）。
+終了後に段ごとのキューの深さと稼働率を返す。
+
+batch_size を指定した段は、最大 batch_wait 秒待って最大 batch_size 件を
+まとめて fn に渡す（fn はリストを受け取り、同じ長さのリストを返す）。
+fan_out を指定した段は、fn が返したリストの項目（0件以上）を次の段に渡す。
+"""
+import os
+import time
+import queue
+import logging
+import threading
+
+from .metrics import error_class, process_errors
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_QUEUE_SIZE = int(os.environ.get('PIPELINE_QUEUE_SIZE', 4))
+
+_DONE = object()
+
+
+class Stage:
+    """パイプラインの1段（fn が None を返した項目は次の段に渡さない）"""
+
+    def __init__(self, name, fn, workers=1, batch_size=None, batch_wait=0.0, fan_out=False):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, int(workers))
+        self.batch_size = max(1, int(batch_size)) if batch_size else None
+        self.batch_wait = batch_wait
+        self.fan_out = fan_out
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.max_depth = 0
+        self._depth_total = 0
+        self._puts = 0
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def record_put(self, depth):
+        """入力キューに積んだ直後の深さを記録"""
+        with self._lock:
+            self.max_depth = max(self.max_depth, depth)
+            self._depth_total += depth
+            self._puts += 1
+
+    def stats(self, elapsed):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'processed': self.processed,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'busy_seconds': round(self.busy_seconds, 3),
+                'utilization': round(self.busy_seconds / (elapsed * self.workers), 3) if elapsed else 0.0,
+                'max_queue_depth': self.max_depth,
+                'avg_queue_depth': round(self._depth_total / self._puts, 2) if self._puts else 0.0
+            }
+
+
+class StagedPipeline:
+    """段ごとのワーカースレッドと上限付きキューで項目を流す"""
+
+    def __init__(self, stages, queue_size=PIPELINE_QUEUE_SIZE, name='pipeline'):
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self.name = name
+        self.elapsed = 0.0
+
+    def run(self, items):
+        """items を流し、最後の段の出力をリストで返す（順序は完了順）"""
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        results = []
+        results_lock = threading.Lock()
+        threads = []
+        started = time.monotonic()
+
+        for index, stage in enumerate(self.stages):
+            stage._running = stage.workers
+            downstream = queues[index + 1] if index + 1 < len(queues) else None
+            next_stage = self.stages[index + 1] if downstream is not None else None
+            for n in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._work,
+                    args=(stage, queues[index], downstream, next_stage, results, results_lock),
+                    name=f'{self.name}-{stage.name}-{n}',
+                    daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+
+        first = self.stages[0]
+        for item in items:
+            queues[0].put(item)  # 満杯なら空くまで待つ（背圧）
+            first.record_put(queues[0].qsize())
+        for _ in range(first.workers):
+            queues[0].put(_DONE)
+
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.monotonic() - started
+        return results
+
+    @staticmethod
+    def _collect(stage, inbox, first):
+        """first に続けて batch_wait 秒以内に届いた項目をまとめる（終了の合図を受けたら done=True）"""
+        batch = [first]
+        deadline = time.monotonic() + stage.batch_wait
+        while len(batch) < stage.batch_size:
+            try:
+                item = inbox.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _DONE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _work(self, stage, inbox, downstream, next_stage, results, results_lock):
+        done = False
+        while not done:
+            item = inbox.get()
+            if item is _DONE:
+                break
+            if stage.batch_size:
+                batch, done = self._collect(stage, inbox, item)
+            else:
+                batch = [item]
+            busy_started = time.monotonic()
+            try:
+                if stage.batch_size:
+                    outputs = stage.fn(batch)
+                else:
+                    outputs = stage.fn(item) if stage.fan_out else [stage.fn(item)]
+            except Exception as e:
+                logger.error(f"❌ Pipeline stage {stage.name} failed: {e}")
+                process_errors.inc(stage=stage.name, error_class=error_class(e))
+                outputs = None
+            with stage._lock:
+                stage.busy_seconds += time.monotonic() - busy_started
+                if outputs is None:
+                    stage.failed += len(batch)
+                else:
+                    stage.dropped += sum(1 for output in outputs if output is None)
+                    stage.processed += sum(1 for output in outputs if output is not None)
+            for output in outputs or ():
+                if output is None:
+                    continue
+                if downstream is None:
+                    with results_lock:
+                        results.append(output)
+                else:
+                    downstream.put(output)
+                    next_stage.record_put(downstream.qsize())
+
+        # 最後に抜けたワーカーが次の段を終了させる
+        with stage._lock:
+            stage._running -= 1
+            last = stage._running == 0
+        if last and downstream is not None:
+            for _ in range(next_stage.workers):
+                downstream.put(_DONE)
+
+    def stats(self):
+        return {stage.name: stage.stats(self.elapsed) for stage in self.stages}
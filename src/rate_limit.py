@@ -0,0 +1,299 @@
+"""
+ホストごとの適応型トークンバケット
+
+detail.1688.com・alicdn・画像分析APIでそれぞれ別のバケットを持ち、
+プロセス全体で共有する。429 / Retry-After / X-RateLimit-* を受けたら
+そのバケットの速度を下げて指定時刻まで止め、成功が続けば設定値まで
+徐々に戻す。設定は site_config.rate_limits から読む。
+
+取得は「予約」方式: reserve() がトークンを1つ先取りし、使えるまでの
+待ち時間を返す。同期コードは time.sleep、非同期コードは asyncio.sleep で待つ。
+"""
+import time
+import asyncio
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+DETAIL = 'detail'
+ALICDN = 'alicdn'
+VISION = 'vision'
+
+# site_config に rate_limits が無い場合の既定値（rate: 毎秒のリクエスト数, burst: 連続で使える数）
+DEFAULT_RATE_LIMITS = {
+    DETAIL: {'rate': 2.0, 'burst': 5},
+    ALICDN: {'rate': 20.0, 'burst': 20},
+    VISION: {'rate': 1.0, 'burst': 1},
+}
+HOST_SUFFIXES = (
+    ('1688.com', DETAIL),
+    ('alicdn.com', ALICDN),
+)
+
+DECREASE_FACTOR = 0.5     # 429 を受けたときの速度の倍率
+INCREASE_FRACTION = 0.1   # 成功1回ごとに設定速度のこの割合だけ戻す
+MIN_RATE_FRACTION = 0.05  # 設定速度に対する下限
+
+
+def parse_duration(value):
+    """'1s' / '6m0s' / '250ms' / '2' 形式の期間を秒で返す（解釈できなければ None）"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total = 0.0
+    number = ''
+    i = 0
+    while i < len(value):
+        char = value[i]
+        if char.isdigit() or char == '.':
+            number += char
+        elif value.startswith('ms', i) and number:
+            total += float(number) / 1000
+            number = ''
+            i += 1
+        elif char in 'hms' and number:
+            total += float(number) * {'h': 3600, 'm': 60, 's': 1}[char]
+            number = ''
+        else:
+            return None
+        i += 1
+    return total if not number else None
+
+
+def retry_after_seconds(headers, now=None):
+    """応答ヘッダーから「次に送ってよいまでの秒数」を読む（指定がなければ None）"""
+    if not headers:
+        return None
+    headers = {str(name).lower(): value for name, value in headers.items()}
+    now = time.time() if now is None else now
+
+    retry_after = headers.get('retry-after')
+    if retry_after is not None:
+        seconds = parse_duration(retry_after)
+        if seconds is None:
+            try:
+                seconds = parsedate_to_datetime(retry_after).timestamp() - now
+            except (TypeError, ValueError):
+                seconds = None
+        if seconds is not None:
+            return max(0.0, seconds)
+
+    # 残り回数が0なら、リセットまで待つ（OpenAI 形式と一般的な X-RateLimit-* 形式）
+    for remaining_name, reset_name in (('x-ratelimit-remaining-requests', 'x-ratelimit-reset-requests'),
+                                       ('x-ratelimit-remaining', 'x-ratelimit-reset')):
+        remaining = headers.get(remaining_name)
+        if remaining is None or parse_duration(remaining) != 0:
+            continue
+        reset = parse_duration(headers.get(reset_name))
+        if reset is None:
+            continue
+        # 大きな値はエポック秒とみなす
+        return max(0.0, reset - now if reset > 1e9 else reset)
+    return None
+
+
+def service_for(url_or_name):
+    """URLのホスト（またはサービス名）から detail / alicdn / vision を返す（対象外は None）"""
+    if url_or_name in DEFAULT_RATE_LIMITS:
+        return url_or_name
+    if url_or_name.startswith('//'):
+        url_or_name = 'https:' + url_or_name
+    host = (urlsplit(url_or_name).hostname or '').lower()
+    for suffix, name in HOST_SUFFIXES:
+        if host == suffix or host.endswith('.' + suffix):
+            return name
+    return None
+
+
+class TokenBucket:
+    """速度を自動調整するトークンバケット（スレッドセーフ）"""
+
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.configured_rate = float(rate)
+        self.min_rate = self.configured_rate * MIN_RATE_FRACTION
+        self.rate = self.configured_rate
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.throttled = 0
+        self.waited = 0.0
+
+    def _refill(self, now):
+        # 停止中は _updated が未来を指しているので補充しない
+        if now > self._updated:
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def reserve(self):
+        """トークンを1つ予約し、使えるまでの待ち時間（秒）を返す"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait = max(0.0, self._updated - now)
+            if self.tokens < 0:
+                wait += -self.tokens / self.rate
+            self.waited += wait
+            return wait
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self):
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def on_throttled(self, retry_after=None):
+        """429 などの制限応答: 速度を下げ、指定時間（なければ1トークン分）止める"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate * DECREASE_FACTOR)
+            pause = retry_after if retry_after is not None else 1 / self.rate
+            self._updated = max(self._updated, now + pause)
+            self.tokens = min(self.tokens, 0.0)
+            self.throttled += 1
+        logger.warning(f"🐢 Rate limited by {self.name}: pausing {pause:.2f}s, rate now {self.rate:.2f}/s")
+
+    def on_pause(self, seconds):
+        """制限には達していないが、ヘッダーで次の送信時刻を指定された"""
+        with self._lock:
+            self._updated = max(self._updated, time.monotonic() + seconds)
+            self.tokens = min(self.tokens, 0.0)
+
+    def configure(self, rate, burst):
+        """設定を変更する（制限応答で下げた速度は設定速度に対する比率を保つ）"""
+        with self._lock:
+            rate = float(rate)
+            self.rate = self.rate / self.configured_rate * rate
+            self.configured_rate = rate
+            self.min_rate = rate * MIN_RATE_FRACTION
+            self.burst = max(1.0, float(burst))
+            self.tokens = min(self.tokens, self.burst)
+
+    def on_success(self):
+        with self._lock:
+            if self.rate < self.configured_rate:
+                self.rate = min(self.configured_rate, self.rate + self.configured_rate * INCREASE_FRACTION)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rate': round(self.rate, 3),
+                'configured_rate': self.configured_rate,
+                'burst': self.burst,
+                'throttled': self.throttled,
+                'waited_seconds': round(self.waited, 3)
+            }
+
+
+class HostRateLimiter:
+    """URL・サービスごとのバケットをまとめる"""
+
+    def __init__(self, limits=None):
+        self.buckets = {}
+        self.limits = None
+        self.configure(limits)
+
+    @staticmethod
+    def limits_from_site_config(site_config):
+        """site_config.rate_limits を読む。無ければ delay_between_requests を画像分析APIの間隔とみなす"""
+        site_config = site_config or {}
+        limits = dict(site_config.get('rate_limits') or {})
+        delay = site_config.get('delay_between_requests')
+        if VISION not in limits and delay:
+            limits[VISION] = {'rate': 1.0 / delay, 'burst': 1}
+        return limits
+
+    @classmethod
+    def from_site_config(cls, site_config):
+        return cls(cls.limits_from_site_config(site_config))
+
+    def configure(self, limits):
+        """バケットの速度と連続数を設定する（既存のバケットは待ち状態を保ったまま変更）"""
+        limits = {**DEFAULT_RATE_LIMITS, **(limits or {})}
+        for name, config in limits.items():
+            default = DEFAULT_RATE_LIMITS.get(name, {})
+            rate = config.get('rate', default.get('rate', 1.0))
+            burst = config.get('burst', default.get('burst', 1))
+            if name in self.buckets:
+                self.buckets[name].configure(rate, burst)
+            else:
+                self.buckets[name] = TokenBucket(name, rate, burst)
+        self.limits = limits
+
+    def bucket_for(self, url_or_name):
+        """サービス名またはURLのホストからバケットを選ぶ（対象外のホストは None）"""
+        if url_or_name in self.buckets:
+            return self.buckets[url_or_name]
+        name = service_for(url_or_name)
+        return self.buckets.get(name) if name else None
+
+    def acquire(self, url_or_name):
+        bucket = self.bucket_for(url_or_name)
+        return bucket.acquire() if bucket else 0.0
+
+    async def acquire_async(self, url_or_name):
+        bucket = self.bucket_for(url_or_name)
+        return await bucket.acquire_async() if bucket else 0.0
+
+    def observe(self, url_or_name, status, headers=None):
+        """応答のステータスとヘッダーで速度を調整"""
+        bucket = self.bucket_for(url_or_name)
+        if bucket is None:
+            return
+        retry_after = retry_after_seconds(headers)
+        if status == 429 or (status == 503 and retry_after is not None):
+            bucket.on_throttled(retry_after)
+        elif retry_after:
+            bucket.on_pause(retry_after)
+        elif status is not None and status < 400:
+            bucket.on_success()
+
+    def stats(self):
+        return {name: bucket.stats() for name, bucket in self.buckets.items()}
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter(site_config=None):
+    """プロセス共有のリミッター
+
+    site_config を渡すと、その rate_limits で共有のバケットを設定し直す（後から作られた
+    Extractor の設定も、引数なしで呼ぶページ取得に反映される）。
+    """
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = HostRateLimiter.from_site_config(site_config)
+                _log_limits(_limiter)
+                return _limiter
+    if site_config is not None:
+        limits = HostRateLimiter.limits_from_site_config(site_config)
+        with _limiter_lock:
+            if {**DEFAULT_RATE_LIMITS, **limits} != _limiter.limits:
+                _limiter.configure(limits)
+                _log_limits(_limiter)
+    return _limiter
+
+
+def _log_limits(limiter):
+    logger.info(f"🚦 Rate limiter configured: "
+                f"{ {name: bucket.configured_rate for name, bucket in limiter.buckets.items()} }")
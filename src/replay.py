@@ -0,0 +1,375 @@
+"""
+detail.1688.com / alicdn の記録・再生（オフライン負荷試験用）
+
+記録: REPLAY_RECORD_DIR を設定すると、商品ページ取得（fetch_page）と画像
+ダウンロード（download_image）の応答をアーカイブに保存する。
+
+再生: `python -m src.replay serve --archive DIR` でアーカイブを返すサーバーを
+起動し、REPLAY_SERVER_URL にそのURLを設定すると両方の取得先が差し替わる。
+サーバーは遅延・帯域制限・エラー注入を設定できる。記録済みの ETag / Last-Modified で
+条件付きリクエスト（If-None-Match / If-Modified-Since）に 304 を返し、Range（If-Range 付き）
+には 206 / 416 を返すので、再検証とダウンロードの再開もオフラインで試せる。
+
+アーカイブはURLのSHA-1ごとに <key>.json（URL・ステータス・ヘッダー）と
+<key>.body（展開済み本文）を置くだけの単純な形式。記録するのは 200 の応答だけ。
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import logging
+import argparse
+import threading
+from pathlib import Path
+from email.utils import parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit
+
+logger = logging.getLogger(__name__)
+
+REPLAY_SERVER_URL = os.environ.get('REPLAY_SERVER_URL', '').rstrip('/')
+REPLAY_RECORD_DIR = os.environ.get('REPLAY_RECORD_DIR', '')
+REPLAY_PATH = '/replay'
+
+# 記録するヘッダー（本文は展開済みで保存するので Content-Encoding などは捨てる）
+RECORDED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control')
+# 完全な本文を持つ応答だけ記録する（304 や部分応答で記録済みの本文を上書きしない）
+RECORDABLE_STATUSES = (200,)
+REPLAY_CHUNK_SIZE = 16 * 1024
+BYTE_RANGE = re.compile(r'bytes=(\d*)-(\d*)')
+# 満たせない範囲（416）
+UNSATISFIABLE = 'unsatisfiable'
+
+
+def replay_url(url):
+    """再生サーバーが設定されていれば、その経由のURLに差し替える"""
+    if not REPLAY_SERVER_URL or not url or url.startswith(REPLAY_SERVER_URL):
+        return url
+    return f"{REPLAY_SERVER_URL}{REPLAY_PATH}?url={quote(url, safe='')}"
+
+
+def archive_key(url):
+    if url.startswith('//'):
+        url = 'https:' + url
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+class ResponseArchive:
+    """URLごとの応答をディスクに保存・読み込みする"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _paths(self, url):
+        key = archive_key(url)
+        return self.directory / f'{key}.json', self.directory / f'{key}.body'
+
+    def save(self, url, status, headers, body):
+        meta_path, body_path = self._paths(url)
+        meta = {
+            'url': url,
+            'status': status,
+            'headers': {name: headers[name] for name in RECORDED_HEADERS if headers.get(name)},
+            'recorded_at': time.time()
+        }
+        # 本文 → メタデータの順に書き、読み込み側が中途半端な本文を見ないようにする
+        tmp_body = body_path.with_suffix('.body.tmp')
+        tmp_body.write_bytes(body)
+        os.replace(tmp_body, body_path)
+        tmp_meta = meta_path.with_suffix('.json.tmp')
+        tmp_meta.write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp_meta, meta_path)
+
+    def load(self, url):
+        """(メタデータ, 本文) を返す。未記録なら None"""
+        meta_path, body_path = self._paths(url)
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+            return meta, body_path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def urls(self):
+        return [json.loads(path.read_text(encoding='utf-8'))['url'] for path in sorted(self.directory.glob('*.json'))]
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_recorder():
+    """記録が有効ならアーカイブを返す（初回のみ作成）"""
+    global _recorder
+    if not REPLAY_RECORD_DIR:
+        return None
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = ResponseArchive(REPLAY_RECORD_DIR)
+                logger.info(f"📼 Recording responses to {REPLAY_RECORD_DIR}")
+    return _recorder
+
+
+def record_response(url, response, read_body=None):
+    """requests の応答をアーカイブに保存
+
+    本文は read_body(response)（省略時は response.content）で読み込む。呼び出し側と同じ
+    上限付きの読み込み関数を渡すこと。読んだ本文は応答に戻すので、以降の iter_content は
+    メモリ上の本文を返す。
+    """
+    recorder = get_recorder()
+    if recorder is None or response.status_code not in RECORDABLE_STATUSES:
+        return
+    if read_body is None:
+        body = response.content
+    else:
+        body = read_body(response)
+        response._content = body
+        response._content_consumed = True
+    try:
+        recorder.save(url, response.status_code, response.headers, body)
+    except OSError as e:
+        logger.warning(f"⚠️ Failed to record {url}: {e}")
+
+
+def is_not_modified(request_headers, etag, last_modified):
+    """条件付きリクエストが記録済みの検証子と一致するか（If-None-Match があればそちらを優先）"""
+    if_none_match = request_headers.get('If-None-Match')
+    if if_none_match is not None:
+        return bool(etag) and etag in (tag.strip() for tag in if_none_match.split(','))
+    since = request_headers.get('If-Modified-Since')
+    if not (since and last_modified):
+        return False
+    try:
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(since)
+    except (TypeError, ValueError):
+        return False
+
+
+def byte_range(range_header, size):
+    """Range ヘッダーを (先頭, 末尾) にする（読めない・複数範囲なら None で全体を返す、満たせなければ UNSATISFIABLE）"""
+    match = BYTE_RANGE.fullmatch(range_header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # bytes=-500 は末尾の500バイト
+        length = int(last)
+        return (max(0, size - length), size - 1) if length and size else UNSATISFIABLE
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        return UNSATISFIABLE
+    return start, end
+
+
+class FaultConfig:
+    """再生時に注入する遅延・帯域制限・エラー"""
+
+    def __init__(self, latency=0.0, jitter=0.0, bandwidth=0, error_rate=0.0, error_status=503,
+                 reset_rate=0.0, seed=None):
+        self.latency = latency          # 応答開始までの遅延（秒）
+        self.jitter = jitter            # 遅延に加える一様乱数の幅（秒）
+        self.bandwidth = bandwidth      # 本文の送信速度（バイト/秒、0 = 無制限）
+        self.error_rate = error_rate    # error_status を返す確率
+        self.error_status = error_status
+        self.reset_rate = reset_rate    # 応答せずに接続を切る確率
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def roll(self):
+        with self._lock:
+            return self._random.random()
+
+    def delay(self):
+        if self.jitter:
+            with self._lock:
+                return self.latency + self._random.uniform(0, self.jitter)
+        return self.latency
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        parsed = urlsplit(self.path)
+        url = parse_qs(parsed.query).get('url', [None])[0]
+        if parsed.path != REPLAY_PATH or not url:
+            self._send_plain(400, b'expected /replay?url=...')
+            return
+
+        faults = server.faults
+        delay = faults.delay()
+        if delay:
+            time.sleep(delay)
+        if faults.reset_rate and faults.roll() < faults.reset_rate:
+            server.count('resets')
+            self.close_connection = True
+            self.connection.close()
+            return
+        if faults.error_rate and faults.roll() < faults.error_rate:
+            server.count('errors')
+            self._send_plain(faults.error_status, b'injected error')
+            return
+
+        entry = server.archive.load(url)
+        if entry is None:
+            server.count('misses')
+            self._send_plain(404, b'not recorded')
+            return
+        meta, body = entry
+        headers = meta.get('headers', {})
+
+        status = meta.get('status', 200)
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if status == 200 and is_not_modified(self.headers, etag, last_modified):
+            server.count('not_modified')
+            self.send_response(304)
+            for name in ('ETag', 'Last-Modified'):
+                if headers.get(name):
+                    self.send_header(name, headers[name])
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        # If-Range が記録済みの検証子と違えば（元が変わった）Range を無視して全体を返す
+        requested = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        span = None
+        if status == 200 and requested and (if_range is None or if_range in (etag, last_modified)):
+            span = byte_range(requested, len(body))
+        if span == UNSATISFIABLE:
+            server.count('unsatisfiable')
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{len(body)}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        server.count('partial' if span else 'hits')
+        self.send_response(206 if span else status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if status == 200:
+            self.send_header('Accept-Ranges', 'bytes')
+        if span:
+            start, end = span
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(body)}')
+            body = body[start:end + 1]
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self._send_body(body, faults.bandwidth)
+
+    def _send_body(self, body, bandwidth):
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+        started = time.monotonic()
+        sent = 0
+        for offset in range(0, len(body), REPLAY_CHUNK_SIZE):
+            chunk = body[offset:offset + REPLAY_CHUNK_SIZE]
+            self.wfile.write(chunk)
+            sent += len(chunk)
+            ahead = sent / bandwidth - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+    def _send_plain(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"replay {self.address_string()} {format % args}")
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """アーカイブを返すHTTPサーバー"""
+
+    daemon_threads = True
+
+    def __init__(self, archive, faults=None, host='127.0.0.1', port=0):
+        super().__init__((host, port), ReplayHandler)
+        self.archive = archive if isinstance(archive, ResponseArchive) else ResponseArchive(archive)
+        self.faults = faults or FaultConfig()
+        self._stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'partial': 0, 'unsatisfiable': 0,
+                       'errors': 0, 'resets': 0}
+        self._stats_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def start(self):
+        """バックグラウンドスレッドで起動してベースURLを返す"""
+        self._thread = threading.Thread(target=self.serve_forever, name='replay-server', daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='1688ページ・画像の記録を再生するサーバー')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve = subparsers.add_parser('serve', help='アーカイブを再生するサーバーを起動')
+    serve.add_argument('--archive', required=True)
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8899)
+    serve.add_argument('--latency', type=float, default=0.0, help='応答前の遅延（秒）')
+    serve.add_argument('--jitter', type=float, default=0.0, help='遅延に加える乱数の幅（秒）')
+    serve.add_argument('--bandwidth', type=int, default=0, help='接続ごとの送信速度（バイト/秒）')
+    serve.add_argument('--error-rate', type=float, default=0.0)
+    serve.add_argument('--error-status', type=int, default=503)
+    serve.add_argument('--reset-rate', type=float, default=0.0)
+    serve.add_argument('--seed', type=int, default=None)
+    listing = subparsers.add_parser('list', help='記録済みのURLを表示')
+    listing.add_argument('--archive', required=True)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'list':
+        for url in ResponseArchive(args.archive).urls():
+            print(url)
+        return 0
+
+    faults = FaultConfig(args.latency, args.jitter, args.bandwidth, args.error_rate, args.error_status,
+                         args.reset_rate, args.seed)
+    server = ReplayServer(args.archive, faults, args.host, args.port)
+    logger.info(f"📼 Replaying {len(server.archive.urls())} responses at {server.base_url}")
+    logger.info(f"👉 Set REPLAY_SERVER_URL={server.base_url} for the app")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
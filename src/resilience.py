@@ -0,0 +1,335 @@
+"""
+外向きリクエストの再試行ポリシーとホスト単位のサーキットブレーカー
+
+再試行: べき等なGETだけを対象に、接続エラー・タイムアウト・429/5xx を
+フルジッター付き指数バックオフで再試行する。回数は site_config.max_retries、
+全体の所要時間は deadline 秒で打ち切る。Retry-After があればそれ以上待つ。
+
+サーキットブレーカー: ホストごとに連続失敗を数え、閾値を超えたら
+reset_timeout 秒の間は上流へ送らずに即失敗させる。その後1件だけ試し
+（half-open）、成功すれば閉じる。
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import requests
+
+from .metrics import circuit_transitions, outbound_retries
+from .rate_limit import retry_after_seconds, service_for
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+RETRY_EXCEPTIONS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+DEFAULT_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', 3))
+RETRY_BASE_DELAY = float(os.environ.get('RETRY_BASE_DELAY', 0.5))
+RETRY_MAX_DELAY = float(os.environ.get('RETRY_MAX_DELAY', 8))
+RETRY_DEADLINE = float(os.environ.get('RETRY_DEADLINE', 30))
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_RESET_TIMEOUT = float(os.environ.get('CIRCUIT_RESET_TIMEOUT', 30))
+CIRCUIT_MAX_HOSTS = 256
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """ブレーカーが開いているため送信しなかった"""
+
+    def __init__(self, host, retry_in):
+        super().__init__(f'circuit open for {host} (retry in {retry_in:.1f}s)')
+        self.host = host
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """1ホスト分のブレーカー（スレッドセーフ）"""
+
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.opened = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """送信してよいか確認（開いていれば CircuitOpenError）"""
+        with self._lock:
+            if self.state == OPEN:
+                elapsed = time.monotonic() - self.opened_at
+                if elapsed < self.reset_timeout:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, self.reset_timeout - elapsed)
+                self.state = HALF_OPEN
+                self._probing = False
+                circuit_transitions.inc(state=HALF_OPEN)
+                logger.info(f"🔌 Circuit half-open: {self.name}")
+            if self.state == HALF_OPEN:
+                # 試しに送るのは1件だけ
+                if self._probing:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, 0.0)
+                self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                circuit_transitions.inc(state=CLOSED)
+                logger.info(f"✅ Circuit closed: {self.name}")
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def cancel(self):
+        """成否を判定できなかった呼び出し（試行枠だけ返す）"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opened += 1
+                    circuit_transitions.inc(state=OPEN)
+                    logger.warning(f"⛔ Circuit opened: {self.name} after {self.failures} failures")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'opened': self.opened,
+                'rejected': self.rejected
+            }
+
+
+class BreakerRegistry:
+    """ホスト名ごとのブレーカー（件数上限付き、古い閉状態のものから捨てる）"""
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT,
+                 max_hosts=CIRCUIT_MAX_HOSTS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_hosts = max_hosts
+        self._breakers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def breaker_for(self, url_or_name):
+        if url_or_name.startswith('//'):
+            url_or_name = 'https:' + url_or_name
+        host = (urlsplit(url_or_name).hostname or url_or_name).lower()
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(host, self.failure_threshold, self.reset_timeout)
+                self._evict()
+            else:
+                self._breakers.move_to_end(host)
+            return breaker
+
+    def _evict(self):
+        while len(self._breakers) > self.max_hosts:
+            for host, breaker in self._breakers.items():
+                if breaker.state == CLOSED:
+                    del self._breakers[host]
+                    break
+            else:
+                return
+
+    def snapshot(self):
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+
+def _status(response):
+    return getattr(response, 'status_code', None) or getattr(response, 'status', None)
+
+
+class RetryPolicy:
+    """べき等なGETの再試行（フルジッター指数バックオフ・全体期限付き）"""
+
+    def __init__(self, max_retries=DEFAULT_MAX_RETRIES, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY,
+                 deadline=RETRY_DEADLINE, retry_statuses=RETRY_STATUSES, seed=None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.retry_statuses = retry_statuses
+        self._random = random.Random(seed)
+        # プロセス共有のポリシーを複数のワーカーから使うので、件数の更新はロックで守る
+        self._lock = threading.Lock()
+        self.retries = 0
+
+    @staticmethod
+    def settings_from_site_config(site_config):
+        """site_config.max_retries と site_config.retry（base_delay / max_delay / deadline）を読む"""
+        site_config = site_config or {}
+        retry = site_config.get('retry') or {}
+        return {
+            'max_retries': site_config.get('max_retries', DEFAULT_MAX_RETRIES),
+            'base_delay': retry.get('base_delay', RETRY_BASE_DELAY),
+            'max_delay': retry.get('max_delay', RETRY_MAX_DELAY),
+            'deadline': retry.get('deadline', RETRY_DEADLINE)
+        }
+
+    @classmethod
+    def from_site_config(cls, site_config):
+        return cls(**cls.settings_from_site_config(site_config))
+
+    def settings(self):
+        return {'max_retries': self.max_retries, 'base_delay': self.base_delay,
+                'max_delay': self.max_delay, 'deadline': self.deadline}
+
+    def configure(self, max_retries, base_delay, max_delay, deadline):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def backoff(self, attempt):
+        """attempt 回目の失敗後の待ち時間（0 〜 min(max_delay, base * 2^attempt) の一様乱数）"""
+        return self._random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _next_delay(self, attempt, response, started):
+        """再試行するなら待ち時間、しないなら None"""
+        if attempt >= self.max_retries:
+            return None
+        delay = self.backoff(attempt)
+        if response is not None:
+            retry_after = retry_after_seconds(response.headers)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+        if time.monotonic() - started + delay > self.deadline:
+            return None
+        return delay
+
+    def _classify(self, breaker, response):
+        """応答を記録し、再試行対象の失敗なら True"""
+        if _status(response) in self.retry_statuses:
+            breaker.record_failure()
+            return True
+        breaker.record_success()
+        return False
+
+    def call(self, url, send, breakers, retry_exceptions=RETRY_EXCEPTIONS):
+        """send() を再試行付きで実行（最後まで失敗した応答はそのまま返す）"""
+        breaker = breakers.breaker_for(url)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            breaker.before_call()
+            response = error = None
+            try:
+                response = send()
+            except retry_exceptions as e:
+                breaker.record_failure()
+                error = e
+            except BaseException:
+                breaker.cancel()
+                raise
+            else:
+                if not self._classify(breaker, response):
+                    return response
+            delay = self._next_delay(attempt, response, started)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                response.close()
+            with self._lock:
+                self.retries += 1
+            outbound_retries.inc(service=service_for(url))
+            logger.warning(f"🔁 Retry {attempt + 1}/{self.max_retries} in {delay:.2f}s: {url} "
+                           f"({error or _status(response)})")
+            time.sleep(delay)
+            attempt += 1
+
+    async def call_async(self, url, send, breakers, retry_exceptions):
+        """call() の非同期版（send はコルーチン関数）"""
+        breaker = breakers.breaker_for(url)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            breaker.before_call()
+            response = error = None
+            try:
+                response = await send()
+            except retry_exceptions as e:
+                breaker.record_failure()
+                error = e
+            except BaseException:
+                breaker.cancel()
+                raise
+            else:
+                if not self._classify(breaker, response):
+                    return response
+            delay = self._next_delay(attempt, response, started)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                response.release()
+            with self._lock:
+                self.retries += 1
+            outbound_retries.inc(service=service_for(url))
+            logger.warning(f"🔁 Retry {attempt + 1}/{self.max_retries} in {delay:.2f}s: {url} "
+                           f"({error or _status(response)})")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats(self):
+        with self._lock:
+            retries = self.retries
+        return {'max_retries': self.max_retries, 'deadline': self.deadline, 'retries': retries}
+
+
+# プロセス共有のブレーカー（全ワーカーが同じ状態を見る）
+circuit_breakers = BreakerRegistry()
+
+_policy = None
+_policy_lock = threading.Lock()
+
+
+def get_retry_policy(site_config=None):
+    """プロセス共有の再試行ポリシー（ページ取得が使う）
+
+    site_config を渡すと、その max_retries / retry で共有のポリシーを設定し直す。
+    """
+    global _policy
+    if _policy is None:
+        with _policy_lock:
+            if _policy is None:
+                _policy = RetryPolicy.from_site_config(site_config)
+                return _policy
+    if site_config is not None:
+        settings = RetryPolicy.settings_from_site_config(site_config)
+        with _policy_lock:
+            if settings != _policy.settings():
+                _policy.configure(**settings)
+                logger.info(f"🔁 Retry policy configured: {settings}")
+    return _policy
+
+
+def resilient_get(url, send):
+    """共有ポリシーとブレーカーで send() を実行"""
+    return get_retry_policy().call(url, send, circuit_breakers)
@@ -0,0 +1,98 @@
+"""
+インライン<script>内の画像URLスキャナー
+
+<script>ごとに5種類のルールをそれぞれ走査する（旧来の findall 5回と同じ結果）。
+全ルールを1本の選択肢にまとめると、あるルールのマッチが別ルールの
+マッチと重なる箇所を消費してしまい候補を取りこぼすため、ルールは
+個別に事前コンパイルし、切り出した<script>本文の範囲をルールごとに走査する。
+生のレスポンスバイト列をデコードせずにそのまま走査でき、
+各候補には最初にヒットしたルール名が付く。
+"""
+import re
+import threading
+from collections import OrderedDict
+
+# (ルール名, 値を1つキャプチャするパターン, 大文字小文字を無視するか)
+SCRIPT_RULES = [
+    ('alicdn_json', r'"(https?://[^"]*alicdn\.com[^"]*\.(?:jpg|png|webp)[^"]*)"', False),
+    ('img_url', r'imgUrl["\']?\s*:\s*["\']([^"\']+)["\']', True),
+    ('image_url', r'imageUrl["\']?\s*:\s*["\']([^"\']+)["\']', True),
+    ('src', r'src["\']?\s*:\s*["\']([^"\']+)["\']', True),
+    ('url', r'url["\']?\s*:\s*["\']([^"\']*alicdn\.com[^"\']*)["\']', True),
+]
+
+# HTMLコメントを読み飛ばしつつ<script>本文の範囲を探す
+SCRIPT_BLOCK_PATTERN = re.compile(
+    rb'<!--.*?-->|<script\b[^>]*>(.*?)</script\s*>',
+    re.IGNORECASE | re.DOTALL
+)
+
+
+def compile_rules(rules, as_bytes=False):
+    """ルール群を (ルール名, コンパイル済みパターン) のリストにする"""
+    compiled = []
+    for name, pattern, ignore_case in rules:
+        flags = re.IGNORECASE if ignore_case else 0
+        compiled.append((name, re.compile(pattern.encode('ascii') if as_bytes else pattern, flags)))
+    return compiled
+
+
+class RuleStats:
+    """ルールごとのヒット数・採用数（スレッドセーフ）"""
+
+    def __init__(self, rule_names):
+        self._lock = threading.Lock()
+        self._matched = dict.fromkeys(rule_names, 0)
+        self._accepted = dict.fromkeys(rule_names, 0)
+
+    def record(self, rule, accepted):
+        with self._lock:
+            self._matched[rule] += 1
+            if accepted:
+                self._accepted[rule] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                rule: {'matched': self._matched[rule], 'accepted': self._accepted[rule]}
+                for rule in self._matched
+            }
+
+
+class ScriptScanner:
+    """事前コンパイルしたルールで<script>本文を走査する"""
+
+    def __init__(self, rules=SCRIPT_RULES):
+        self.rule_names = [name for name, _, _ in rules]
+        self._text_rules = compile_rules(rules)
+        self._bytes_rules = compile_rules(rules, as_bytes=True)
+
+    def scan(self, data, pos=0, endpos=None, found=None):
+        """文字列またはバイト列を走査し、{候補URL: ルール名} をルール順・出現順で返す"""
+        found = OrderedDict() if found is None else found
+        is_bytes = isinstance(data, (bytes, bytearray))
+        rules = self._bytes_rules if is_bytes else self._text_rules
+        endpos = len(data) if endpos is None else endpos
+        for rule, pattern in rules:
+            for match in pattern.finditer(data, pos, endpos):
+                value = match.group(1)
+                if is_bytes:
+                    value = value.decode('utf-8', 'replace')
+                if value not in found:
+                    found[value] = rule
+        return found
+
+    def scan_html(self, content):
+        """HTMLの生バイト列から全<script>本文を範囲指定で走査（本文全体はデコードしない）"""
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        found = OrderedDict()
+        for block in SCRIPT_BLOCK_PATTERN.finditer(content):
+            start, end = block.span(1)
+            if start != end and start != -1:
+                self.scan(content, start, end, found)
+        return found
+
+
+script_scanner = ScriptScanner()
+script_rule_stats = RuleStats(script_scanner.rule_names)
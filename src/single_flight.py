@@ -0,0 +1,99 @@
+"""
+同一キーの実行中処理をまとめる single-flight
+
+同じ商品URLへのリクエストが同時に来たとき、最初の1件（リーダー）だけが
+上流へ取得しに行き、後続は完了を待って同じ結果を受け取る。完了後は
+キーを解放するので、以降のリクエストはキャッシュ側で処理される。
+"""
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _FlightStats:
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+
+    def snapshot(self, in_flight):
+        total = self.leaders + self.coalesced
+        return {
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'in_flight': in_flight,
+            'saved_ratio': round(self.coalesced / total, 4) if total else 0.0
+        }
+
+
+class SingleFlight:
+    """スレッド間で同一キーの呼び出しをまとめる"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = _FlightStats()
+
+    def do(self, key, fn, *args, **kwargs):
+        """fn(*args, **kwargs) を実行し (結果, 他の呼び出しの結果を共有したか) を返す"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats.leaders += 1
+            else:
+                self._stats.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        with self._lock:
+            return self._stats.snapshot(len(self._calls))
+
+
+class AsyncSingleFlight:
+    """イベントループ内で同一キーのコルーチンをまとめる"""
+
+    def __init__(self):
+        self._tasks = {}
+        self._stats = _FlightStats()
+
+    async def do(self, key, coro_fn, *args, **kwargs):
+        """coro_fn(*args, **kwargs) を待ち (結果, 他の呼び出しの結果を共有したか) を返す"""
+        task = self._tasks.get(key)
+        shared = task is not None
+        if shared:
+            self._stats.coalesced += 1
+        else:
+            task = asyncio.ensure_future(coro_fn(*args, **kwargs))
+            self._tasks[key] = task
+            self._stats.leaders += 1
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        # 待っている1件がキャンセルされても他の待機者の処理は止めない
+        return await asyncio.shield(task), shared
+
+    def stats(self):
+        return self._stats.snapshot(len(self._tasks))
@@ -0,0 +1,278 @@
+"""
+画像URLの正規化ルールエンジン
+
+is_valid_product_image / clean_image_url / enhance_image_quality /
+extract_size_from_url の判定・変換ルールをデータとして定義し、起動時に
+1回だけコンパイルする。normalize_image_url() は1つのURLを1回処理して
+(有効フラグ, クリーンURL, 高解像度URL, サイズ) をまとめて返し、
+結果は件数上限付きのLRUでメモ化する。
+
+同じalicdn画像のサイズ違い（_50x50.jpg / .jpg_220x220.jpg / 原寸 .jpg など）は
+canonical_image_key() で同一キーにまとめ、最も高解像度の1件だけを残す。
+"""
+import os
+import re
+from collections import namedtuple
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+URL_MEMO_SIZE = int(os.environ.get('URL_MEMO_SIZE', 16384))
+
+# --- 有効判定ルール ---
+VALID_PREFIXES = ('http://', 'https://', '//')
+VALID_DOMAINS = ('alicdn.com', '1688.com')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')  # 小文字化したURLに対して判定
+EXCLUDE_WORDS = (
+    'favicon', 'logo', 'icon', 'placeholder', 'loading',
+    '1x1', 'pixel', 'transparent', 'blank', 'empty',
+    'avatar', 'head', 'profile', 'watermark'
+)
+MIN_DIMENSION = 50  # 非常に小さい画像を除外
+
+# --- クリーンアップルール ---
+KEEP_PARAMS = ('width', 'height', 'quality', 'format')
+
+# --- 高解像度化ルール（上から順に適用）---
+# (いずれかを含む場合だけ適用する目印, パターン, 置換)
+QUALITY_REWRITES = [
+    (('_50x50.', '_100x100.', '_200x200.', '_220x220.'), r'_(?:50x50|100x100|200x200|220x220)\.', '_400x400.'),
+    (('summ.jpg',), r'summ\.jpg', '400x400.jpg'),
+    (('.jpg_',), r'\.jpg_\d+x\d+\.jpg', '.jpg'),
+    (('.jpg_', '.png_', '.webp_'), r'\.(jpg|png|webp)_.*', r'.\1'),
+]
+COMPILED_REWRITES = [(triggers, re.compile(pattern), replacement)
+                     for triggers, pattern, replacement in QUALITY_REWRITES]
+MAX_RESOLUTION_SUFFIX = '_800x800'
+UNKNOWN_SIZE = "不明"
+
+# --- 正規キールール ---
+# パス中で最初に現れる画像拡張子までが元画像、その前のサイズ接尾辞は変種扱い
+CANONICAL_EXTENSION = re.compile(r'\.(?:jpg|jpeg|png|webp)', re.IGNORECASE)
+# urlsplit() の (netloc, path) を1回のマッチで取り出す（空白・制御文字・IPv6 を含むURLは urlsplit に任せる）
+HOST_PATH = re.compile(r'https?://([^/?#\[\]]*)([^?#]*)')
+ORIGINAL_AREA = float('inf')  # サイズ指定なし＝原寸
+
+ImageRecord = namedtuple('ImageRecord', ['valid', 'clean_url', 'high_res_url', 'size', 'image_key', 'rank'])
+INVALID_RECORD = ImageRecord(False, None, None, UNKNOWN_SIZE, None, None)
+
+
+def find_sizes(url, first_only=False):
+    """URL中の '幅x高さ' を re.findall(r'(\\d+)x(\\d+)') と同じ結果で返す
+
+    正規表現は桁の並びごとにバックトラックするため、'x' の位置から
+    前後の数字を見る方が速い。
+    """
+    pairs = []
+    pos = 0
+    length = len(url)
+    index = url.find('x')
+    while index != -1:
+        start = index
+        while start > pos and url[start - 1].isdecimal():
+            start -= 1
+        end = index + 1
+        while end < length and url[end].isdecimal():
+            end += 1
+        if start < index and end > index + 1:
+            pairs.append((url[start:index], url[index + 1:end]))
+            if first_only:
+                break
+            pos = end
+        else:
+            pos = index + 1
+        index = url.find('x', pos)
+    return pairs
+
+
+def is_valid_url(url):
+    """商品画像として有効かチェック"""
+    if not url or not isinstance(url, str):
+        return False
+    if not url.startswith(VALID_PREFIXES):
+        return False
+    if not any(domain in url for domain in VALID_DOMAINS):
+        return False
+    url_lower = url.lower()
+    if not any(extension in url_lower for extension in IMAGE_EXTENSIONS):
+        return False
+    if any(word in url_lower for word in EXCLUDE_WORDS):
+        return False
+    for width, height in find_sizes(url):
+        if int(width) < MIN_DIMENSION or int(height) < MIN_DIMENSION:
+            return False
+    return True
+
+
+def clean_url(url):
+    """プロトコル補完・エスケープ除去・不要なクエリパラメータ削除"""
+    if not url:
+        return None
+    if url.startswith('//'):
+        url = 'https:' + url
+    url = url.replace('\\', '')
+    if '?' in url:
+        base_url, params = url.split('?', 1)
+        important_params = [param for param in params.split('&')
+                            if any(keep in param.lower() for keep in KEEP_PARAMS)]
+        url = base_url + '?' + '&'.join(important_params) if important_params else base_url
+    return url
+
+
+def high_res_url(url):
+    """アリババCDNの画像URLを高品質版に変換"""
+    if not url:
+        return url
+    for triggers, pattern, replacement in COMPILED_REWRITES:
+        if any(trigger in url for trigger in triggers):
+            url = pattern.sub(replacement, url)
+    # 最大解像度を指定（可能な場合）
+    if 'alicdn.com' in url and not find_sizes(url, first_only=True):
+        if url.endswith(('.jpg', '.jpeg')):
+            url = url.replace('.jpg', MAX_RESOLUTION_SUFFIX + '.jpg')
+        elif url.endswith('.png'):
+            url = url.replace('.png', MAX_RESOLUTION_SUFFIX + '.png')
+    return url
+
+
+def parse_size(url):
+    """URLからサイズ情報を抽出"""
+    sizes = find_sizes(url, first_only=True)
+    return f"{sizes[0][0]}x{sizes[0][1]}" if sizes else UNKNOWN_SIZE
+
+
+def strip_variant_suffix(stem):
+    """末尾の _NxN / .NxN / .summ を1つ取り除く
+
+    re.sub(r'(?:[._]\\d+x\\d+|\\.summ)$', '', stem) と同じ結果。末尾アンカーの
+    正規表現は全位置から照合を試すため、後ろから見る方が速い。
+    """
+    if stem.endswith('.summ'):
+        return stem[:-5]
+    end = len(stem)
+    x = end
+    while x > 0 and stem[x - 1].isdecimal():
+        x -= 1
+    if x == end or x == 0 or stem[x - 1] != 'x':
+        return stem
+    start = x - 1
+    while start > 0 and stem[start - 1].isdecimal():
+        start -= 1
+    if start == x - 1 or start == 0 or stem[start - 1] not in '._':
+        return stem
+    return stem[:start - 1]
+
+
+def split_variant(url):
+    """URLを (正規キー, サイズ等の変種部分) に分ける
+
+    alicdn はホスト・クエリを無視し、パス中で最初に現れる画像拡張子までを
+    元画像とみなす（直前の _NxN / .NxN / .summ も変種部分に含める）。
+    """
+    if url.startswith('//'):
+        url = 'https:' + url
+    url = url.replace('\\', '')
+    match = HOST_PATH.match(url) if ' ' not in url and url.isprintable() else None
+    if match:
+        netloc, path = match.groups()
+    else:
+        parts = urlsplit(url)
+        netloc, path = parts.netloc, parts.path
+    if not netloc.endswith('alicdn.com'):
+        return netloc + path, ''
+    match = CANONICAL_EXTENSION.search(path)
+    if not match:
+        return path, ''
+    stem = strip_variant_suffix(path[:match.start()])
+    return stem + match.group().lower(), path[len(stem):]
+
+
+def canonical_image_key(url):
+    """サイズ違いを同一視する画像キー"""
+    return split_variant(url)[0]
+
+
+def variant_rank(url, suffix=None):
+    """同じキー内での優先度（指定サイズの面積が大きいほど上、サイズ指定なしは原寸として最上位）
+
+    split_variant() 済みなら変種部分を suffix に渡す（URLを2回分解しない）。
+    """
+    if suffix is None:
+        suffix = split_variant(url)[1]
+    sizes = find_sizes(suffix)
+    if sizes:
+        area = max(int(width) * int(height) for width, height in sizes)
+    else:
+        # .summ はサムネイル、それ以外でサイズ指定がなければ原寸
+        area = 0 if suffix.startswith('.summ') else ORIGINAL_AREA
+    # 同じ面積なら短いURL（= 余計な接尾辞のないURL）を優先
+    return (area, -len(url))
+
+
+@lru_cache(maxsize=URL_MEMO_SIZE)
+def _normalize(url):
+    if not is_valid_url(url):
+        return INVALID_RECORD
+    cleaned = clean_url(url)
+    if not cleaned:
+        return INVALID_RECORD
+    enhanced = high_res_url(cleaned)
+    image_key, suffix = split_variant(cleaned)
+    return ImageRecord(True, cleaned, enhanced, parse_size(enhanced),
+                       image_key, variant_rank(cleaned, suffix))
+
+
+def normalize_image_url(url):
+    """1つの候補URLを判定・クリーンアップ・高解像度化・サイズ解析までまとめて行う"""
+    if not url or not isinstance(url, str):
+        return INVALID_RECORD
+    return _normalize(url)
+
+
+def memo_stats():
+    """LRUメモのヒット状況"""
+    info = _normalize.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'max_size': info.maxsize}
+
+
+def clear_memo():
+    _normalize.cache_clear()
+
+
+class CanonicalImageSet:
+    """正規キーで重複を除き、キーごとに最高解像度の変種を初出順で保持する"""
+
+    def __init__(self):
+        self._records = {}
+
+    def add(self, url):
+        """候補URLを追加（無効なら False）"""
+        record = normalize_image_url(url)
+        if not record.valid:
+            return False
+        current = self._records.get(record.image_key)
+        if current is None or record.rank > current.rank:
+            # 既存キーへの代入は初出位置を保つ
+            self._records[record.image_key] = record
+        return True
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, key):
+        return key in self._records
+
+    def records(self):
+        return list(self._records.values())
+
+
+def dedupe_image_urls(urls):
+    """サイズ違いを除いたURLリスト（キーごとに最高解像度の元URL、初出順）"""
+    best = {}
+    for url in urls:
+        if not url:
+            continue
+        key, suffix = split_variant(url)
+        rank = variant_rank(url, suffix)
+        if key not in best or rank > best[key][1]:
+            best[key] = (url, rank)
+    return [url for url, _ in best.values()]
@@ -0,0 +1,167 @@
+"""
+画像分析（OpenAI Vision）結果の永続キャッシュ
+
+同じ写真は商品の再処理や別の出品者でも使い回されるため、
+(画像のSHA-256, プロンプトのハッシュ, モデル, temperature, 送信前の縮小設定) をキーに
+パース済みの分析結果を SQLite に保存する。キーは画像のハッシュだけで
+作れるので、ヒット時は画像を読み込まない（ブロブストアのパス名がハッシュ）。
+
+合計サイズが VISION_CACHE_MAX_BYTES を超えたら、最後に使われたのが古いものから捨てる。
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+VISION_CACHE_PATH = os.environ.get('VISION_CACHE_PATH', 'vision_cache.db')
+VISION_CACHE_MAX_BYTES = int(os.environ.get('VISION_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# 上限を超えたら、この割合まで減らす（1件ごとに削除しない）
+EVICT_TO_FRACTION = 0.9
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS analyses (
+    key TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    analysis TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analyses_accessed ON analyses (accessed_at);
+'''
+
+
+def cache_key(content_hash, prompt, model, temperature, preprocessing=None):
+    """(画像ハッシュ, プロンプトのハッシュ, モデル, temperature, 縮小設定) のキー
+
+    preprocessing は送信前の変換設定（長辺・形式・品質）。設定が変われば
+    モデルが見る画像も変わるので、別の結果として扱う。
+    """
+    prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+    raw = json.dumps([content_hash, prompt_hash, model, float(temperature), preprocessing])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class CacheRun:
+    """1回の処理（1商品）分のヒット・ミス数"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 3) if total else 0.0
+            }
+
+
+class VisionCache:
+    """分析結果の永続キャッシュ（SQLite、サイズ上限付き、スレッドセーフ）"""
+
+    def __init__(self, path=VISION_CACHE_PATH, max_bytes=VISION_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        self._bytes = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM analyses').fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, run=None):
+        """保存済みの分析結果（無ければ None）"""
+        with self._lock:
+            row = self._conn.execute('SELECT analysis FROM analyses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._conn.execute('UPDATE analyses SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        if run is not None:
+            run.record(row is not None)
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, content_hash, model, analysis):
+        data = json.dumps(analysis, ensure_ascii=False)
+        size = len(data.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute('SELECT size FROM analyses WHERE key = ?', (key,)).fetchone()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO analyses (key, content_hash, model, analysis, size, created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, content_hash, model, data, size, now, now)
+            )
+            self._bytes += size - (old[0] if old else 0)
+            if self._bytes > self.max_bytes:
+                self._evict(int(self.max_bytes * EVICT_TO_FRACTION))
+
+    def _evict(self, target_bytes):
+        """最後に使われたのが古い順に target_bytes 以下まで削除"""
+        evicted = 0
+        for key, size in self._conn.execute('SELECT key, size FROM analyses ORDER BY accessed_at').fetchall():
+            if self._bytes <= target_bytes:
+                break
+            self._conn.execute('DELETE FROM analyses WHERE key = ?', (key,))
+            self._bytes -= size
+            evicted += 1
+        self.evictions += evicted
+        logger.info(f"🧹 Vision cache evicted {evicted} entries ({self._bytes} bytes left)")
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM analyses').fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                'entries': entries,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 3) if total else 0.0,
+                'evictions': self.evictions
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_vision_cache():
+    """プロセス共有のキャッシュ（初回のみ作成）"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = VisionCache()
+                logger.info(f"🧠 Vision cache: {VISION_CACHE_PATH} (max {VISION_CACHE_MAX_BYTES} bytes)")
+    return _cache
+
+
+def vision_cache_stats():
+    """共有キャッシュの統計（まだ作られていなければ None。統計のためだけに DB ファイルを作らない）"""
+    cache = _cache
+    return cache.stats() if cache is not None else None
@@ -0,0 +1,103 @@
+"""
+非同期抽出パスのテスト（ローカルの代替HTTPサーバーを相手に同時実行数とタイムアウトを確認）
+"""
+import asyncio
+import json
+import time
+
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+from aiohttp import web
+
+from src import resilience
+from src.async_app import AsyncExtractor
+from src.async_client import create_async_session, create_timeout
+from src.resilience import RetryPolicy
+
+PAGE_DELAY = 0.3
+CONCURRENT_REQUESTS = 100
+
+OFFER_BLOB = {
+    'subject': 'テスト商品',
+    'offerImgList': [f'https://cbu01.alicdn.com/img/ibank/O1CN01test{i}.jpg' for i in range(5)]
+}
+OFFER_PAGE = (
+    '<html><head><script>window.__INIT_DATA = ' + json.dumps(OFFER_BLOB) + '</script></head>'
+    '<body><h1 class="d-title">テスト商品</h1></body></html>'
+).encode('utf-8')
+
+
+async def offer_page(request):
+    await asyncio.sleep(PAGE_DELAY)
+    return web.Response(body=OFFER_PAGE, content_type='text/html')
+
+
+async def stalled_page(request):
+    response = web.StreamResponse()
+    await response.prepare(request)
+    await asyncio.sleep(3)
+    return response
+
+
+async def start_stand_in_server():
+    app = web.Application()
+    app.router.add_get('/offer/{offer}.html', offer_page)
+    app.router.add_get('/stalled.html', stalled_page)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f'http://127.0.0.1:{port}'
+
+
+def test_many_fetches_in_flight_at_once():
+    async def run():
+        runner, base_url = await start_stand_in_server()
+        session = create_async_session()
+        try:
+            extractor = AsyncExtractor(session)
+            started = time.perf_counter()
+            results = await asyncio.gather(*[
+                extractor.extract(f'{base_url}/offer/{i}.html', max_images=3)
+                for i in range(CONCURRENT_REQUESTS)
+            ])
+            return results, time.perf_counter() - started
+        finally:
+            await session.close()
+            await runner.cleanup()
+
+    results, elapsed = asyncio.run(run())
+    assert all(result['success'] for result in results)
+    assert all(result['extracted_count'] == 3 for result in results)
+    assert results[0]['title'] == 'テスト商品'
+    assert results[0]['extraction_method'] == 'structured'
+    # 逐次なら 100 * 0.3 秒かかる
+    assert elapsed < PAGE_DELAY * CONCURRENT_REQUESTS / 5
+
+
+def test_stalled_upstream_times_out_without_blocking_others(monkeypatch):
+    # 再試行なしでタイムアウトそのものを確認する
+    monkeypatch.setattr(resilience, '_policy', RetryPolicy(max_retries=0))
+
+    async def run():
+        runner, base_url = await start_stand_in_server()
+        session = create_async_session(timeout=create_timeout(connect=1, read=0.5, total=5))
+        try:
+            extractor = AsyncExtractor(session)
+            started = time.perf_counter()
+            stalled, healthy = await asyncio.gather(
+                extractor.extract(f'{base_url}/stalled.html'),
+                extractor.extract(f'{base_url}/offer/1.html')
+            )
+            return stalled, healthy, time.perf_counter() - started
+        finally:
+            await session.close()
+            await runner.cleanup()
+
+    stalled, healthy, elapsed = asyncio.run(run())
+    assert not stalled['success']
+    assert 'ページの取得に失敗しました' in stalled['error']
+    assert healthy['success']
+    assert elapsed < 3
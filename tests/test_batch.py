@@ -0,0 +1,82 @@
+"""
+一括抽出API（/extract/batch）のテスト（NDJSON で完了順に返し、URLごとのエラーはその行に閉じ込める）
+"""
+import json
+import time
+
+import pytest
+
+import main
+
+
+def offer_url(offer_id):
+    return f'https://detail.1688.com/offer/{offer_id}.html'
+
+
+@pytest.fixture
+def client():
+    return main.app.test_client()
+
+
+@pytest.fixture
+def fake_extract(monkeypatch):
+    """商品ID 1 は遅く、商品ID 500 は例外を送出する抽出"""
+    calls = []
+
+    def extract(url, max_images=20):
+        calls.append((url, max_images))
+        if '/500.html' in url:
+            raise RuntimeError('boom')
+        if '/1.html' in url:
+            time.sleep(0.2)
+        return {'success': True, 'url': url, 'images': ['a.jpg', 'b.jpg'][:max_images]}
+
+    monkeypatch.setattr(main, 'extract_1688_images', extract)
+    return calls
+
+
+def post_batch(client, payload):
+    response = client.post('/extract/batch', json=payload)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+@pytest.mark.parametrize('payload', [{}, {'urls': []}, {'urls': 'https://detail.1688.com/offer/1.html'},
+                                     {'urls': [offer_url(1)], 'max_images': 'many'}])
+def test_invalid_requests_are_rejected(client, payload):
+    response = client.post('/extract/batch', json=payload)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_too_many_urls_are_rejected(client, monkeypatch):
+    monkeypatch.setattr(main, 'BATCH_MAX_URLS', 2)
+    response = client.post('/extract/batch', json={'urls': [offer_url(i) for i in range(3)]})
+    assert response.status_code == 400
+
+
+def test_results_stream_in_completion_order(client, fake_extract):
+    urls = [offer_url(1), offer_url(2), offer_url(3)]
+    lines = post_batch(client, {'urls': urls, 'max_images': 1, 'quality': 'medium'})
+
+    # 遅い1件目は最後に届く
+    assert lines[-1]['index'] == 0
+    assert sorted(line['index'] for line in lines) == [0, 1, 2]
+    for line in lines:
+        assert line['url'] == urls[line['index']]
+        assert line['success'] and line['images'] == ['a.jpg'] and line['quality'] == 'medium'
+    assert sorted(fake_extract) == [(url, 1) for url in urls]
+
+
+def test_item_errors_stay_on_their_line(client, fake_extract):
+    urls = [offer_url(2), '', 'https://example.com/item', offer_url(500)]
+    lines = {line['index']: line for line in post_batch(client, {'urls': urls})}
+
+    assert lines[0]['success'] is True
+    assert lines[1] == {'index': 1, 'url': '', 'success': False, 'error': 'URLが必要です'}
+    assert lines[2]['success'] is False and '1688.com' in lines[2]['error']
+    assert lines[3]['success'] is False and 'boom' in lines[3]['error']
+    assert 'quality' not in lines[3]
+    # 検証で落ちたURLは抽出しない
+    assert sorted(url for url, _ in fake_extract) == [offer_url(2), offer_url(500)]
@@ -0,0 +1,48 @@
+"""
+ベンチマークスイートをベースラインと比較する回帰テスト
+
+抽出結果（タイトル・件数・画像URL）だけをベースラインと比べる。時間とメモリは
+測定した機械に依存するので、ここでは比べず bench_extraction.py で確認する。
+"""
+import copy
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+BENCH_PATH = Path(__file__).resolve().parent.parent / 'benchmarks' / 'bench_extraction.py'
+
+
+def load_bench():
+    spec = importlib.util.spec_from_file_location('bench_extraction', BENCH_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+bench = load_bench()
+
+
+@pytest.fixture(scope='module')
+def results():
+    return bench.run_suite(repeat=1)
+
+
+def test_corpus_matches_baseline():
+    baseline = bench.load_baseline()
+    fingerprints = {
+        name: bench.fingerprint(bench.extract_from_content(bench.BENCH_URL, content))
+        for name, content in bench.load_corpus()
+    }
+    assert fingerprints == {name: page['result'] for name, page in baseline['pages'].items()}
+
+
+def test_compare_flags_slowdown_and_changed_output(results):
+    baseline = copy.deepcopy(results)
+    slower = copy.deepcopy(results)
+    slower['pages']['huge_offer']['seconds'] *= 10
+    slower['pages']['edge_offer']['result']['total_found'] += 1
+
+    regressions = bench.compare(slower, baseline)
+    assert any(regression.startswith('huge_offer:') and 'ms >' in regression for regression in regressions)
+    assert any(regression.startswith('edge_offer: extraction result changed') for regression in regressions)
@@ -0,0 +1,92 @@
+"""
+画像ブロブストアのテスト（内容での重複除去・URL索引・再検証の期限・リンク）
+"""
+import os
+
+import pytest
+
+from src.blob_store import BlobStore, file_digest
+
+URL = 'https://cbu01.alicdn.com/img/ibank/O1CN01.jpg'
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(tmp_path / 'blobs')
+
+
+def download(store, url, body):
+    """partial_path に書いた「ダウンロード済み」ファイル"""
+    path = store.partial_path(url)
+    path.write_bytes(body)
+    return path
+
+
+def test_same_content_is_stored_once(store):
+    first = store.add_file(URL, download(store, URL, b'photo'))
+    other_url = 'https://cbu01.alicdn.com/img/ibank/O1CN02.jpg'
+    second = store.add_file(other_url, download(store, other_url, b'photo'))
+
+    assert first == second == store.path_for(file_digest(first))
+    assert first.read_bytes() == b'photo'
+    assert not store.partial_path(other_url).exists()
+    stats = store.stats()
+    assert (stats['stored'], stats['deduplicated'], stats['urls'], stats['blobs']) == (1, 1, 2, 1)
+
+
+def test_lookup_by_url(store):
+    assert store.lookup(URL) is None
+    blob = store.add_file(URL, download(store, URL, b'photo'), etag='"v1"')
+
+    entry = store.lookup(URL)
+    assert entry['path'] == blob and entry['fresh'] and entry['etag'] == '"v1"'
+    # プロトコル相対URLも同じ画像
+    assert store.lookup('//cbu01.alicdn.com/img/ibank/O1CN01.jpg')['path'] == blob
+    assert store.stats()['url_hits'] == 2
+
+    # ブロブが消えた・壊れたら記録が無いのと同じ
+    blob.write_bytes(b'truncated')
+    assert store.lookup(URL) is None
+
+
+def test_stale_entries_need_revalidation(tmp_path):
+    store = BlobStore(tmp_path / 'blobs', revalidate_after=0)
+    store.add_file(URL, download(store, URL, b'photo'), etag='"v1"', last_modified='Wed, 01 Jan 2025 00:00:00 GMT')
+
+    entry = store.lookup(URL)
+    assert not entry['fresh']
+    assert entry['last_modified'] == 'Wed, 01 Jan 2025 00:00:00 GMT'
+
+    store.revalidate_after = 60
+    store.touch(URL)
+    assert store.lookup(URL)['fresh']
+    assert store.stats()['revalidated'] == 1
+
+
+def test_index_survives_reopening(store):
+    blob = store.add_file(URL, download(store, URL, b'photo'))
+    assert BlobStore(store.root).lookup(URL)['path'] == blob
+
+
+def test_link_replaces_existing_file(store, tmp_path):
+    blob = store.add_file(URL, download(store, URL, b'photo'))
+    dest = tmp_path / 'product' / 'red' / 'image_001.jpg'
+    dest.parent.mkdir(parents=True)
+    dest.write_bytes(b'old')
+
+    store.link(blob, dest)
+    assert dest.read_bytes() == b'photo'
+    assert os.path.samefile(dest, blob)
+    assert store.stats()['links'] == 1
+
+
+def test_link_falls_back_to_copy(store, tmp_path, monkeypatch):
+    blob = store.add_file(URL, download(store, URL, b'photo'))
+
+    def no_links(src, dst):
+        raise OSError('cross-device link')
+
+    monkeypatch.setattr(os, 'link', no_links)
+    dest = store.link(blob, tmp_path / 'image.jpg')
+    assert dest.read_bytes() == b'photo' and not os.path.samefile(dest, blob)
+    assert store.stats()['copies'] == 1
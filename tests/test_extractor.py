@@ -0,0 +1,192 @@
+"""
+画像ダウンロードのテスト（Range に対応したローカルの画像サーバーを相手にする）
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src import extractor as extractor_module
+from src import http_client
+from src.blob_store import BlobStore
+from src.extractor import Alibaba1688ImageExtractor
+from src.resilience import BreakerRegistry, RetryPolicy
+
+IMAGE = bytes(range(256)) * 256
+ETAG = '"image-v1"'
+
+
+@pytest.fixture
+def image_server():
+    """IMAGE を返すサーバー（Range / If-Range 対応。最初の cuts 回は cut_at バイトで接続を切る）
+
+    切れたときに .part に残るのは iter_content の読み終えたチャンク（8192 バイト単位）まで。
+    """
+    state = {'requests': [], 'clients': [], 'cuts': 0, 'cut_at': 9000, 'delay': 0}
+
+    class Images(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            state['requests'].append(self.headers.get('Range'))
+            state['clients'].append(self.client_address)
+            time.sleep(state['delay'])
+            start = 0
+            requested = self.headers.get('Range')
+            if requested and self.headers.get('If-Range') == ETAG:
+                start = int(requested[len('bytes='):].rstrip('-'))
+                if start >= len(IMAGE):
+                    self.send_response(416)
+                    self.send_header('Content-Range', f'bytes */{len(IMAGE)}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{len(IMAGE) - 1}/{len(IMAGE)}')
+            else:
+                self.send_response(200)
+            body = IMAGE[start:]
+            self.send_header('ETag', ETAG)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if state['cuts']:
+                state['cuts'] -= 1
+                self.wfile.write(body[:state['cut_at']])
+                self.close_connection = True
+                return
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Images)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    state['url'] = f'http://127.0.0.1:{server.server_address[1]}/image.jpg'
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def extractor(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(extractor_module, 'circuit_breakers', BreakerRegistry())
+    extractor = Alibaba1688ImageExtractor(config_path='missing.yaml', demo_mode=True)
+    extractor.retry_policy = RetryPolicy(max_retries=2, base_delay=0.01, seed=1)
+    extractor.blob_store = BlobStore(tmp_path / 'blobs')
+    return extractor
+
+
+def write_part(path, body):
+    part = path.with_name(path.name + '.part')
+    part.write_bytes(body)
+    part.with_name(part.name + '.json').write_text(json.dumps({'etag': ETAG, 'last_modified': None}))
+    return part
+
+
+def test_interrupted_download_resumes_from_part(extractor, image_server, tmp_path):
+    image_server['cuts'] = 1
+    target = tmp_path / 'image.jpg'
+
+    assert extractor.download_image(image_server['url'], target) == {
+        'status': 'downloaded', 'etag': ETAG, 'last_modified': None
+    }
+    assert target.read_bytes() == IMAGE
+    assert image_server['requests'] == [None, 'bytes=8192-']
+    assert not target.with_name('image.jpg.part').exists()
+
+
+def test_resuming_counts_against_retry_budget(extractor, image_server, tmp_path):
+    # 毎回途中で切れても、試行は max_retries + 1 回で終わる
+    image_server['cuts'] = 10
+    target = tmp_path / 'image.jpg'
+
+    assert extractor.download_image(image_server['url'], target) is False
+    assert image_server['requests'] == [None, 'bytes=8192-', 'bytes=16384-']
+    # 次回はここから再開できる
+    assert target.with_name('image.jpg.part').stat().st_size == 3 * 8192
+
+
+def test_complete_part_is_finalized_on_416(extractor, image_server, tmp_path):
+    # 前回すべて受信したが置き換える前に止まった
+    target = tmp_path / 'image.jpg'
+    part = write_part(target, IMAGE)
+
+    assert extractor.download_image(image_server['url'], target)['status'] == 'downloaded'
+    assert target.read_bytes() == IMAGE
+    assert image_server['requests'] == [f'bytes={len(IMAGE)}-']
+    assert not part.exists() and not part.with_name(part.name + '.json').exists()
+
+
+def test_oversized_part_is_discarded_on_416(extractor, image_server, tmp_path):
+    target = tmp_path / 'image.jpg'
+    write_part(target, IMAGE + b'garbage')
+
+    assert extractor.download_image(image_server['url'], target)['status'] == 'downloaded'
+    assert target.read_bytes() == IMAGE
+    assert image_server['requests'] == [f'bytes={len(IMAGE) + 7}-', None]
+
+
+def test_concurrent_fetches_of_one_url_share_the_download(extractor, image_server):
+    image_server['delay'] = 0.2
+    paths = []
+    threads = [threading.Thread(target=lambda: paths.append(extractor._fetch_image(image_server['url'])))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert image_server['requests'] == [None]
+    assert len(set(paths)) == 1 and paths[0].read_bytes() == IMAGE
+
+
+def test_downloads_reuse_the_shared_pooled_session(extractor, image_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(http_client, '_session', None)
+    session = http_client.get_session()
+
+    assert http_client.get_session() is session
+    adapter = session.get_adapter(image_server['url'])
+    assert adapter is session.get_adapter('https://cbu01.alicdn.com/img/a.jpg')
+    assert adapter.poolmanager.connection_pool_kw['maxsize'] == http_client.POOL_MAXSIZE
+
+    for name in ('first.jpg', 'second.jpg'):
+        assert extractor.download_image(image_server['url'], tmp_path / name)['status'] == 'downloaded'
+    # 2回目のダウンロードは同じ keep-alive 接続で送られる
+    assert len(image_server['clients']) == 2
+    assert len(set(image_server['clients'])) == 1
+
+
+@pytest.mark.parametrize('configured, expected', [
+    (3, 3), ('4', 4), (0, 1), (-2, 1), (10_000, http_client.POOL_MAXSIZE),
+])
+def test_download_concurrency_is_clamped_to_the_pool(extractor, configured, expected):
+    extractor.config['output']['download_concurrency'] = configured
+
+    assert extractor._download_concurrency() == expected
+
+
+def test_organize_images_bounds_concurrent_downloads(extractor, monkeypatch):
+    extractor.config['output']['download_concurrency'] = 3
+    state = {'active': 0, 'peak': 0, 'calls': 0}
+    lock = threading.Lock()
+
+    def fetch(image_url):
+        with lock:
+            state['calls'] += 1
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+        time.sleep(0.05)
+        with lock:
+            state['active'] -= 1
+        return None
+
+    monkeypatch.setattr(extractor, '_fetch_image', fetch)
+    image_urls = [f'https://cbu01.alicdn.com/img/ibank/O1CN{i:02d}.jpg' for i in range(12)]
+
+    assert extractor.organize_images({'title': 'bounded', 'image_urls': image_urls}) == []
+    assert state['calls'] == 12
+    assert state['peak'] == 3
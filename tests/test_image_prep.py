@@ -0,0 +1,45 @@
+"""
+画像分析に送る前の縮小のテスト（形式名の扱い、プロセスプールでの変換）
+"""
+import io
+
+import pytest
+
+pytest.importorskip('PIL')
+from PIL import Image
+
+from src import image_prep
+from src.image_prep import normalize_image_format, prepare_image, prepare_images
+
+
+@pytest.fixture
+def photo(tmp_path):
+    path = tmp_path / 'photo.png'
+    image = Image.effect_noise((1600, 1200), 64).convert('RGB')
+    image.save(path)
+    return path
+
+
+@pytest.mark.parametrize('name,expected', [('jpg', 'JPEG'), ('JPG', 'JPEG'), ('jpeg', 'JPEG'), ('webp', 'WEBP')])
+def test_format_names_are_normalized(name, expected):
+    assert normalize_image_format(name) == expected
+
+
+def test_jpg_config_value_is_encoded_as_jpeg(photo):
+    data, mime_type, original_bytes = prepare_image(photo, max_edge=400, image_format=normalize_image_format('jpg'))
+    assert mime_type == 'image/jpeg'
+    assert len(data) < original_bytes
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.format == 'JPEG' and max(image.size) == 400
+
+
+def test_pool_does_not_fork(photo, monkeypatch):
+    monkeypatch.setattr(image_prep, 'VISION_PREP_WORKERS', 1)
+    monkeypatch.setattr(image_prep, '_pool', None)
+    pool = image_prep.get_prep_pool()
+    try:
+        assert pool._mp_context.get_start_method() in ('forkserver', 'spawn')
+        [prepared] = prepare_images([photo], max_edge=400)
+        assert prepared.mime_type == 'image/jpeg' and prepared.saved_bytes > 0
+    finally:
+        pool.shutdown()
@@ -0,0 +1,116 @@
+"""
+商品処理ジョブのエンドポイントのテスト（登録 → 状態確認、キュー満杯、再起動後の再開）
+"""
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+import main
+from src.jobs import JobQueue, JobStore, SUCCEEDED
+
+ROOT = Path(__file__).resolve().parent.parent
+OFFER_URL = 'https://detail.1688.com/offer/123456789.html'
+
+
+def fake_runner(url, custom_instructions, progress_callback):
+    progress_callback({'total_images': 2, 'downloaded': 2, 'analyzed': 2})
+    return {'title': 'テスト商品', 'url': url, 'custom_instructions': custom_instructions}
+
+
+@pytest.fixture
+def client():
+    return main.app.test_client()
+
+
+@pytest.fixture
+def start_jobs(monkeypatch):
+    queues = []
+
+    def start(runner=fake_runner, store=None, **options):
+        monkeypatch.setattr(main, 'job_queue', None)
+        queue = main.start_background_jobs(JobQueue(store or JobStore(':memory:'), runner, **options))
+        queues.append(queue)
+        return queue
+
+    yield start
+    for queue in queues:
+        queue.shutdown()
+
+
+def wait_for_status(client, job_id, status, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f'/jobs/{job_id}').get_json()
+        if job['status'] == status:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f'job {job_id} did not reach {status}: {job}')
+
+
+def test_importing_main_does_not_start_jobs(tmp_path):
+    # import だけでは jobs.db を作らず、未完了ジョブも再開しない
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    subprocess.run([sys.executable, '-c', 'import main; assert main.job_queue is None'],
+                   cwd=tmp_path, env=env, check=True, capture_output=True)
+    assert not (tmp_path / 'jobs.db').exists()
+
+
+def test_job_endpoints_unavailable_before_start(client, monkeypatch):
+    monkeypatch.setattr(main, 'job_queue', None)
+    assert client.post('/jobs', json={'url': OFFER_URL}).status_code == 503
+    assert client.get('/jobs').status_code == 503
+
+
+def test_submit_and_poll_job(client, start_jobs):
+    start_jobs()
+    response = client.post('/jobs', json={'url': OFFER_URL, 'custom_instructions': '色で分ける'})
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+
+    job = wait_for_status(client, job_id, SUCCEEDED)
+    assert job['summary'] == {'title': 'テスト商品', 'url': OFFER_URL, 'custom_instructions': '色で分ける'}
+    assert job['progress'] == {'total_images': 2, 'downloaded': 2, 'analyzed': 2}
+    assert job['attempts'] == 1
+    assert [item['id'] for item in client.get('/jobs').get_json()['jobs']] == [job_id]
+
+    assert client.post('/jobs', json={'url': 'https://example.com/'}).status_code == 400
+    assert client.get('/jobs/missing').status_code == 404
+
+
+def test_full_queue_returns_429(client, start_jobs):
+    release = threading.Event()
+
+    def blocking_runner(url, custom_instructions, progress_callback):
+        release.wait(5)
+        return {}
+
+    start_jobs(blocking_runner, max_workers=1, max_queued=2)
+    try:
+        assert client.post('/jobs', json={'url': OFFER_URL}).status_code == 202
+        assert client.post('/jobs', json={'url': OFFER_URL}).status_code == 202
+        response = client.post('/jobs', json={'url': OFFER_URL})
+        assert response.status_code == 429
+        assert response.get_json()['success'] is False
+    finally:
+        release.set()
+
+
+def test_unfinished_jobs_resume_on_start(client, start_jobs, tmp_path):
+    # 前回のプロセスで登録されたまま・実行中のまま終わったジョブ
+    path = str(tmp_path / 'jobs.db')
+    store = JobStore(path)
+    queued = store.create(OFFER_URL)
+    interrupted = store.create(OFFER_URL, '途中で停止')
+    store.mark_running(interrupted)
+    store.close()
+
+    start_jobs(store=JobStore(path))
+    assert wait_for_status(client, queued, SUCCEEDED)['attempts'] == 1
+    job = wait_for_status(client, interrupted, SUCCEEDED)
+    assert job['attempts'] == 2 and job['summary']['custom_instructions'] == '途中で停止'
+    assert client.get('/jobs').get_json()['counts'] == {SUCCEEDED: 2}
@@ -0,0 +1,96 @@
+"""
+メトリクスのテスト（Prometheus テキスト形式の出力、ラベル値の制限、例外のエラー種別）
+"""
+import pytest
+import requests
+
+import main
+from src.metrics import MetricsRegistry, error_class
+from src.resilience import CircuitOpenError
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry()
+
+
+def test_counter_renders_prometheus_text(registry):
+    counter = registry.counter('extract_requests', 'Extractions by outcome.', labels={'outcome': ('success', 'error')})
+    counter.inc(outcome='success')
+    counter.inc(2, outcome='error')
+
+    assert registry.render() == (
+        '# HELP extract_requests Extractions by outcome.\n'
+        '# TYPE extract_requests counter\n'
+        'extract_requests_total{outcome="error"} 2\n'
+        'extract_requests_total{outcome="success"} 1\n'
+    )
+
+
+def test_histogram_renders_cumulative_buckets(registry):
+    histogram = registry.histogram('page_bytes', 'Page size.', buckets=(10, 100))
+    for value in (5, 50, 50, 500):
+        histogram.observe(value)
+
+    assert registry.render().splitlines()[2:] == [
+        'page_bytes_bucket{le="10"} 1',
+        'page_bytes_bucket{le="100"} 3',
+        'page_bytes_bucket{le="+Inf"} 4',
+        'page_bytes_sum 605',
+        'page_bytes_count 4',
+    ]
+
+
+def test_timer_observes_elapsed_seconds(registry):
+    histogram = registry.histogram('stage_seconds', 'Stage time.', labels={'stage': ('fetch',)})
+    with histogram.time(stage='fetch'):
+        pass
+    [(total, count)] = histogram.totals().values()
+    assert count == 1 and 0 <= total < 1
+
+
+def test_unknown_label_values_are_bounded_to_other(registry):
+    counter = registry.counter('errors', 'Errors.', labels={'stage': ('download', 'vision')})
+    for i in range(100):
+        counter.inc(stage=f'https://detail.1688.com/offer/{i}.html')
+    counter.inc(stage='download')
+
+    lines = [line for line in registry.render().splitlines() if not line.startswith('#')]
+    assert lines == ['errors_total{stage="download"} 1', 'errors_total{stage="other"} 100']
+
+
+def test_label_names_must_match(registry):
+    counter = registry.counter('errors', 'Errors.', labels={'stage': ('download',)})
+    with pytest.raises(ValueError):
+        counter.inc(service='download')
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(response=response)
+
+
+@pytest.mark.parametrize('error,expected', [
+    (requests.exceptions.ReadTimeout(), 'timeout'),
+    (TimeoutError(), 'timeout'),
+    (requests.exceptions.ConnectionError(), 'connection'),
+    (ConnectionResetError(), 'connection'),
+    (CircuitOpenError('detail.1688.com', 5.0), 'circuit_open'),
+    (http_error(404), 'http_4xx'),
+    (http_error(503), 'http_5xx'),
+    (ValueError('bad json'), 'decode'),
+    (type('PageTooLargeError', (Exception,), {})(), 'too_large'),
+    (RuntimeError('boom'), 'other'),
+])
+def test_error_class(error, expected):
+    assert error_class(error) == expected
+
+
+def test_metrics_endpoint():
+    response = main.app.test_client().get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type == 'text/plain; version=0.0.4; charset=utf-8'
+    body = response.get_data(as_text=True)
+    assert '# TYPE extract_stage_seconds histogram' in body
+    assert '# TYPE outbound_retries counter' in body
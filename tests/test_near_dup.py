@@ -0,0 +1,112 @@
+"""
+近似重複画像のまとめのテスト（色違いを分けること、代表の選び方、分析結果の引き継ぎ）
+"""
+import time
+
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('PIL')
+import numpy as np
+from PIL import Image, ImageDraw
+
+from src.extractor import Alibaba1688ImageExtractor
+from src.near_dup import NearDuplicateIndex, dhash
+
+RED = (210, 40, 40)
+BLUE = (40, 60, 200)
+
+
+def product_photo(path, color, watermark=False, quality=None):
+    """白背景に陰影のついた商品（同じ型で色だけを変えられる）"""
+    image = Image.new('RGB', (320, 320), 'white')
+    shading = np.linspace(0.6, 1.0, 200)[np.newaxis, :, np.newaxis]
+    body = (np.array(color)[np.newaxis, np.newaxis, :] * shading).astype(np.uint8)
+    image.paste(Image.fromarray(np.repeat(body, 220, axis=0)), (60, 60))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((20, 60, 60, 140), fill=color)
+    draw.rectangle((260, 60, 300, 140), fill=color)
+    if watermark:
+        draw.text((230, 295), '1688', fill=(200, 200, 200))
+    image.save(path, quality=quality or 95)
+    return path
+
+
+@pytest.fixture
+def photos(tmp_path):
+    return {
+        'red': product_photo(tmp_path / 'red.png', RED),
+        'red_copy': product_photo(tmp_path / 'red_copy.jpg', RED, watermark=True, quality=60),
+        'blue': product_photo(tmp_path / 'blue.png', BLUE),
+    }
+
+
+def test_color_variants_are_not_clustered(photos):
+    # 明暗だけを見る dHash では色違いも同じ画像に見える
+    assert np.count_nonzero(dhash(photos['red']) != dhash(photos['blue'])) <= 5
+
+    index = NearDuplicateIndex(max_distance=5)
+    assert index.assign('red', photos['red']) is None
+    assert index.assign('blue', photos['blue']) is None
+    assert index.assign('red_copy', photos['red_copy']) == 'red'
+    assert index.stats()['clusters'] == 2
+
+
+def test_near_duplicates_are_off_by_default(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    extractor = Alibaba1688ImageExtractor(config_path='missing.yaml', demo_mode=True)
+    assert extractor._near_duplicate_index() is None
+
+
+@pytest.fixture
+def extractor(tmp_path, monkeypatch, photos):
+    monkeypatch.chdir(tmp_path)
+    extractor = Alibaba1688ImageExtractor(config_path='missing.yaml', demo_mode=True)
+    extractor.config['output']['near_duplicate_max_distance'] = 5
+    extractor.config['output']['create_metadata'] = False
+    extractor.analyzed = []
+    extractor.failing = set()
+
+    # 番号の大きい画像ほど先にダウンロードが終わる
+    order = ['red', 'red_copy', 'blue', 'red_copy']
+
+    def fetch_image(image_url):
+        index = int(image_url.rsplit('/', 1)[1])
+        time.sleep(0.05 * (len(order) - index))
+        return photos[order[index]]
+
+    def analyze(image_path):
+        extractor.analyzed.append(image_path.name)
+        if image_path.name in extractor.failing:
+            return {'suggested_folder': 'error', 'error': 'boom'}
+        color = image_path.stem.split('_')[0]
+        return {'suggested_folder': f'{color}系', 'colors': [color], 'source': image_path.name}
+
+    extractor._fetch_image = fetch_image
+    extractor.analyze_images_with_openai = lambda images, *args: [analyze(path) for path, _ in images]
+    extractor.analyze_image_with_openai = lambda image_path, *args, **kwargs: analyze(image_path)
+    return extractor
+
+
+def organize(extractor):
+    product_info = {'title': 'test', 'image_urls': [f'https://example.com/{i}' for i in range(4)]}
+    return extractor.organize_images(product_info)
+
+
+def test_followers_inherit_from_first_image_in_cluster(extractor):
+    results = organize(extractor)
+
+    assert sorted(extractor.analyzed) == ['blue.png', 'red.png']
+    assert [result['analysis']['suggested_folder'] for result in results] == ['red系', 'red系', 'blue系', 'red系']
+    assert results[1]['analysis']['near_duplicate_of'] == 'https://example.com/0'
+    assert 'near_duplicate_of' not in results[2]['analysis']
+    assert extractor.near_duplicate_stats['analysis_calls_skipped'] == 2
+
+
+def test_followers_of_failed_analysis_are_analyzed_themselves(extractor):
+    extractor.failing.add('red.png')
+    results = organize(extractor)
+
+    assert sorted(extractor.analyzed) == ['blue.png', 'red.png', 'red_copy.jpg', 'red_copy.jpg']
+    assert results[1]['analysis'] == {'suggested_folder': 'red系', 'colors': ['red'], 'source': 'red_copy.jpg'}
+    assert extractor.near_duplicate_stats['analysis_calls_skipped'] == 0
@@ -0,0 +1,48 @@
+"""
+埋め込みオファーデータからの抽出結果のテスト（相対パスの画像、構造化データに有効な画像が無い場合）
+"""
+import json
+
+from src.offer_data import extract_offer_data
+from src.offer_result import extract_from_content
+
+OFFER_URL = 'https://detail.1688.com/offer/1.html'
+DOM_IMAGE = 'https://cbu01.alicdn.com/img/ibank/O1CN01dom_!!2200000000000-0-cib.jpg'
+
+
+def page(init_data, body=''):
+    return (
+        '<html><head><title>テスト商品 - 阿里巴巴</title></head><body>'
+        f'<script>window.__INIT_DATA = {json.dumps(init_data)}</script>{body}</body></html>'
+    ).encode('utf-8')
+
+
+def test_relative_image_uris_are_resolved_against_cdn():
+    offer = extract_offer_data(page({
+        'subject': 'テスト商品',
+        'offerImgList': [{'imageURI': 'img/ibank/O1CN01rel.jpg'}, '//cbu01.alicdn.com/img/ibank/O1CN01abs.jpg'],
+        'skuProps': [{'value': [{'imageUrl': '/img/ibank/O1CN01sku.jpg'}]}]
+    }))
+    assert offer.image_urls == [
+        'https://cbu01.alicdn.com/img/ibank/O1CN01rel.jpg',
+        '//cbu01.alicdn.com/img/ibank/O1CN01abs.jpg',
+        'https://cbu01.alicdn.com/img/ibank/O1CN01sku.jpg',
+    ]
+
+
+def test_relative_gallery_image_is_extracted():
+    content = page({'subject': 'テスト商品', 'offerImgList': [{'imageURI': 'img/ibank/O1CN01rel.jpg'}]})
+    result = extract_from_content(OFFER_URL, content)
+    assert result['extraction_method'] == 'structured'
+    assert [image['original_url'] for image in result['images']] == ['https://cbu01.alicdn.com/img/ibank/O1CN01rel.jpg']
+
+
+def test_page_scan_runs_when_offer_data_has_no_valid_images():
+    # 構造化データの画像がすべて無効（画像でないURL）でも、DOM の画像は失わない
+    content = page({'subject': 'テスト商品', 'offerImgList': [{'imageURI': 'https://example.com/spacer.gif'}]},
+                   f'<div class="detail-gallery"><img src="{DOM_IMAGE}"></div>')
+    result = extract_from_content(OFFER_URL, content)
+
+    assert result['success'] and result['title'] == 'テスト商品'
+    assert result['extraction_method'] == 'scraped'
+    assert [image['original_url'] for image in result['images']] == [DOM_IMAGE]
@@ -0,0 +1,119 @@
+"""
+商品ページキャッシュのテスト（TTL・LRU・条件付きリクエストでの再検証・失敗結果のネガティブキャッシュ）
+"""
+import gzip
+from pathlib import Path
+
+import pytest
+
+import main
+from src import rate_limit, replay, resilience
+from src.page_cache import OfferPageCache, canonical_offer_id
+from src.rate_limit import HostRateLimiter
+from src.replay import ReplayServer, ResponseArchive
+from src.resilience import BreakerRegistry, RetryPolicy
+
+CORPUS_DIR = Path(__file__).resolve().parent.parent / 'benchmarks' / 'corpus'
+OFFER_URL = 'https://detail.1688.com/offer/123456789.html'
+MISSING_URL = 'https://detail.1688.com/offer/404.html'
+
+
+def test_offer_id_ignores_query():
+    assert canonical_offer_id(OFFER_URL + '?spm=a26352.13672862') == '123456789'
+    assert canonical_offer_id('https://www.1688.com/') is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = OfferPageCache(max_entries=2)
+    cache.put('1', {'n': 1})
+    cache.put('2', {'n': 2})
+    assert cache.lookup('1').result == {'n': 1}
+    cache.put('3', {'n': 3})
+
+    assert cache.lookup('2') is None
+    assert cache.lookup('1') is not None and cache.lookup('3') is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_expired_entries_are_kept_for_revalidation():
+    cache = OfferPageCache(ttl=0)
+    cache.put('1', {'n': 1}, etag='"v1"', last_modified='Wed, 01 Jan 2025 00:00:00 GMT')
+    entry = cache.lookup('1')
+    assert not entry.is_fresh()
+    assert entry.conditional_headers() == {
+        'If-None-Match': '"v1"', 'If-Modified-Since': 'Wed, 01 Jan 2025 00:00:00 GMT'
+    }
+
+    cache.ttl = 60
+    cache.mark_revalidated('1')
+    assert cache.lookup('1').is_fresh()
+    assert cache.stats()['stale'] == 1 and cache.stats()['revalidated'] == 1
+
+
+def test_failures_are_cached_without_validators():
+    cache = OfferPageCache(negative_ttl=60)
+    cache.put_failure('1', {'success': False})
+    entry = cache.lookup('1')
+    assert entry.negative and entry.is_fresh()
+    assert entry.conditional_headers() == {}
+    assert cache.stats()['negative_hits'] == 1
+
+
+@pytest.fixture
+def replay_server(tmp_path):
+    archive = ResponseArchive(tmp_path / 'archive')
+    body = gzip.decompress((CORPUS_DIR / 'modern_offer.html.gz').read_bytes())
+    archive.save(OFFER_URL, 200, {'Content-Type': 'text/html; charset=utf-8', 'ETag': '"v1"'}, body)
+    server = ReplayServer(archive)
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def cache(monkeypatch, replay_server):
+    monkeypatch.setattr(replay, 'REPLAY_SERVER_URL', replay_server.base_url)
+    monkeypatch.setattr(rate_limit, '_limiter', HostRateLimiter({'detail': {'rate': 1000, 'burst': 100}}))
+    monkeypatch.setattr(resilience, '_policy', RetryPolicy(max_retries=0))
+    monkeypatch.setattr(resilience, 'circuit_breakers', BreakerRegistry())
+    cache = OfferPageCache(ttl=60, negative_ttl=60)
+    monkeypatch.setattr(main, 'page_cache', cache)
+    return cache
+
+
+def test_fresh_result_is_served_without_fetching(cache, replay_server):
+    first = main.extract_1688_images(OFFER_URL, 20)
+    assert first['success']
+
+    # クエリ違いも同じ商品IDとして返し、件数は呼び出しごとに切り詰める
+    second = main.extract_1688_images(OFFER_URL + '?spm=x', 2)
+    assert replay_server.stats()['hits'] == 1
+    assert second['url'] == OFFER_URL + '?spm=x'
+    assert second['images'] == first['images'][:2]
+    assert cache.stats()['hits'] == 1
+
+
+def test_stale_result_is_revalidated_with_etag(cache, replay_server):
+    first = main.extract_1688_images(OFFER_URL, 20)
+    cache.ttl = 0
+    cache.mark_revalidated(canonical_offer_id(OFFER_URL))
+
+    assert main.extract_1688_images(OFFER_URL, 20) == first
+    assert replay_server.stats()['hits'] == 1
+    assert replay_server.stats()['not_modified'] == 1
+    assert cache.stats()['stale'] == 1
+
+
+def test_failures_are_negatively_cached(cache, replay_server):
+    first = main.extract_1688_images(MISSING_URL, 20)
+    assert first['success'] is False
+
+    assert main.extract_1688_images(MISSING_URL, 20) == first
+    assert replay_server.stats()['misses'] == 1
+    assert cache.stats()['negative_hits'] == 1
+
+    # 期限が切れたら取り直す
+    cache.negative_ttl = 0
+    cache.put_failure(canonical_offer_id(MISSING_URL), first)
+    main.extract_1688_images(MISSING_URL, 20)
+    assert replay_server.stats()['misses'] == 2
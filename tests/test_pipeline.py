@@ -0,0 +1,87 @@
+"""
+段階的パイプラインのテスト（項目の受け渡し・上限付きキューの背圧・まとめ処理・段の失敗）
+"""
+import threading
+import time
+
+from src.pipeline import Stage, StagedPipeline
+
+
+def test_items_flow_through_every_stage():
+    pipeline = StagedPipeline([
+        Stage('double', lambda x: x * 2, workers=3),
+        # None を返した項目は次の段に渡さない
+        Stage('drop_odd_tens', lambda x: None if x % 20 == 10 else x),
+        Stage('format', lambda x: f'#{x}', workers=2)
+    ])
+    results = pipeline.run(range(20))
+
+    assert sorted(results, key=lambda s: int(s[1:])) == [f'#{x * 2}' for x in range(20) if x * 2 % 20 != 10]
+    stats = pipeline.stats()
+    assert stats['double']['processed'] == 20
+    assert stats['drop_odd_tens']['dropped'] == 2
+    assert stats['format']['processed'] == 18
+
+
+def test_bounded_queues_apply_backpressure():
+    produced = []
+
+    def items():
+        for i in range(10):
+            produced.append(i)
+            yield i
+
+    release = threading.Event()
+    pipeline = StagedPipeline([
+        Stage('fast', lambda x: x),
+        Stage('slow', lambda x: release.wait(5) and x)
+    ], queue_size=2)
+    thread = threading.Thread(target=pipeline.run, args=(items(),))
+    thread.start()
+    time.sleep(0.2)
+    # 遅い段が詰まっている間、前段と入力は上限分しか先に進まない
+    assert len(produced) < 10
+    release.set()
+    thread.join(5)
+
+    assert len(produced) == 10
+    assert all(stats['max_queue_depth'] <= 2 for stats in pipeline.stats().values())
+
+
+def test_batch_stage_collects_items():
+    batches = []
+
+    def analyze(batch):
+        batches.append(len(batch))
+        return [x + 100 for x in batch]
+
+    pipeline = StagedPipeline([
+        Stage('download', lambda x: x),
+        Stage('vision', analyze, batch_size=4, batch_wait=0.2)
+    ], queue_size=8)
+    results = pipeline.run(range(10))
+
+    assert sorted(results) == list(range(100, 110))
+    assert max(batches) <= 4 and sum(batches) == 10 and len(batches) < 10
+
+
+def test_fan_out_stage_emits_any_number_of_items():
+    pipeline = StagedPipeline([
+        Stage('split', lambda x: [x] * x, fan_out=True),
+        Stage('collect', lambda x: x)
+    ])
+    assert sorted(pipeline.run([0, 1, 2, 3])) == [1, 2, 2, 3, 3, 3]
+
+
+def test_stage_failures_are_counted_without_stopping_the_pipeline():
+    def flaky(x):
+        if x == 3:
+            raise ValueError('broken image')
+        return x
+
+    pipeline = StagedPipeline([Stage('flaky', flaky, workers=2), Stage('collect', lambda x: x)])
+    results = pipeline.run(range(6))
+
+    assert sorted(results) == [0, 1, 2, 4, 5]
+    assert pipeline.stats()['flaky']['failed'] == 1
+    assert pipeline.elapsed > 0
@@ -0,0 +1,38 @@
+"""
+共有レート制限の設定のテスト（先に引数なしで作られても、後から渡した site_config が反映される）
+"""
+import pytest
+
+from src import rate_limit
+from src.rate_limit import ALICDN, DETAIL, VISION, get_rate_limiter
+
+
+@pytest.fixture(autouse=True)
+def fresh_limiter(monkeypatch):
+    monkeypatch.setattr(rate_limit, '_limiter', None)
+
+
+def test_later_site_config_updates_shared_buckets():
+    # ページ取得が先に既定値で作る
+    limiter = get_rate_limiter()
+    assert limiter.buckets[DETAIL].configured_rate == rate_limit.DEFAULT_RATE_LIMITS[DETAIL]['rate']
+
+    site_config = {'rate_limits': {'detail': {'rate': 0.5, 'burst': 2}}, 'delay_between_requests': 4}
+    assert get_rate_limiter(site_config) is limiter
+    detail = limiter.buckets[DETAIL]
+    assert (detail.configured_rate, detail.burst, detail.tokens) == (0.5, 2.0, 2.0)
+    assert limiter.buckets[VISION].configured_rate == 0.25
+    assert limiter.buckets[ALICDN].configured_rate == rate_limit.DEFAULT_RATE_LIMITS[ALICDN]['rate']
+
+    # 引数なしの呼び出しでは設定は戻らない
+    assert get_rate_limiter().buckets[DETAIL].configured_rate == 0.5
+
+
+def test_reconfiguring_keeps_throttled_ratio():
+    limiter = get_rate_limiter({'rate_limits': {'detail': {'rate': 4, 'burst': 4}}})
+    limiter.observe('https://detail.1688.com/offer/1.html', 429, {'Retry-After': '0'})
+    assert limiter.buckets[DETAIL].rate == 2.0
+
+    get_rate_limiter({'rate_limits': {'detail': {'rate': 8, 'burst': 4}}})
+    assert limiter.buckets[DETAIL].rate == 4.0
+    assert limiter.buckets[DETAIL].min_rate == 8 * rate_limit.MIN_RATE_FRACTION
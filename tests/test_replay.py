@@ -0,0 +1,207 @@
+"""
+記録・再生のテスト（記録 → アーカイブ → 再生サーバー経由の取得と障害注入）
+"""
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+import requests
+
+from src import replay, resilience
+from src.http_client import fetch_page, iter_page_chunks, read_page_body
+from src.offer_result import extract_from_content
+from src.replay import FaultConfig, ReplayServer, ResponseArchive
+from src.resilience import BreakerRegistry, RetryPolicy
+
+CORPUS_DIR = Path(__file__).resolve().parent.parent / 'benchmarks' / 'corpus'
+OFFER_URL = 'https://detail.1688.com/offer/123456789.html'
+
+
+IMAGE_URL = 'https://cbu01.alicdn.com/img/ibank/O1CN01replay.jpg'
+IMAGE = bytes(range(256)) * 256
+LAST_MODIFIED = 'Wed, 01 Jan 2025 00:00:00 GMT'
+
+
+@pytest.fixture
+def offer_page():
+    return gzip.decompress((CORPUS_DIR / 'modern_offer.html.gz').read_bytes())
+
+
+@pytest.fixture
+def archive(tmp_path, offer_page):
+    archive = ResponseArchive(tmp_path / 'archive')
+    archive.save(OFFER_URL, 200, {'Content-Type': 'text/html; charset=utf-8', 'ETag': '"v1"'}, offer_page)
+    return archive
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    # 注入したエラーの再試行で待たないようにし、ブレーカーの状態もテストごとに分ける
+    monkeypatch.setattr(resilience, '_policy', RetryPolicy(max_retries=1, base_delay=0.01))
+    monkeypatch.setattr(resilience, 'circuit_breakers', BreakerRegistry())
+
+
+@pytest.fixture
+def start_replay(monkeypatch):
+    servers = []
+
+    def start(archive, **faults):
+        server = ReplayServer(archive, FaultConfig(**faults))
+        monkeypatch.setattr(replay, 'REPLAY_SERVER_URL', server.start())
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def origin(offer_page):
+    """ETag 付きで商品ページを返し、If-None-Match が一致すれば 304 を返すサーバー"""
+    class Origin(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.headers.get('If-None-Match') == '"origin"':
+                self.send_response(304)
+                self.send_header('ETag', '"origin"')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('ETag', '"origin"')
+            self.send_header('Content-Length', str(len(offer_page)))
+            self.end_headers()
+            self.wfile.write(offer_page)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Origin)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/offer/1.html'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def recorded_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(replay, 'REPLAY_RECORD_DIR', str(tmp_path / 'recorded'))
+    monkeypatch.setattr(replay, '_recorder', None)
+    return tmp_path / 'recorded'
+
+
+def test_record_mode_captures_fetched_pages(origin, recorded_dir, offer_page):
+    body = read_page_body(fetch_page(origin, stream=True))
+
+    # 記録しても呼び出し側は本文をそのまま読める
+    assert body == offer_page
+    meta, recorded = ResponseArchive(recorded_dir).load(origin)
+    assert recorded == offer_page
+    assert meta['status'] == 200 and meta['headers']['ETag'] == '"origin"'
+
+
+def test_revalidation_does_not_overwrite_recorded_page(origin, recorded_dir, offer_page):
+    read_page_body(fetch_page(origin, stream=True))
+    response = fetch_page(origin, headers={'If-None-Match': '"origin"'}, stream=True)
+    assert response.status_code == 304
+
+    meta, recorded = ResponseArchive(recorded_dir).load(origin)
+    assert meta['status'] == 200 and recorded == offer_page
+
+
+def test_recording_reads_body_with_the_callers_cap(origin, recorded_dir):
+    def read_capped(response):
+        return b''.join(iter_page_chunks(response, chunk_size=1024, max_bytes=4096, max_decoded_bytes=4096))
+
+    response = requests.get(origin, stream=True)
+    replay.record_response(origin, response, read_body=read_capped)
+
+    _, recorded = ResponseArchive(recorded_dir).load(origin)
+    assert 0 < len(recorded) <= 4096
+    # 呼び出し側も記録したものと同じ本文を読む
+    assert read_page_body(response) == recorded
+
+
+def test_replay_serves_archive_with_latency(archive, start_replay):
+    server = start_replay(archive, latency=0.2)
+    started = time.perf_counter()
+    response = fetch_page(OFFER_URL, stream=True)
+    result = extract_from_content(OFFER_URL, read_page_body(response))
+    assert time.perf_counter() - started >= 0.2
+    assert result['success'] and result['extraction_method'] == 'structured'
+
+    # 記録時の ETag で条件付きリクエストに 304 を返す
+    assert fetch_page(OFFER_URL, headers={'If-None-Match': '"v1"'}).status_code == 304
+    assert fetch_page('https://detail.1688.com/offer/999.html').status_code == 404
+    assert server.stats() == {'hits': 1, 'misses': 1, 'not_modified': 1, 'partial': 0, 'unsatisfiable': 0,
+                              'errors': 0, 'resets': 0}
+
+
+def test_replay_injects_errors_and_limits_bandwidth(archive, offer_page, start_replay):
+    start_replay(archive, error_rate=1.0, error_status=503)
+    assert fetch_page(OFFER_URL).status_code == 503
+
+    bandwidth = len(offer_page) * 2  # 本文全体で約0.5秒
+    start_replay(archive, bandwidth=bandwidth)
+    started = time.perf_counter()
+    assert read_page_body(fetch_page(OFFER_URL, stream=True)) == offer_page
+    assert time.perf_counter() - started >= 0.4
+
+
+@pytest.fixture
+def image_archive(tmp_path):
+    archive = ResponseArchive(tmp_path / 'images')
+    archive.save(IMAGE_URL, 200, {'Content-Type': 'image/jpeg', 'ETag': '"img"', 'Last-Modified': LAST_MODIFIED}, IMAGE)
+    return archive
+
+
+def replay_get(headers):
+    return requests.get(replay.replay_url(IMAGE_URL), headers=headers, timeout=5)
+
+
+def test_replay_serves_byte_ranges(image_archive, start_replay):
+    server = start_replay(image_archive)
+
+    response = replay_get({'Range': 'bytes=100-', 'If-Range': '"img"'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 100-{len(IMAGE) - 1}/{len(IMAGE)}'
+    assert response.content == IMAGE[100:]
+    assert replay_get({'Range': 'bytes=0-9'}).content == IMAGE[:10]
+    assert replay_get({'Range': 'bytes=-16'}).content == IMAGE[-16:]
+
+    # 範囲外は 416、元が変わった（If-Range 不一致）なら全体
+    response = replay_get({'Range': f'bytes={len(IMAGE)}-', 'If-Range': '"img"'})
+    assert response.status_code == 416 and response.headers['Content-Range'] == f'bytes */{len(IMAGE)}'
+    response = replay_get({'Range': 'bytes=100-', 'If-Range': '"old"'})
+    assert response.status_code == 200 and response.content == IMAGE
+    assert server.stats()['partial'] == 3 and server.stats()['unsatisfiable'] == 1
+
+
+def test_replay_revalidates_with_last_modified(image_archive, start_replay):
+    start_replay(image_archive)
+    assert replay_get({'If-Modified-Since': LAST_MODIFIED}).status_code == 304
+    assert replay_get({'If-Modified-Since': 'Thu, 02 Jan 2025 00:00:00 GMT'}).status_code == 304
+    assert replay_get({'If-Modified-Since': 'Tue, 31 Dec 2024 00:00:00 GMT'}).status_code == 200
+    # If-None-Match があればそちらで判断する
+    assert replay_get({'If-None-Match': '"old"', 'If-Modified-Since': LAST_MODIFIED}).status_code == 200
+
+
+def test_interrupted_download_resumes_against_replay(image_archive, start_replay, tmp_path, monkeypatch):
+    from src.extractor import Alibaba1688ImageExtractor
+
+    server = start_replay(image_archive)
+    monkeypatch.chdir(tmp_path)
+    extractor = Alibaba1688ImageExtractor(config_path='missing.yaml', demo_mode=True)
+    target = tmp_path / 'image.jpg'
+    part = target.with_name('image.jpg.part')
+    part.write_bytes(IMAGE[:5000])
+    part.with_name('image.jpg.part.json').write_text(json.dumps({'etag': '"img"', 'last_modified': None}))
+
+    assert extractor.download_image(IMAGE_URL, target)['status'] == 'downloaded'
+    assert target.read_bytes() == IMAGE
+    assert server.stats()['partial'] == 1
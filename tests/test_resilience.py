@@ -0,0 +1,166 @@
+"""
+再試行ポリシーとサーキットブレーカーのテスト（ローカルの障害注入サーバーを相手にする）
+"""
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+import pytest
+import requests
+
+from src.replay import FaultConfig, ReplayServer, ResponseArchive
+from src.resilience import CLOSED, HALF_OPEN, OPEN, BreakerRegistry, CircuitOpenError, RetryPolicy
+
+OFFER_URL = 'https://detail.1688.com/offer/1.html'
+
+
+@pytest.fixture
+def replay_server(tmp_path):
+    archive = ResponseArchive(tmp_path)
+    archive.save(OFFER_URL, 200, {'Content-Type': 'text/html'}, b'<html>ok</html>')
+    server = ReplayServer(archive, FaultConfig())
+    server.start()
+    yield server
+    server.stop()
+
+
+def replay_get(server):
+    url = f"{server.base_url}/replay?url={requests.utils.quote(OFFER_URL, safe='')}"
+    return lambda: requests.get(url, timeout=2)
+
+
+@pytest.fixture
+def flaky_server():
+    """最初の failures 回は 503（Retry-After 付き）を返すサーバー"""
+    state = {'requests': 0, 'failures': 2}
+
+    class Flaky(BaseHTTPRequestHandler):
+        def do_GET(self):
+            state['requests'] += 1
+            failing = state['requests'] <= state['failures']
+            self.send_response(503 if failing else 200)
+            if failing:
+                self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'ok')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Flaky)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/', state
+    server.shutdown()
+    server.server_close()
+
+
+def test_transient_errors_are_retried(flaky_server):
+    url, state = flaky_server
+    policy = RetryPolicy(max_retries=3, base_delay=0.01, seed=1)
+    response = policy.call(url, lambda: requests.get(url, timeout=2), BreakerRegistry())
+    assert response.status_code == 200
+    assert state['requests'] == 3
+    assert policy.retries == 2
+
+
+def test_retries_stop_at_deadline(flaky_server):
+    url, state = flaky_server
+    state['failures'] = 100
+    policy = RetryPolicy(max_retries=50, base_delay=0.1, max_delay=0.1, deadline=0.5, seed=1)
+    started = time.monotonic()
+    breakers = BreakerRegistry(failure_threshold=100)
+    response = policy.call(url, lambda: requests.get(url, timeout=2), breakers)
+    assert response.status_code == 503
+    assert time.monotonic() - started < 1.0
+    assert state['requests'] < 50
+
+
+def test_connection_errors_raise_after_retries():
+    policy = RetryPolicy(max_retries=2, base_delay=0.01)
+    url = 'http://127.0.0.1:1/'
+    with pytest.raises(requests.exceptions.ConnectionError):
+        policy.call(url, lambda: requests.get(url, timeout=1), BreakerRegistry())
+    assert policy.retries == 2
+
+
+def test_breaker_opens_fails_fast_and_recovers(replay_server):
+    breakers = BreakerRegistry(failure_threshold=3, reset_timeout=0.3)
+    policy = RetryPolicy(max_retries=0)
+    send = replay_get(replay_server)
+
+    replay_server.faults.error_rate = 1.0
+    for _ in range(3):
+        assert policy.call(replay_server.base_url, send, breakers).status_code == 503
+    host = '127.0.0.1'
+    assert breakers.snapshot()[host]['state'] == OPEN
+
+    # 開いている間は上流に送らない
+    with pytest.raises(CircuitOpenError):
+        policy.call(replay_server.base_url, send, breakers)
+    assert replay_server.stats()['errors'] == 3
+    assert breakers.snapshot()[host]['rejected'] == 1
+
+    # reset_timeout 後に1件だけ試し、成功すれば閉じる
+    time.sleep(0.35)
+    replay_server.faults.error_rate = 0.0
+    assert policy.call(replay_server.base_url, send, breakers).status_code == 200
+    assert breakers.snapshot()[host]['state'] == CLOSED
+
+
+def test_half_open_probe_failure_reopens(replay_server):
+    breakers = BreakerRegistry(failure_threshold=1, reset_timeout=0.2)
+    policy = RetryPolicy(max_retries=0)
+    send = replay_get(replay_server)
+
+    replay_server.faults.error_rate = 1.0
+    policy.call(replay_server.base_url, send, breakers)
+    time.sleep(0.25)
+    breaker = breakers.breaker_for(replay_server.base_url)
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    # 試行中は他の呼び出しを通さない
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+
+def test_page_fetches_use_site_config_retries(flaky_server, monkeypatch):
+    from src import resilience
+    from src.http_client import fetch_page
+
+    url, state = flaky_server
+    monkeypatch.setattr(resilience, '_policy', None)
+    monkeypatch.setattr(resilience, 'circuit_breakers', BreakerRegistry())
+    # ページ取得が先に既定値で作った共有ポリシーも、site_config で設定し直される
+    assert resilience.get_retry_policy().max_retries == resilience.DEFAULT_MAX_RETRIES
+    resilience.get_retry_policy({'max_retries': 1, 'retry': {'base_delay': 0.01}})
+
+    state['failures'] = 5
+    assert fetch_page(url).status_code == 503
+    assert state['requests'] == 2
+
+
+def test_retry_count_is_exact_across_threads():
+    policy = RetryPolicy(max_retries=1, base_delay=0, seed=1)
+    breakers = BreakerRegistry(failure_threshold=10 ** 6)
+
+    def worker():
+        for _ in range(200):
+            attempts = []
+
+            def send():
+                attempts.append(1)
+                if len(attempts) == 1:
+                    raise requests.exceptions.ConnectionError('reset')
+                return 'ok'
+
+            assert policy.call('https://cbu01.alicdn.com/img/1.jpg', send, breakers) == 'ok'
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert policy.stats()['retries'] == 8 * 200
@@ -0,0 +1,47 @@
+"""
+<script>スキャナーのテスト（ルールごとの findall と同じ候補を返すこと）
+"""
+import re
+
+from src.script_scanner import SCRIPT_RULES, ScriptScanner
+
+# alicdn_json のマッチが、その内側にある imgUrl / src のマッチと重なる
+OVERLAPPING = (
+    'var data = {"main": "https://cbu01.alicdn.com/img/a.jpg?imgUrl:\'b.jpg\'&src:\'c.png\'"};'
+    'var more = {imageUrl: "d.webp", url: "https://img.alicdn.com/e.png"};'
+)
+
+
+def findall_per_rule(script):
+    """旧来の処理: ルールごとに findall した結果を順に集める"""
+    found = {}
+    for name, pattern, ignore_case in SCRIPT_RULES:
+        for value in re.findall(pattern, script, re.IGNORECASE if ignore_case else 0):
+            found.setdefault(value, name)
+    return found
+
+
+def test_overlapping_rule_matches_are_all_found():
+    found = ScriptScanner().scan(OVERLAPPING)
+
+    assert found == findall_per_rule(OVERLAPPING)
+    assert found["https://cbu01.alicdn.com/img/a.jpg?imgUrl:'b.jpg'&src:'c.png'"] == 'alicdn_json'
+    assert found['b.jpg'] == 'img_url'
+    assert found['c.png'] == 'src'
+    assert list(found) == list(findall_per_rule(OVERLAPPING))
+
+
+def test_html_bytes_scan_matches_text_scan():
+    html = (
+        '<html><!-- <script>var x = {src: "hidden.jpg"};</script> -->'
+        f'<script>{OVERLAPPING}</script><p>src: "outside.jpg"</p>'
+        '<script type="text/javascript">var y = {imgUrl: "f.jpg"};</script></html>'
+    ).encode('utf-8')
+    scanner = ScriptScanner()
+
+    found = scanner.scan_html(html)
+
+    expected = findall_per_rule(OVERLAPPING)
+    expected['f.jpg'] = 'img_url'
+    assert found == expected
+    assert 'hidden.jpg' not in found and 'outside.jpg' not in found
@@ -0,0 +1,143 @@
+"""
+single-flight のテスト（同じキーの同時呼び出しを1回にまとめ、結果・例外を共有する）
+"""
+import asyncio
+import threading
+import time
+
+import main
+from src.single_flight import AsyncSingleFlight, SingleFlight
+
+
+def run_concurrently(flight, key, fn, count):
+    """count 個のスレッドから同時に flight.do(key, fn) を呼び、(結果, 共有したか) か例外を返す"""
+    outcomes = []
+    lock = threading.Lock()
+
+    def call():
+        try:
+            outcome = flight.do(key, fn)
+        except Exception as e:
+            outcome = e
+        with lock:
+            outcomes.append(outcome)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+
+def blocking_fn(result=None, error=None):
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        if error is not None:
+            raise error
+        return result
+
+    return fn, started, release, calls
+
+
+def wait_for_waiters(flight, count):
+    while flight.stats()['coalesced'] < count:
+        time.sleep(0.005)
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    fn, started, release, calls = blocking_fn(result={'ok': True})
+    threads, outcomes = run_concurrently(flight, 'offer-1', fn, 4)
+    started.wait(5)
+    wait_for_waiters(flight, 3)
+    assert flight.stats()['in_flight'] == 1
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert sorted(shared for _, shared in outcomes) == [False, True, True, True]
+    assert all(result == {'ok': True} for result, _ in outcomes)
+    assert flight.stats() == {'leaders': 1, 'coalesced': 3, 'in_flight': 0, 'saved_ratio': 0.75}
+
+
+def test_errors_are_shared_and_key_is_released():
+    flight = SingleFlight()
+    fn, started, release, calls = blocking_fn(error=ValueError('upstream down'))
+    threads, outcomes = run_concurrently(flight, 'offer-1', fn, 3)
+    started.wait(5)
+    wait_for_waiters(flight, 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    # 完了後は次の呼び出しが新しく実行する
+    assert flight.do('offer-1', lambda: 'retry') == ('retry', False)
+
+
+def test_different_keys_run_independently():
+    flight = SingleFlight()
+    assert flight.do('a', lambda: 1) == (1, False)
+    assert flight.do('b', lambda: 2) == (2, False)
+    assert flight.stats()['leaders'] == 2
+
+
+def test_async_waiters_share_one_task_and_survive_cancellation():
+    async def scenario():
+        flight = AsyncSingleFlight()
+        release = asyncio.Event()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await release.wait()
+            return 'page'
+
+        leader = asyncio.ensure_future(flight.do('offer-1', fetch))
+        waiter = asyncio.ensure_future(flight.do('offer-1', fetch))
+        cancelled = asyncio.ensure_future(flight.do('offer-1', fetch))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(leader, waiter)
+        await asyncio.sleep(0)
+        return calls, results, cancelled.cancelled(), flight.stats()
+
+    calls, results, cancelled, stats = asyncio.run(scenario())
+    assert calls == [1]
+    assert results == [('page', False), ('page', True)]
+    assert cancelled
+    assert stats['coalesced'] == 2 and stats['in_flight'] == 0
+
+
+def test_coalesced_extraction_keeps_callers_url(monkeypatch):
+    monkeypatch.setattr(main, 'extract_flight', SingleFlight())
+    fn, started, release, calls = blocking_fn()
+
+    def extract(url, max_images=20):
+        fn()
+        return {'success': True, 'url': url, 'images': []}
+
+    monkeypatch.setattr(main, 'extract_1688_images', extract)
+    urls = ['https://detail.1688.com/offer/7.html', 'https://detail.1688.com/offer/7.html?spm=x']
+    results = {}
+    threads = [threading.Thread(target=lambda url=url: results.__setitem__(url, main.extract_coalesced(url, 5)))
+               for url in urls]
+    threads[0].start()
+    started.wait(5)
+    threads[1].start()
+    wait_for_waiters(main.extract_flight, 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert {url: result['url'] for url, result in results.items()} == {url: url for url in urls}
@@ -0,0 +1,145 @@
+"""
+画像分析のまとめ送信のテスト（chat completions API を真似たローカルサーバーを相手にする）
+"""
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip('openai')
+
+from src.extractor import Alibaba1688ImageExtractor
+from src.rate_limit import HostRateLimiter
+from src.vision_cache import CacheRun, VisionCache
+
+
+def analysis_for(image_bytes):
+    return {'suggested_folder': image_bytes.decode(), 'colors': ['赤'], 'confidence': 90}
+
+
+@pytest.fixture
+def fake_openai():
+    """画像ごとの結果を JSON 配列（1枚なら JSON オブジェクト）で返す chat completions サーバー"""
+    state = {'requests': [], 'broken_batches': False, 'prose': False}
+
+    class ChatCompletions(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            images = [
+                base64.b64decode(part['image_url']['url'].split(',', 1)[1])
+                for part in body['messages'][0]['content'] if part['type'] == 'image_url'
+            ]
+            state['requests'].append(len(images))
+            if state['prose']:
+                content = 'この画像は赤いTシャツです。'
+            elif len(images) == 1:
+                content = json.dumps(analysis_for(images[0]), ensure_ascii=False)
+            elif state['broken_batches']:
+                content = '申し訳ありませんが、複数の画像はまとめて分析できません。'
+            else:
+                content = '```json\n' + json.dumps([analysis_for(image) for image in images], ensure_ascii=False) + '\n```'
+            payload = json.dumps({
+                'id': 'chatcmpl-test',
+                'object': 'chat.completion',
+                'created': 0,
+                'model': body['model'],
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': content},
+                    'finish_reason': 'stop'
+                }]
+            }).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ChatCompletions)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    state['base_url'] = f'http://127.0.0.1:{server.server_address[1]}/v1'
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def extractor(fake_openai, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('OPENAI_API_KEY', 'sk-test')
+    monkeypatch.setenv('OPENAI_BASE_URL', fake_openai['base_url'])
+    extractor = Alibaba1688ImageExtractor(config_path='missing.yaml', demo_mode=True)
+    extractor.config['openai']['batch_size'] = 4
+    extractor.vision_cache = VisionCache(':memory:')
+    extractor.rate_limiter = HostRateLimiter({'vision': {'rate': 1000, 'burst': 100}})
+    return extractor
+
+
+@pytest.fixture
+def images(tmp_path):
+    paths = []
+    for i in range(6):
+        path = tmp_path / f'image_{i}.jpg'
+        path.write_bytes(f'image-{i}'.encode())
+        paths.append((path, None))
+    return paths
+
+
+def test_images_are_sent_in_batches(extractor, fake_openai, images):
+    run = CacheRun()
+    results = extractor.analyze_images_with_openai(images, cache_run=run)
+
+    assert fake_openai['requests'] == [4, 2]
+    assert [result['suggested_folder'] for result in results] == [f'image-{i}' for i in range(6)]
+    assert run.stats()['misses'] == 6
+
+    # 2回目はキャッシュから返り、リクエストしない
+    run = CacheRun()
+    assert extractor.analyze_images_with_openai(images, cache_run=run) == results
+    assert fake_openai['requests'] == [4, 2]
+    assert run.stats()['hits'] == 6
+
+
+def test_unreadable_batches_split_down_to_single_images(extractor, fake_openai, images):
+    fake_openai['broken_batches'] = True
+    results = extractor.analyze_images_with_openai(images[:4])
+
+    # 4枚 → 2枚ずつ → 1枚ずつ
+    assert fake_openai['requests'] == [4, 2, 1, 1, 2, 1, 1]
+    assert [result['suggested_folder'] for result in results] == [f'image-{i}' for i in range(4)]
+    assert all('error' not in result for result in results)
+
+
+def test_batch_size_one_keeps_single_image_requests(extractor, fake_openai, images):
+    extractor.config['openai']['batch_size'] = 1
+    results = extractor.analyze_images_with_openai(images[:3])
+    assert fake_openai['requests'] == [1, 1, 1]
+    assert results[2]['raw_response'] == json.dumps(analysis_for(b'image-2'), ensure_ascii=False)
+
+
+def test_unparsed_replies_are_not_cached(extractor, fake_openai, images):
+    extractor.config['openai']['batch_size'] = 1
+    fake_openai['prose'] = True
+    [result] = extractor.analyze_images_with_openai(images[:1])
+    assert result['suggested_folder'] == 'uncategorized'
+
+    # 次回は分析し直し、読める応答が返ればそれを使う
+    fake_openai['prose'] = False
+    [result] = extractor.analyze_images_with_openai(images[:1])
+    assert result['suggested_folder'] == 'image-0'
+    assert fake_openai['requests'] == [1, 1]
+
+
+def test_batched_results_have_single_image_shape(extractor, fake_openai, images):
+    batched = extractor.analyze_images_with_openai(images[:2])
+    assert fake_openai['requests'] == [2]
+
+    extractor.config['openai']['batch_size'] = 1
+    extractor.vision_cache = VisionCache(':memory:')
+    single = extractor.analyze_images_with_openai(images[:2])
+    assert batched == single
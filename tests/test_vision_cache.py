@@ -0,0 +1,101 @@
+"""
+画像分析結果のキャッシュのテスト（キーの作り方・サイズ上限での削除・再起動後の再利用）
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from src.extractor import Alibaba1688ImageExtractor
+from src.vision_cache import CacheRun, VisionCache, cache_key
+
+ROOT = Path(__file__).resolve().parent.parent
+ANALYSIS = {'category': 'Tシャツ', 'colors': ['赤'], 'suggested_folder': '赤系_Tシャツ', 'confidence': 92}
+
+
+def entry_size(analysis):
+    return len(json.dumps(analysis, ensure_ascii=False).encode('utf-8'))
+
+
+def test_key_covers_image_prompt_model_and_temperature():
+    key = cache_key('abc', 'prompt', 'gpt-4o', 0.1)
+    assert cache_key('abc', 'prompt', 'gpt-4o', 0.1) == key
+    assert len({
+        key,
+        cache_key('abd', 'prompt', 'gpt-4o', 0.1),
+        cache_key('abc', 'prompt 2', 'gpt-4o', 0.1),
+        cache_key('abc', 'prompt', 'gpt-4o-mini', 0.1),
+        cache_key('abc', 'prompt', 'gpt-4o', 0.2),
+        cache_key('abc', 'prompt', 'gpt-4o', 0.1, {'max_edge': 512, 'image_format': 'JPEG', 'quality': 80}),
+    }) == 6
+    # 0.1 と "0.1"（YAML の書き方の違い）は同じキー
+    assert cache_key('abc', 'prompt', 'gpt-4o', '0.1') == key
+
+
+def test_extractor_key_follows_preprocessing_settings(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    extractor = Alibaba1688ImageExtractor(config_path='missing.yaml', demo_mode=True)
+    key = extractor._analysis_cache_key('abc', 'prompt')
+
+    # 縮小後の画像が変わる設定ではキーも変わる（jpg と JPEG は同じ形式）
+    extractor.config['openai']['image_format'] = 'jpg'
+    assert extractor._analysis_cache_key('abc', 'prompt') == key
+    extractor.config['openai']['max_edge'] = 512
+    assert extractor._analysis_cache_key('abc', 'prompt') != key
+
+
+def test_hits_and_misses_are_counted_per_run():
+    cache = VisionCache(':memory:')
+    run = CacheRun()
+    assert cache.get('k', run) is None
+    cache.put('k', 'abc', 'gpt-4o', ANALYSIS)
+    assert cache.get('k', run) == ANALYSIS
+
+    assert run.stats() == {'hits': 1, 'misses': 1, 'hit_ratio': 0.5}
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes'], stats['hits'], stats['misses']) == (1, entry_size(ANALYSIS), 1, 1)
+
+
+def test_least_recently_used_entries_are_evicted():
+    size = entry_size(ANALYSIS)
+    cache = VisionCache(':memory:', max_bytes=size * 3)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, key, 'gpt-4o', ANALYSIS)
+        time.sleep(0.01)
+    cache.get('a')
+    time.sleep(0.01)
+    cache.put('d', 'd', 'gpt-4o', ANALYSIS)
+
+    # 上限の 9 割まで減らす（最後に使われたのが古い b・c から）
+    assert cache.get('b') is None and cache.get('c') is None
+    assert cache.get('a') == ANALYSIS and cache.get('d') == ANALYSIS
+    assert cache.stats()['evictions'] == 2 and cache.stats()['bytes'] == size * 2
+
+
+def test_oversized_analysis_is_not_stored():
+    cache = VisionCache(':memory:', max_bytes=10)
+    cache.put('k', 'abc', 'gpt-4o', ANALYSIS)
+    assert cache.get('k') is None and cache.stats()['bytes'] == 0
+
+
+def test_cache_survives_restart(tmp_path):
+    path = str(tmp_path / 'vision_cache.db')
+    cache = VisionCache(path)
+    cache.put('k', 'abc', 'gpt-4o', ANALYSIS)
+    cache.put('k', 'abc', 'gpt-4o', dict(ANALYSIS, confidence=95))
+
+    reopened = VisionCache(path)
+    assert reopened.get('k') == dict(ANALYSIS, confidence=95)
+    assert reopened.stats()['entries'] == 1
+    assert reopened.stats()['bytes'] == entry_size(dict(ANALYSIS, confidence=95))
+
+
+def test_stats_endpoint_does_not_create_cache(tmp_path):
+    # /stats を呼んだだけでは vision_cache.db を作らない
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    script = ('import main; stats = main.app.test_client().get("/stats").get_json(); '
+              'assert stats["vision_cache"] is None, stats')
+    subprocess.run([sys.executable, '-c', script], cwd=tmp_path, env=env, check=True, capture_output=True)
+    assert not (tmp_path / 'vision_cache.db').exists()